@@ -1,52 +1,270 @@
-from django.contrib import admin
+from datetime import date
+from django import forms
+from django.contrib import admin, messages
+from django.template.response import TemplateResponse
+from django.utils.translation import gettext_lazy as _
 from . import models
+from . pagination import EstimatedCountPaginator
+from . exports import export_queryset, export_response
+from . reporting import first_of_month
+from . stock import InsufficientStock, check_reopening
+
+
+class OrderLineForm(forms.ModelForm):
+    """Checks the stock of newly chosen pearls, and of a larger quantity, up front; the reservation on save still has the final say."""
+
+    def clean(self):
+        cleaned_data = super().clean()
+        quantity = cleaned_data.get('quantity') or 0
+        current = set(self.instance.pearl.values_list('pk', flat=True)) if self.instance.pk else set()
+        # the pearls already on the line hold the quantity it was saved with
+        held = self.instance.loaded_value('quantity') or 0
+        for pearl in cleaned_data.get('pearl') or ():
+            needed = quantity - held if pearl.pk in current else quantity
+            if pearl.quantity is not None and pearl.quantity < needed:
+                self.add_error('pearl', _('Only %(quantity)s of %(pearl)s left in stock.') % {'quantity': pearl.quantity, 'pearl': pearl})
+        return cleaned_data
+
+
+class OrderForm(forms.ModelForm):
+    """Checks that a cancelled order moved back to an open status can take its pearls again."""
+
+    def clean(self):
+        cleaned_data = super().clean()
+        status = cleaned_data.get('status')
+        if self.instance.pk and self.instance.loaded_value('status') == 'c' and status and status != 'c':
+            try:
+                check_reopening([self.instance.pk])
+            except InsufficientStock as error:
+                self.add_error('status', _('Not enough %(pearl)s left in stock to reopen the order.') % {'pearl': error.item})
+        return cleaned_data
 
 
 class OrderLineInline(admin.StackedInline):
     model = models.OrderLine
+    form = OrderLineForm
     extra = 0
     readonly_fields = ('unique_id', )
     can_delete = False
+    autocomplete_fields = ('product', 'metal_type', 'pearl')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product__jewellery_type')
 
 
 class OrderLineAdmin(admin.ModelAdmin):
+    form = OrderLineForm
     list_display = ('unique_id','order', 'product', 'quantity','hand', 'finger', 'ring_size', 'display_metal_type', 'weight')
     ordering = ('order', 'unique_id')
-    list_filter = ('order', 'product',)
+    list_filter = ('order__status', 'hand', 'finger')
+    search_fields = ('=unique_id', 'product__name', 'order__customer__user__username')
     readonly_fields = ('unique_id',)
     list_editable = ('hand', 'finger', 'ring_size', 'weight')
+    list_select_related = ('order__customer__user', 'product__jewellery_type')
+    autocomplete_fields = ('order', 'product', 'metal_type', 'pearl')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     fieldsets = (
         ('General', {'fields': ('unique_id', 'order', 'product', 'quantity')}),
         ('Specifications', {'fields': ('hand', 'finger', 'ring_size', 'measurement', 'metal_type', 'pearl', 'weight', 'photo', 'specification', 'engraving', 'engraving_file')}),
     )
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('metal_type')
+
+    def changelist_view(self, request, extra_context=None):
+        with models.defer_order_totals():
+            return super().changelist_view(request, extra_context)
+
+
+class OverdueListFilter(admin.SimpleListFilter):
+    title = _('overdue')
+    parameter_name = 'overdue'
+
+    def lookups(self, request, model_admin):
+        return (('1', _('Yes')), ('0', _('No')))
+
+    def queryset(self, request, queryset):
+        if self.value() == '1':
+            return queryset.overdue()
+        if self.value() == '0':
+            return queryset.exclude(queryset.overdue_condition())
+        return queryset
+
 
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ('customer', 'total', 'status', 'due_date')
-    list_filter = ('status', 'due_date')
+    form = OrderForm
+    list_display = ('customer', 'total', 'status', 'due_date', 'overdue')
+    list_filter = (OverdueListFilter, 'status', 'due_date')
+    search_fields = ('=id', 'customer__user__username', 'customer__user__email')
     readonly_fields = ('is_overdue', 'date', 'is_overdue' )
     inlines = (OrderLineInline, )
     list_editable = ('status', 'due_date')
+    list_select_related = ('customer__user',)
+    autocomplete_fields = ('customer',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ('mark_done', 'export_lines_csv', 'export_lines_xlsx')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_overdue()
+
+    def get_changelist_form(self, request, **kwargs):
+        # the list_editable status gets the same stock check as the change form
+        kwargs.setdefault('form', OrderForm)
+        return super().get_changelist_form(request, **kwargs)
+
+    @admin.action(description=_('Mark selected orders as done'), permissions=('change',))
+    def mark_done(self, request, queryset):
+        # OrderQuerySet.update() queues the ready for pick up emails and reopens cancelled orders in the same transaction
+        try:
+            updated = queryset.update(status='d')
+        except InsufficientStock as error:
+            self.message_user(request, _('No orders were marked as done: not enough %(pearl)s left in stock to reopen a cancelled order.') % {'pearl': error.item}, messages.ERROR)
+            return
+        self.message_user(request, _('%(count)d orders marked as done.') % {'count': updated})
+
+    @admin.action(description=_('Export lines of selected orders as CSV'))
+    def export_lines_csv(self, request, queryset):
+        return export_response(export_queryset(orders=queryset), 'csv')
+
+    @admin.action(description=_('Export lines of selected orders as XLSX'))
+    def export_lines_xlsx(self, request, queryset):
+        return export_response(export_queryset(orders=queryset), 'xlsx')
+
+    @admin.display(description=_('overdue'), boolean=True, ordering='overdue')
+    def overdue(self, obj):
+        return obj.overdue
+
+    def save_related(self, request, form, formsets, change):
+        with models.defer_order_totals():
+            super().save_related(request, form, formsets, change)
 
 
 class ProductAdmin(admin.ModelAdmin):
     list_display = ('name', 'jewellery_type', 'display_category', 'price')
+    search_fields = ('name',)
+    list_select_related = ('jewellery_type',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('category')
 
 
 class PearlAdmin(admin.ModelAdmin):
-    list_display = ('parcel', 'shape', 'color', 'size', 'type_name',)
+    list_display = ('parcel', 'shape', 'color', 'size', 'type_name', 'quantity')
     list_filter = ('shape', 'color')
+    search_fields = ('parcel', 'type_name', 'color')
+
+
+class MetalTypeAdmin(admin.ModelAdmin):
+    search_fields = ('alloy',)
+
+
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('line', 'pearl', 'quantity', 'created_at', 'released_at')
+    list_filter = (('released_at', admin.EmptyFieldListFilter),)
+    list_select_related = ('line__product__jewellery_type', 'pearl')
+
+    # stock moves only through jewellery.stock, editing a reservation here would not move it
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 
 class ReviewProductAdmin(admin.ModelAdmin):
     list_display = ('product', 'customer', 'created_at')
+    list_select_related = ('product__jewellery_type', 'customer')
+    autocomplete_fields = ('product', 'customer')
 
 class CustomerAdmin(admin.ModelAdmin):
     list_display = ('user', 'phone')
+    search_fields = ('user__username', 'user__email', 'phone')
+    list_select_related = ('user',)
+
+
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ('file_name', 'model_name', 'status', 'attempts', 'run_after', 'last_error')
+    list_filter = ('status', 'model_name')
+
+
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ('recipient', 'subject', 'status', 'attempts', 'run_after', 'sent_at', 'last_error')
+    list_filter = ('status',)
+    search_fields = ('recipient', 'dedup_key')
+    readonly_fields = ('dedup_key', 'attempts', 'sent_at', 'last_error', 'created_at', 'updated_at')
+
+
+class SalesSummaryAdmin(admin.ModelAdmin):
+    """A read-only dashboard; it reads the summaries alone, never the order lines."""
+    change_list_template = 'admin/jewellery/salessummary/dashboard.html'
+    DEFAULT_MONTHS = 12
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def get_months(self, request):
+        try:
+            count = int(request.GET.get('months', self.DEFAULT_MONTHS))
+        except ValueError:
+            count = self.DEFAULT_MONTHS
+        count = min(max(count, 1), 120)
+        month = first_of_month(date.today())
+        months = [month]
+        while len(months) < count:
+            month = first_of_month(date.fromordinal(month.toordinal() - 1))
+            months.append(month)
+        return months[::-1]
+
+    def dashboard_tables(self, months):
+        statuses = dict(models.Order.STATUS_CHOICES)
+        tables = {dimension: {} for dimension, label in models.SalesSummary.DIMENSION_CHOICES}
+        for summary in models.SalesSummary.objects.filter(month__gte=months[0]).order_by():
+            label = statuses.get(summary.key, summary.key) if summary.dimension == 'status' else summary.label or summary.key
+            row = tables[summary.dimension].setdefault(summary.key, {'label': label, 'months': {}, 'revenue': 0, 'quantity': 0})
+            row['months'][summary.month] = summary.revenue
+            row['revenue'] += summary.revenue
+            row['quantity'] += summary.quantity
+        return [
+            {
+                'title': title,
+                'rows': [
+                    {**row, 'months': [row['months'].get(month, 0) for month in months]}
+                    for row in sorted(tables[dimension].values(), key=lambda row: row['revenue'], reverse=True)
+                ],
+            }
+            for dimension, title in models.SalesSummary.DIMENSION_CHOICES
+        ]
+
+    def changelist_view(self, request, extra_context=None):
+        if not self.has_view_or_change_permission(request):
+            return super().changelist_view(request, extra_context)
+        months = self.get_months(request)
+        context = {
+            **self.admin_site.each_context(request),
+            'title': _('Sales'),
+            'opts': self.model._meta,
+            'months': months,
+            'tables': self.dashboard_tables(months),
+            **(extra_context or {}),
+        }
+        return TemplateResponse(request, self.change_list_template, context)
 
 
-admin.site.register(models.Pearl)
-admin.site.register(models.MetalType)
+admin.site.register(models.Pearl, PearlAdmin)
+admin.site.register(models.MetalType, MetalTypeAdmin)
 admin.site.register(models.JewelleryType)
 admin.site.register(models.Category)
 admin.site.register(models.Product, ProductAdmin)
@@ -54,3 +272,7 @@ admin.site.register(models.Customer, CustomerAdmin)
 admin.site.register(models.Order, OrderAdmin)
 admin.site.register(models.OrderLine, OrderLineAdmin)
 admin.site.register(models.ReviewProduct, ReviewProductAdmin)
+admin.site.register(models.ImageJob, ImageJobAdmin)
+admin.site.register(models.EmailOutbox, EmailOutboxAdmin)
+admin.site.register(models.SalesSummary, SalesSummaryAdmin)
+admin.site.register(models.StockReservation, StockReservationAdmin)
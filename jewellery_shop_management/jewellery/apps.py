@@ -3,4 +3,8 @@ from django.apps import AppConfig
 
 class JewelleryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'jewellery'
\ No newline at end of file
+    name = 'jewellery'
+
+    def ready(self):
+        from . signals import invalidate_category_navigation
+        from . checks import check_shared_cache
@@ -0,0 +1,132 @@
+"""Async versions of the catalogue and order views, routed instead of ``views`` when ASYNC_VIEWS is set.
+
+They reuse the synchronous views' querysets and context. The ORM and cache
+calls still run one after another on Django's single thread for sync code
+(thread-sensitive sync_to_async), so a page makes no fewer round trips than
+its WSGI twin; what it saves is a worker thread per connection while the
+request waits. Templates still render in a worker thread, as Django does
+for any TemplateResponse.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import Http404
+from django.template.response import TemplateResponse
+from urllib.parse import urlencode
+from . import views
+from . caching import get_version
+from . imaging import aattach_renditions
+from . models import Category, Order
+from . navigation import aget_nav_categories
+from . pagination import KeysetPaginator
+from . reviews import reviews_cache_tag
+
+
+async def alist(queryset):
+    return [obj async for obj in queryset]
+
+
+async def index(request):
+    return TemplateResponse(request, 'jewellery/index.html', {'categories': await aget_nav_categories()})
+
+
+class AsyncLoginRequiredMixin(LoginRequiredMixin):
+
+    async def dispatch(self, request, *args, **kwargs):
+        # request.user is loaded from the session lazily, which must not happen on the event loop
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return self.handle_no_permission()
+        return await super(LoginRequiredMixin, self).dispatch(request, *args, **kwargs)
+
+
+class ProductListView(views.ProductListView):
+
+    async def get(self, request, *args, **kwargs):
+        response = await self.aget_conditional_response(request)
+        if response is not None:
+            return self.add_validators(response)
+        # get_queryset may check for the search table the first time
+        queryset = await sync_to_async(self.get_queryset)()
+        filters = self.get_filters()
+        paginator = KeysetPaginator(queryset, self.get_keyset_ordering(), self.paginate_by, filters)
+        category_id = filters.get('category_id')
+        page = await paginator.apage(request.GET.get('cursor'))
+        count = await paginator.aapproximate_count()
+        categories = await aget_nav_categories()
+        category = await Category.objects.filter(id=category_id).afirst() if category_id else None
+        if category_id and category is None:
+            raise Http404
+        page.count = count
+        await aattach_renditions(page.object_list, 'image')
+        self.object_list = page.object_list
+        return self.add_validators(self.render_to_response({
+            'view': self,
+            'paginator': paginator,
+            'page_obj': page,
+            'is_paginated': page.has_next or page.has_previous,
+            'object_list': page.object_list,
+            'product_list': page.object_list,
+            'search': filters.get('search', ''),
+            'filter_query': urlencode(filters),
+            'category': category,
+            'categories': categories,
+        }))
+
+
+class ProductDetailView(views.ProductDetailView):
+
+    def get_reviews_version(self):
+        return self.reviews_version
+
+    async def get(self, request, *args, **kwargs):
+        response = await self.aget_conditional_response(request)
+        if response is not None:
+            return self.add_validators(response)
+        pk = self.kwargs['pk']
+        try:
+            self.object = await self.get_queryset().aget(pk=pk)
+        except self.model.DoesNotExist:
+            raise Http404
+        categories = await aget_nav_categories()
+        self.reviews_version = await sync_to_async(get_version)(reviews_cache_tag(pk))
+        await aattach_renditions([self.object], 'image')
+        context = self.get_context_data(object=self.object)
+        context['categories'] = categories
+        return self.add_validators(self.render_to_response(context))
+
+    async def post(self, request, *args, **kwargs):
+        # the review form, throttle and messages stay synchronous
+        return await sync_to_async(super().post)(request, *args, **kwargs)
+
+
+class OrderListView(AsyncLoginRequiredMixin, views.OrderListView):
+
+    async def get(self, request, *args, **kwargs):
+        response = await self.aget_conditional_response(request)
+        if response is not None:
+            return self.add_validators(response)
+        orders = Order.objects.filter(customer__user_id=request.user.pk).with_overdue().order_by('date')
+        self.object_list = await alist(orders)
+        categories = await aget_nav_categories()
+        return self.add_validators(self.render_to_response({
+            'view': self,
+            'object_list': self.object_list,
+            'order_list': self.object_list,
+            'categories': categories,
+        }))
+
+
+class OrderDetailView(AsyncLoginRequiredMixin, views.OrderDetailView):
+
+    async def get(self, request, *args, **kwargs):
+        response = await self.aget_conditional_response(request)
+        if response is not None:
+            return self.add_validators(response)
+        try:
+            # aget() runs get() in a thread, prefetches included
+            self.object = await self.get_queryset().aget(pk=self.kwargs['pk'])
+        except self.model.DoesNotExist:
+            raise Http404
+        categories = await aget_nav_categories()
+        context = self.get_context_data(object=self.object)
+        context['categories'] = categories
+        return self.add_validators(self.render_to_response(context))
@@ -0,0 +1,28 @@
+import time
+from django.core.cache import cache
+
+
+def version_key(tag):
+    return f"jewellery:version:{tag}"
+
+
+def get_versions(*tags):
+    """Current version of each tag; cache keys built from them go stale when a tag is bumped."""
+    keys = {version_key(tag): tag for tag in tags}
+    found = cache.get_many(keys)
+    versions = {}
+    for key, tag in keys.items():
+        if key not in found:
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+        versions[tag] = found[key]
+    return versions
+
+
+def get_version(tag):
+    return get_versions(tag)[tag]
+
+
+def bump_versions(*tags):
+    # a fresh timestamp rather than incr(), so an evicted version never repeats an older value
+    cache.set_many({version_key(tag): time.time_ns() for tag in tags}, None)
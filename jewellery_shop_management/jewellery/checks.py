@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+PER_PROCESS_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    aliases = {'default', getattr(settings, 'THROTTLE_CACHE', 'default')}
+    return [
+        Warning(
+            f"The {alias!r} cache is per process: with several workers cached pages go stale and the rate limits multiply.",
+            hint="Set DJANGO_REDIS_URL or DJANGO_MEMCACHED_LOCATION.",
+            id='jewellery.W001',
+        )
+        for alias in sorted(aliases) if settings.CACHES.get(alias, {}).get('BACKEND') in PER_PROCESS_BACKENDS
+    ]
@@ -0,0 +1,6 @@
+from django.utils.functional import SimpleLazyObject
+from . navigation import get_nav_categories
+
+
+def categories(request):
+    return {"categories": SimpleLazyObject(get_nav_categories)}
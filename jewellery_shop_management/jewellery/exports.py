@@ -0,0 +1,216 @@
+"""Order line exports that stream: rows come from ``iterator(chunk_size=...)`` and leave as they are written.
+
+The metal types and pearls are prefetched for each chunk, so memory stays
+flat however many lines are exported.
+"""
+import csv
+import numbers
+import re
+import zipfile
+from xml.sax.saxutils import escape
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from . models import Order, OrderLine
+
+
+CHUNK_SIZE = 2000
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+}
+# characters XML 1.0 cannot carry at all
+XML_INVALID = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+# leading characters that make a spreadsheet read a CSV cell as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def export_queryset(statuses=None, date_from=None, date_to=None, orders=None):
+    lines = OrderLine.objects.select_related('order__customer__user', 'product__jewellery_type') \
+        .prefetch_related('metal_type', 'pearl').order_by('order_id', 'id')
+    if orders is not None:
+        lines = lines.filter(order__in=orders.values('pk'))
+    if statuses:
+        lines = lines.filter(order__status__in=statuses)
+    if date_from:
+        lines = lines.filter(order__date__gte=date_from)
+    if date_to:
+        lines = lines.filter(order__date__lte=date_to)
+    return lines
+
+
+def columns():
+    """Headers and accessors; choice labels are translated once here, get_FOO_display() per line is slow."""
+    status = {code: str(label) for code, label in Order.STATUS_CHOICES}
+    hand = {code: str(label) for code, label in OrderLine.HAND_CHOICES}
+    finger = {code: str(label) for code, label in OrderLine.FINGER_CHOICES}
+    return (
+        (_("order ID"), lambda line: line.order_id),
+        (_("order date"), lambda line: line.order.date),
+        (_("due date"), lambda line: line.order.due_date),
+        (_("status"), lambda line: status.get(line.order.status, line.order.status)),
+        (_("customer"), lambda line: line.order.customer.user.get_username()),
+        (_("phone"), lambda line: line.order.customer.phone),
+        (_("product"), lambda line: line.product.name),
+        (_("jewellery type"), lambda line: line.product.jewellery_type),
+        (_("quantity"), lambda line: line.quantity),
+        (_("price"), lambda line: line.price),
+        (_("total"), lambda line: line.total),
+        (_("ring_size"), lambda line: line.ring_size),
+        (_("hand"), lambda line: hand.get(line.hand, line.hand)),
+        (_("finger"), lambda line: finger.get(line.finger, line.finger)),
+        (_("measurement"), lambda line: line.measurement),
+        (_("metal type(s)"), lambda line: line.display_metal_type()),
+        (_("pearl(s)"), lambda line: line.display_pearl()),
+        (_("weight"), lambda line: line.weight),
+        (_("certificate"), lambda line: line.certificate),
+        (_("restoration date"), lambda line: line.restoration),
+        (_("engraving text"), lambda line: line.engraving),
+        (_("specification"), lambda line: line.specification),
+    )
+
+
+def headers(export_columns):
+    return [str(header) for header, accessor in export_columns]
+
+
+def rows(lines, export_columns, chunk_size=CHUNK_SIZE):
+    accessors = [accessor for header, accessor in export_columns]
+    for line in lines.iterator(chunk_size=chunk_size):
+        yield [accessor(line) for accessor in accessors]
+
+
+class Echo:
+    """Hands back whatever csv.writer writes, so each row can be yielded as it is formatted."""
+
+    def write(self, value):
+        return value
+
+
+def csv_cell(value):
+    """Text starting like a formula gets a leading quote, so customer input cannot run in the spreadsheet."""
+    if value is None:
+        return ''
+    if isinstance(value, numbers.Number):
+        return value
+    text = str(value)
+    return f"'{text}" if text.startswith(FORMULA_PREFIXES) else text
+
+
+def stream_csv(lines, chunk_size=CHUNK_SIZE):
+    writer = csv.writer(Echo())
+    export_columns = columns()
+    # the byte order mark makes Excel read the file as UTF-8
+    yield '\ufeff' + writer.writerow(headers(export_columns))
+    for row in rows(lines, export_columns, chunk_size):
+        yield writer.writerow([csv_cell(value) for value in row])
+
+
+class ZipStream:
+    """A write-only file for ZipFile; without seek() it writes data descriptors and never goes back."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def column_name(index):
+    name = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        name = chr(65 + remainder) + name
+    return name
+
+
+def xlsx_cell(reference, value):
+    if value is None or value == '':
+        return ''
+    if isinstance(value, numbers.Number) and not isinstance(value, bool):
+        return f'<c r="{reference}"><v>{value}</v></c>'
+    text = escape(XML_INVALID.sub('', str(value)))
+    return f'<c r="{reference}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def xlsx_row(number, values):
+    cells = ''.join(xlsx_cell(f"{column_name(index)}{number}", value) for index, value in enumerate(values))
+    return f'<row r="{number}">{cells}</row>'
+
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Order lines" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def stream_xlsx(lines, chunk_size=CHUNK_SIZE):
+    """A minimal SpreadsheetML workbook with inline strings, zipped on the fly."""
+    stream = ZipStream()
+    export_columns = columns()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS.items():
+            archive.writestr(name, content)
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(xlsx_row(1, headers(export_columns)).encode())
+            for number, row in enumerate(rows(lines, export_columns, chunk_size), start=2):
+                sheet.write(xlsx_row(number, row).encode())
+                if number % chunk_size == 0:
+                    yield stream.drain()
+            sheet.write(b'</sheetData></worksheet>')
+    yield stream.drain()
+
+
+STREAMS = {'csv': stream_csv, 'xlsx': stream_xlsx}
+
+
+def export_response(lines, export_format, chunk_size=CHUNK_SIZE):
+    content_type, extension = FORMATS[export_format]
+    response = StreamingHttpResponse(STREAMS[export_format](lines, chunk_size), content_type=content_type)
+    filename = f"order-lines-{timezone.localdate():%Y-%m-%d}.{extension}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
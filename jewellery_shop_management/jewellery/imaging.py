@@ -0,0 +1,156 @@
+import io
+import os
+import tempfile
+from datetime import timedelta
+from PIL import Image
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.db.models import Q
+from django.utils import timezone
+from . models import ImageJob, ImageRendition
+
+
+MAX_SIZE = (500, 500)
+RENDITION_WIDTHS = (160, 320, 500)
+RENDITION_FORMATS = {'jpeg': 'JPEG', 'webp': 'WEBP'}
+RENDITION_QUALITY = 80
+RENDITION_FIELDS = {
+    ('jewellery', 'product', 'image'),
+    ('jewellery', 'orderline', 'photo'),
+}
+MAX_ATTEMPTS = 5
+RETRY_DELAY = timedelta(seconds=30)
+# a job left running this long belonged to a worker that died and is picked up again
+RUNNING_TIMEOUT = timedelta(minutes=10)
+
+
+def resize_in_place(path, size=MAX_SIZE):
+    with Image.open(path) as image:
+        if image.width <= size[0] and image.height <= size[1]:
+            return False
+        image.thumbnail(size)
+        directory, name = os.path.split(path)
+        handle, temporary = tempfile.mkstemp(dir=directory, suffix=os.path.splitext(name)[1])
+        os.close(handle)
+        try:
+            image.save(temporary, format=image.format)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+    return True
+
+
+def rendition_name(source, width, extension):
+    stem = os.path.splitext(source)[0]
+    return f"{ImageRendition.file.field.upload_to}/{stem}-{width}w.{extension}"
+
+
+def rendition_widths(width):
+    return sorted({size for size in RENDITION_WIDTHS if size < width} | {min(width, RENDITION_WIDTHS[-1])})
+
+
+def create_renditions(fieldfile):
+    """Writes the fixed set of widths in every format next to the source and records them."""
+    storage = fieldfile.storage
+    renditions = []
+    with Image.open(fieldfile.path) as image:
+        image.load()
+        for width in rendition_widths(image.width):
+            resized = image.copy()
+            resized.thumbnail((width, image.height))
+            for extension, pil_format in RENDITION_FORMATS.items():
+                if pil_format == 'JPEG' and resized.mode not in ('RGB', 'L'):
+                    encoded = resized.convert('RGB')
+                else:
+                    encoded = resized
+                buffer = io.BytesIO()
+                encoded.save(buffer, format=pil_format, quality=RENDITION_QUALITY, optimize=True)
+                name = rendition_name(fieldfile.name, width, extension)
+                if storage.exists(name):
+                    storage.delete(name)
+                name = storage.save(name, ContentFile(buffer.getvalue()))
+                rendition, created = ImageRendition.objects.update_or_create(
+                    source=fieldfile.name, format=extension, width=resized.width,
+                    defaults={'height': resized.height, 'file': name},
+                )
+                renditions.append(rendition)
+    return renditions
+
+
+def process_job(job):
+    """Produces the derivatives for one job; safe to run again for the same file."""
+    model = apps.get_model(job.app_label, job.model_name)
+    instance = model._default_manager.filter(pk=job.object_id).first()
+    if instance is None:
+        return False
+    fieldfile = getattr(instance, job.field_name)
+    if fieldfile.name != job.file_name:
+        # the file was replaced since the job was queued, its own job handles it
+        return False
+    resized = resize_in_place(fieldfile.path)
+    if (job.app_label, job.model_name, job.field_name) in RENDITION_FIELDS:
+        create_renditions(fieldfile)
+    return resized
+
+
+def rendition_queryset(fieldfiles):
+    return ImageRendition.objects.filter(source__in=[fieldfile.name for fieldfile in fieldfiles if fieldfile])
+
+
+def assign_renditions(fieldfiles, renditions):
+    by_source = {}
+    for rendition in renditions:
+        by_source.setdefault(rendition.source, []).append(rendition)
+    for fieldfile in fieldfiles:
+        fieldfile.renditions = by_source.get(fieldfile.name, [])
+
+
+def attach_renditions(objects, field_name):
+    """Loads the renditions of a page of objects in one query for the ``responsive_image`` tag."""
+    fieldfiles = [getattr(obj, field_name) for obj in objects]
+    assign_renditions(fieldfiles, rendition_queryset(fieldfiles))
+    return objects
+
+
+async def aattach_renditions(objects, field_name):
+    fieldfiles = [getattr(obj, field_name) for obj in objects]
+    assign_renditions(fieldfiles, [rendition async for rendition in rendition_queryset(fieldfiles)])
+    return objects
+
+
+def claim_jobs(limit):
+    now = timezone.now()
+    candidates = ImageJob.objects.filter(
+        Q(status='q', run_after__lte=now) | Q(status='r', updated_at__lt=now - RUNNING_TIMEOUT)
+    ).values_list('id', 'status', 'updated_at')[:limit]
+    claimed = []
+    for job_id, status, updated_at in candidates:
+        # the conditional update lets several workers share the queue without claiming a job twice
+        claim = ImageJob.objects.filter(id=job_id, status=status, updated_at=updated_at)
+        if claim.update(status='r', updated_at=timezone.now()):
+            claimed.append(job_id)
+    return ImageJob.objects.filter(id__in=claimed)
+
+
+def run_jobs(limit=50):
+    processed = retried = failed = 0
+    for job in claim_jobs(limit):
+        job.attempts += 1
+        try:
+            process_job(job)
+        except Exception as error:
+            job.last_error = f"{error.__class__.__name__}: {error}"
+            if job.attempts >= MAX_ATTEMPTS:
+                job.status = 'f'
+                failed += 1
+            else:
+                job.status = 'q'
+                retried += 1
+                job.run_after = timezone.now() + RETRY_DELAY * 2 ** (job.attempts - 1)
+        else:
+            job.status = 'd'
+            job.last_error = ''
+            processed += 1
+        job.save(update_fields=['status', 'attempts', 'run_after', 'last_error', 'updated_at'])
+    return processed, retried, failed
@@ -0,0 +1,33 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from jewellery.imaging import RENDITION_FIELDS, create_renditions
+from jewellery.models import ImageRendition
+
+
+class Command(BaseCommand):
+    help = "Create responsive image renditions for existing product images and order photos"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Regenerate renditions that already exist")
+
+    def handle(self, *args, **options):
+        created = skipped = failed = 0
+        for app_label, model_name, field_name in sorted(RENDITION_FIELDS):
+            model = apps.get_model(app_label, model_name)
+            queryset = model._default_manager.exclude(**{field_name: ''}).exclude(**{f"{field_name}__isnull": True})
+            done = set()
+            if not options['force']:
+                done = set(ImageRendition.objects.values_list('source', flat=True).distinct())
+            for instance in queryset.only('pk', field_name).iterator(chunk_size=500):
+                fieldfile = getattr(instance, field_name)
+                if fieldfile.name in done:
+                    skipped += 1
+                    continue
+                try:
+                    created += len(create_renditions(fieldfile))
+                except OSError as error:
+                    failed += 1
+                    self.stderr.write(f"{model_name} {instance.pk} {fieldfile.name}: {error}")
+        self.stdout.write(self.style.SUCCESS(
+            f"created {created} renditions, skipped {skipped} images, failed {failed}"
+        ))
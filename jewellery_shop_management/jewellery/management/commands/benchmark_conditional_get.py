@@ -0,0 +1,67 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from jewellery.benchmarking import summarize, format_summary
+from jewellery.management.commands.benchmark_views import VIEWS, build_targets
+
+
+def response_bytes(response):
+    headers = ''.join(f"{name}: {value}\r\n" for name, value in response.items())
+    return len(headers) + len(response.content)
+
+
+class Command(BaseCommand):
+    help = "Compare full page views with revalidations carrying If-None-Match: bytes, CPU time and queries per request"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100, help="Requests per view and mode")
+        parser.add_argument('--view', action='append', dest='views', choices=VIEWS)
+        parser.add_argument('--anonymous', action='store_true', help="Request the catalogue views without logging in")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        views = options['views'] or list(VIEWS)
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            targets, user = build_targets(options['seed'])
+            client = Client()
+            if options['anonymous']:
+                views = [name for name in views if not name.startswith('order')]
+            else:
+                client.force_login(user)
+            for name in views:
+                url = targets[name]()
+                etag = client.get(url).get('ETag')
+                full = self.run(client, url, options['requests'], {})
+                revalidated = self.run(client, url, options['requests'], {'HTTP_IF_NONE_MATCH': etag} if etag else {})
+                self.stdout.write(f"{name} {url}")
+                for mode, result in (('full', full), ('revalidated', revalidated)):
+                    self.stdout.write(
+                        f"  {format_summary(mode, summarize(result['latency']))} cpu={result['cpu'] * 1000:.2f}ms "
+                        f"bytes={result['bytes']:.0f} queries={result['queries']:.1f} statuses={sorted(result['statuses'])}"
+                    )
+                if full['bytes'] and full['cpu']:
+                    self.stdout.write(self.style.SUCCESS(
+                        f"  saved {(1 - revalidated['bytes'] / full['bytes']) * 100:.1f}% bytes, "
+                        f"{(1 - revalidated['cpu'] / full['cpu']) * 100:.1f}% CPU per request"
+                    ))
+
+    def run(self, client, url, requests, headers):
+        latency, transferred, queries, statuses = [], 0, 0, set()
+        cpu_started = time.process_time()
+        for _ in range(requests):
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = client.get(url, **headers)
+                latency.append(time.perf_counter() - started)
+            transferred += response_bytes(response)
+            queries += len(context.captured_queries)
+            statuses.add(response.status_code)
+        return {
+            'latency': latency,
+            'cpu': (time.process_time() - cpu_started) / requests,
+            'bytes': transferred / requests,
+            'queries': queries / requests,
+            'statuses': statuses,
+        }
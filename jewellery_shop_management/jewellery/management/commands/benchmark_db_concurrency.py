@@ -0,0 +1,117 @@
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction, OperationalError
+from django.db.models import F
+from django.test import override_settings
+from jewellery.benchmarking import summarize, format_summary
+from jewellery.models import Order, OrderLine, Product
+
+
+def read(rng, product_ids):
+    list(Product.objects.select_related('jewellery_type').filter(pk__gte=rng.choice(product_ids)).order_by('pk')[:21])
+    OrderLine.objects.count()
+
+
+def write(rng, order_ids, hold):
+    # like an admin save: a line update cascading into its order, with the write lock held meanwhile
+    with transaction.atomic():
+        order_id = rng.choice(order_ids)
+        OrderLine.objects.filter(order_id=order_id).update(quantity=F('quantity'))
+        Order.objects.filter(pk=order_id).update(total=F('total'))
+        time.sleep(hold)
+
+
+def run_worker(role, worker, database, pragmas, transaction_mode, seconds, hold):
+    django.setup()
+    if database:
+        settings_dict = connections['default'].settings_dict
+        settings_dict['NAME'] = database
+        settings_dict['OPTIONS'] = dict(settings_dict['OPTIONS'], transaction_mode=transaction_mode)
+    with override_settings(SQLITE_PRAGMAS=pragmas):
+        rng = random.Random(worker)
+        product_ids = list(Product.objects.values_list('pk', flat=True)[:1000])
+        order_ids = list(Order.objects.values_list('pk', flat=True)[:1000])
+        samples, errors = [], 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                if role == 'read':
+                    read(rng, product_ids)
+                else:
+                    write(rng, order_ids, hold)
+            except OperationalError:
+                errors += 1
+                continue
+            samples.append(time.perf_counter() - started)
+    connections.close_all()
+    return role, samples, errors
+
+
+class Command(BaseCommand):
+    help = "Run concurrent catalogue readers and order writers and report how much they block each other"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=2)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--hold', type=float, default=0.02, help="Seconds each write transaction stays open")
+        parser.add_argument('--timeout', type=float, default=2, help="SQLite busy timeout in seconds for both profiles")
+        parser.add_argument('--profile', choices=('default', 'tuned', 'both'), default='both',
+                            help="SQLite only: rollback journal without pragmas, the SQLITE_PRAGMAS profile, or both")
+
+    def handle(self, *args, **options):
+        if not Order.objects.exists() or not Product.objects.exists():
+            raise CommandError("No orders or products, run seed_benchmark_data first")
+        if connection.vendor != 'sqlite':
+            self.report(connection.vendor, self.run(None, {}, None, options))
+            return
+        profiles = ('default', 'tuned') if options['profile'] == 'both' else (options['profile'],)
+        directory = tempfile.mkdtemp()
+        try:
+            for profile in profiles:
+                # a copy, because WAL is a property of the database file and outlives the connection
+                database = os.path.join(directory, f"{profile}.sqlite3")
+                self.copy_database(database, 'wal' if profile == 'tuned' else 'delete')
+                if profile == 'tuned':
+                    pragmas = dict(settings.SQLITE_PRAGMAS, busy_timeout=int(options['timeout'] * 1000))
+                    transaction_mode = settings.DATABASES['default'].get('OPTIONS', {}).get('transaction_mode')
+                else:
+                    pragmas = {'journal_mode': 'delete', 'busy_timeout': int(options['timeout'] * 1000)}
+                    transaction_mode = None
+                self.report(profile, self.run(database, pragmas, transaction_mode, options))
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def copy_database(self, path, journal_mode):
+        source = sqlite3.connect(settings.DATABASES['default']['NAME'])
+        target = sqlite3.connect(path)
+        try:
+            source.backup(target)
+            target.execute(f"PRAGMA journal_mode = {journal_mode}")
+        finally:
+            source.close()
+            target.close()
+
+    def run(self, database, pragmas, transaction_mode, options):
+        connections.close_all()
+        common = (database, pragmas, transaction_mode, options['seconds'], options['hold'])
+        arguments = [('read', number, *common) for number in range(options['readers'])]
+        arguments += [('write', number, *common) for number in range(options['writers'])]
+        with multiprocessing.get_context().Pool(len(arguments)) as pool:
+            return pool.starmap(run_worker, arguments)
+
+    def report(self, label, results):
+        self.stdout.write(self.style.MIGRATE_HEADING(label))
+        for role in ('read', 'write'):
+            samples = [sample for result_role, role_samples, errors in results if result_role == role for sample in role_samples]
+            errors = sum(errors for result_role, role_samples, errors in results if result_role == role)
+            self.stdout.write(f"{format_summary(role + 's', summarize(samples))} locked={errors}")
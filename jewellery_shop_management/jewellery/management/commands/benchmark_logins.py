@@ -0,0 +1,56 @@
+import time
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from jewellery.benchmarking import summarize, format_summary
+
+
+USERNAME = 'benchmark_login'
+PASSWORD = 'benchmark-password'
+
+
+class Command(BaseCommand):
+    help = "Log one user in repeatedly through the login view and report throughput, queries and profile writes per login"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=200)
+        parser.add_argument('--real-hasher', action='store_true', help="Keep PASSWORD_HASHERS, otherwise MD5 keeps hashing from hiding the rest of the login")
+
+    def handle(self, *args, **options):
+        overrides = {
+            'ALLOWED_HOSTS': ['testserver'],
+            'THROTTLE_RATES': {'login_ip': '1000000/m', 'login_username': '1000000/m'},
+        }
+        if not options['real_hasher']:
+            overrides['PASSWORD_HASHERS'] = ['django.contrib.auth.hashers.MD5PasswordHasher']
+        with override_settings(**overrides), transaction.atomic():
+            user = get_user_model().objects.create_user(USERNAME, password=PASSWORD)
+            # a stored photo, as most customers have
+            user.profile.photo = 'user_profile/photos/benchmark.jpg'
+            user.profile.save()
+            client, latencies, queries, profile_writes = Client(), [], 0, 0
+            started = time.perf_counter()
+            for _ in range(options['logins']):
+                with CaptureQueriesContext(connection) as context:
+                    login_started = time.perf_counter()
+                    response = client.post(reverse('login'), {'username': USERNAME, 'password': PASSWORD})
+                    latencies.append(time.perf_counter() - login_started)
+                if response.status_code != 302:
+                    self.stderr.write(f"Login answered {response.status_code}")
+                queries += len(context.captured_queries)
+                profile_writes += sum(
+                    1 for query in context.captured_queries
+                    if 'user_profile_profile' in query['sql'] or 'jewellery_imagejob' in query['sql']
+                )
+                client.cookies.clear()
+            elapsed = time.perf_counter() - started
+            transaction.set_rollback(True)
+        logins = options['logins']
+        self.stdout.write(format_summary('login', summarize(latencies)))
+        self.stdout.write(
+            f"{logins / elapsed:.1f} logins/s, {queries / logins:.1f} queries per login, "
+            f"{profile_writes / logins:.1f} profile and image job queries per login"
+        )
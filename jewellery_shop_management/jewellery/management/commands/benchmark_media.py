@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+
+CHUNK = 1024 * 1024
+
+
+def read_whole(path):
+    with open(path, 'rb') as media_file:
+        return len(media_file.read())
+
+
+class Command(BaseCommand):
+    help = "Download media files of growing size through serve_media and report peak Python memory and throughput"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-mb', type=int, action='append', dest='sizes', help="File sizes to try, repeatable (default 1, 16 and 128)")
+        parser.add_argument('--in-memory', action='store_true', help="Also time reading each file whole, as a baseline")
+
+    def handle(self, *args, **options):
+        media_root = tempfile.mkdtemp()
+        try:
+            with override_settings(MEDIA_ROOT=media_root, ALLOWED_HOSTS=['testserver'], MEDIA_SENDFILE_HEADER=None):
+                client = Client()
+                for size in options['sizes'] or (1, 16, 128):
+                    name = f"benchmark-{size}mb.bin"
+                    with open(os.path.join(media_root, name), 'wb') as media_file:
+                        for _ in range(size):
+                            media_file.write(os.urandom(CHUNK))
+                    url = f"/media/{name}"
+                    middle = size * CHUNK // 2
+                    self.report(f"{size}MB full", lambda: self.download(client, url))
+                    self.report(f"{size}MB range 1MB", lambda: self.download(client, url, HTTP_RANGE=f"bytes={middle}-{middle + CHUNK - 1}"))
+                    if options['in_memory']:
+                        self.report(f"{size}MB in memory", lambda: read_whole(os.path.join(media_root, name)))
+                    os.remove(os.path.join(media_root, name))
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+
+    def download(self, client, url, **headers):
+        response = client.get(url, **headers)
+        received = sum(len(chunk) for chunk in response.streaming_content)
+        response.close()
+        return received
+
+    def report(self, label, download):
+        tracemalloc.start()
+        started = time.perf_counter()
+        received = download()
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.stdout.write(
+            f"{label:<24} {received / CHUNK:8.1f}MB in {elapsed * 1000:8.1f}ms "
+            f"({received / CHUNK / elapsed if elapsed else 0:8.1f}MB/s) peak python memory {peak / 1024:8.1f}KB"
+        )
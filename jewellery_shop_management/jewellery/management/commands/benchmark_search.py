@@ -0,0 +1,61 @@
+import random
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from jewellery.benchmarking import measure, format_summary
+from jewellery.models import Product, Category, JewelleryType
+from jewellery.search import get_search_backend
+
+
+WORDS = (
+    'gold', 'silver', 'platinum', 'pearl', 'diamond', 'sapphire', 'emerald', 'ruby', 'amber',
+    'vintage', 'classic', 'twisted', 'signet', 'solitaire', 'eternity', 'halo', 'filigree', 'baroque',
+)
+PAGE_SIZE = 21
+
+
+class Command(BaseCommand):
+    help = "Compare product search latency of the search backend against name__icontains"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--query', action='append', dest='queries')
+        parser.add_argument('--keep', action='store_true', help="Keep the generated products")
+
+    def handle(self, *args, **options):
+        queries = options['queries'] or ['ring', 'baroque pearl', 'amber']
+        backend = get_search_backend()
+        with transaction.atomic():
+            self.generate(options['products'])
+            self.stdout.write(f"Indexed {backend.rebuild()} products with {backend.__class__.__name__}")
+            base = Product.objects.all()
+            for query in queries:
+                icontains = base.filter(Q(name__icontains=query)).order_by('id')
+                indexed = backend.search(base, query).order_by('search_rank', 'id')
+                self.stdout.write(f"\nquery={query!r}")
+                self.stdout.write(format_summary('icontains page', measure(lambda: list(icontains[:PAGE_SIZE]), options['repeat'])))
+                self.stdout.write(format_summary('icontains count', measure(icontains.count, options['repeat'])))
+                self.stdout.write(format_summary('search page', measure(lambda: list(indexed[:PAGE_SIZE]), options['repeat'])))
+                self.stdout.write(format_summary('search count', measure(indexed.count, options['repeat'])))
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+    def generate(self, count):
+        rng = random.Random(count)
+        jewellery_types = [JewelleryType.objects.create(name=name) for name in ('ring', 'necklace', 'earrings', 'bracelet', 'brooch')]
+        categories = [Category.objects.create(name=name) for name in ('engagement', 'wedding', 'everyday', 'heritage')]
+        products = Product.objects.bulk_create(
+            (Product(
+                name=' '.join(rng.sample(WORDS, 3)),
+                price=rng.randint(50, 5000),
+                jewellery_type=rng.choice(jewellery_types),
+            ) for _ in range(count)),
+            batch_size=2000,
+        )
+        if products and products[0].pk is None:
+            products = Product.objects.filter(jewellery_type__in=jewellery_types).only('id')
+        Product.category.through.objects.bulk_create(
+            (Product.category.through(product_id=product.pk, category=rng.choice(categories)) for product in products),
+            batch_size=2000,
+        )
@@ -0,0 +1,144 @@
+import asyncio
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import time
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from jewellery.benchmarking import summarize, format_summary
+from jewellery.models import Order, Product
+
+
+SERVERS = {
+    'asgi': "{python} -m uvicorn jewellery_shop_management.asgi:application --port {port} --workers {workers} --no-access-log",
+    'wsgi': "{python} -m gunicorn jewellery_shop_management.wsgi:application --bind 127.0.0.1:{port} --workers {workers} --threads {threads} --worker-class gthread",
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def wait_for_port(port, timeout, command):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        except OSError:
+            await asyncio.sleep(0.2)
+            continue
+        writer.close()
+        return
+    raise CommandError(f"Server did not listen on port {port} within {timeout}s, try running: {command}")
+
+
+async def fetch(connection, port, path, cookie):
+    """One keep-alive HTTP/1.1 GET; reconnects when the server closed the previous connection."""
+    if connection is None:
+        connection = await asyncio.open_connection('127.0.0.1', port)
+    reader, writer = connection
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: {cookie}\r\n\r\n".encode())
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while (line := await reader.readline()) not in (b'\r\n', b''):
+        name, value = line.decode('latin-1').split(':', 1)
+        headers[name.strip().lower()] = value.strip()
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    else:
+        await reader.read()
+        headers['connection'] = 'close'
+    if headers.get('connection', '').lower() == 'close':
+        writer.close()
+        connection = None
+    return connection, status
+
+
+async def load(port, paths, cookie, connections, seconds):
+    latencies, errors = [], 0
+    deadline = time.monotonic() + seconds
+
+    async def client(number):
+        nonlocal errors
+        connection = None
+        request = number
+        while time.monotonic() < deadline:
+            path = paths[request % len(paths)]
+            request += 1
+            started = time.perf_counter()
+            try:
+                connection, status = await fetch(connection, port, path, cookie)
+            except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+                errors += 1
+                connection = None
+                continue
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                errors += 1
+        if connection:
+            connection[1].close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(number) for number in range(connections)))
+    return latencies, errors, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare throughput under many concurrent connections: uvicorn with async views against gunicorn with the WSGI views "
+        "(needs both installed). The async views run their queries one after another as well; the difference comes from "
+        "connections waiting without holding a worker thread"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', action='append', dest='servers', choices=tuple(SERVERS))
+        parser.add_argument('--connections', type=int, action='append', help="Concurrent keep-alive connections, repeatable (default 10, 50 and 200)")
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--threads', type=int, default=8, help="Threads per WSGI worker")
+        parser.add_argument('--startup-timeout', type=float, default=30)
+
+    def handle(self, *args, **options):
+        products = list(Product.objects.order_by('?').values_list('pk', flat=True)[:50])
+        order = Order.objects.select_related('customer__user').order_by('?').first()
+        if not products or order is None:
+            raise CommandError("No products or orders, run seed_benchmark_data first")
+        cookie = f"{settings.SESSION_COOKIE_NAME}={self.login(order.customer.user)}"
+        paths = ['/', '/products/', '/products/?search=pearl', '/my_orders/', f'/order/{order.pk}/']
+        paths += [f'/product/{pk}/' for pk in products[:5]]
+        for server in options['servers'] or list(SERVERS):
+            port = free_port()
+            command = SERVERS[server].format(python=shlex.quote(sys.executable), port=port, workers=options['workers'], threads=options['threads'])
+            env = dict(os.environ)
+            # the async views are opt-in, the ASGI server gets them and the WSGI server the sync ones
+            env['DJANGO_ASYNC_VIEWS'] = '1' if server == 'asgi' else ''
+            process = subprocess.Popen(shlex.split(command), cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                asyncio.run(wait_for_port(port, options['startup_timeout'], command))
+                for count in options['connections'] or (10, 50, 200):
+                    latencies, errors, elapsed = asyncio.run(load(port, paths, cookie, count, options['seconds']))
+                    self.stdout.write(
+                        f"{format_summary(f'{server} c={count}', summarize(latencies))} "
+                        f"rps={len(latencies) / elapsed:.1f} errors={errors}"
+                    )
+            finally:
+                process.terminate()
+                try:
+                    process.wait(10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    def login(self, user):
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return session.session_key
@@ -0,0 +1,145 @@
+import json
+import multiprocessing
+import platform
+import random
+import time
+from datetime import datetime, timezone
+import django
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from jewellery.benchmarking import summarize, format_summary
+from jewellery.models import Order, Product
+
+
+VIEWS = ('index', 'product_list', 'product_search', 'product_detail', 'order_list', 'order_detail')
+SEARCH_TERMS = ('ring', 'gold pearl', 'baroque', 'vintage silver', 'amber')
+
+
+def build_targets(seed):
+    """Picks the URLs one worker requests, with a customer that has orders for the order views."""
+    rng = random.Random(seed)
+    product_ids = list(Product.objects.order_by('?').values_list('pk', flat=True)[:200])
+    customer_ids = list(Order.objects.order_by().values_list('customer_id', flat=True).distinct()[:50])
+    if not product_ids or not customer_ids:
+        raise CommandError("No products or orders to request, run seed_benchmark_data first")
+    customer_id = rng.choice(customer_ids)
+    order_ids = list(Order.objects.filter(customer_id=customer_id).values_list('pk', flat=True)[:50])
+    return {
+        'index': lambda: reverse('index'),
+        'product_list': lambda: reverse('products'),
+        'product_search': lambda: f"{reverse('products')}?search={rng.choice(SEARCH_TERMS)}",
+        'product_detail': lambda: reverse('product', kwargs={'pk': rng.choice(product_ids)}),
+        'order_list': lambda: reverse('user_orders'),
+        'order_detail': lambda: reverse('order', kwargs={'pk': rng.choice(order_ids)}),
+    }, get_user_model().objects.get(customer__pk=customer_id)
+
+
+def run_worker(worker, views, requests, warmup, seed):
+    django.setup()
+    with override_settings(ALLOWED_HOSTS=['testserver']):
+        targets, user = build_targets(seed + worker)
+        client = Client()
+        client.force_login(user)
+        for name in views:
+            for _ in range(warmup):
+                client.get(targets[name]())
+        results = {name: {'latency': [], 'queries': [], 'errors': 0} for name in views}
+        started = time.perf_counter()
+        for number in range(requests):
+            name = views[number % len(views)]
+            url = targets[name]()
+            with CaptureQueriesContext(connection) as context:
+                request_started = time.perf_counter()
+                response = client.get(url)
+                elapsed = time.perf_counter() - request_started
+            results[name]['latency'].append(elapsed)
+            results[name]['queries'].append(len(context.captured_queries))
+            if response.status_code != 200:
+                results[name]['errors'] += 1
+        results['_wall'] = time.perf_counter() - started
+    connections.close_all()
+    return results
+
+
+class Command(BaseCommand):
+    help = "Drive the shop views with the test client across worker processes and report latency, throughput and queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--requests', type=int, default=300, help="Requests per worker, spread evenly across the views")
+        parser.add_argument('--warmup', type=int, default=2, help="Untimed requests per view before measuring")
+        parser.add_argument('--view', action='append', dest='views', choices=VIEWS)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Write the results as JSON to this file")
+        parser.add_argument('--compare', help="Print the change against an earlier --output file")
+
+    def handle(self, *args, **options):
+        views = options['views'] or list(VIEWS)
+        # each worker opens its own connection, an inherited one must not be shared
+        connections.close_all()
+        arguments = [(worker, views, options['requests'], options['warmup'], options['seed']) for worker in range(options['processes'])]
+        started = time.perf_counter()
+        if options['processes'] > 1:
+            with multiprocessing.get_context().Pool(options['processes']) as pool:
+                worker_results = pool.starmap(run_worker, arguments)
+        else:
+            worker_results = [run_worker(*arguments[0])]
+        wall = time.perf_counter() - started
+        report = self.build_report(views, worker_results, wall, options)
+        for name, summary in report['views'].items():
+            self.stdout.write(
+                f"{format_summary(name, summary)} rps={summary['throughput_rps']:.1f} "
+                f"queries={summary['queries_mean']:.1f} (max {summary['queries_max']}) errors={summary['errors']}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"{report['requests']} requests in {wall:.2f}s, {report['throughput_rps']:.1f} requests/s"))
+        if options['compare']:
+            self.compare(report, options['compare'])
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def build_report(self, views, worker_results, wall, options):
+        busy = max(result['_wall'] for result in worker_results)
+        report = {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'processes': options['processes'],
+            'requests_per_process': options['requests'],
+            'requests': sum(len(result[name]['latency']) for result in worker_results for name in views),
+            'wall_s': wall,
+            'views': {},
+        }
+        report['throughput_rps'] = report['requests'] / busy if busy else 0.0
+        for name in views:
+            latency = [sample for result in worker_results for sample in result[name]['latency']]
+            queries = [count for result in worker_results for count in result[name]['queries']]
+            summary = summarize(latency)
+            summary.update({
+                'throughput_rps': len(latency) / sum(latency) * options['processes'] if latency else 0.0,
+                'queries_mean': sum(queries) / len(queries) if queries else 0.0,
+                'queries_max': max(queries, default=0),
+                'errors': sum(result[name]['errors'] for result in worker_results),
+            })
+            report['views'][name] = summary
+        return report
+
+    def compare(self, report, path):
+        with open(path) as previous_file:
+            previous = json.load(previous_file)
+        self.stdout.write(f"\nCompared with {path} ({previous.get('created_at')}):")
+        for name, summary in report['views'].items():
+            before = previous.get('views', {}).get(name)
+            if not before:
+                continue
+            changes = []
+            for key in ('p50_ms', 'p95_ms', 'p99_ms', 'queries_mean'):
+                if before[key]:
+                    changes.append(f"{key} {(summary[key] - before[key]) / before[key] * 100:+.1f}%")
+            self.stdout.write(f"{name:<28} {' '.join(changes)}")
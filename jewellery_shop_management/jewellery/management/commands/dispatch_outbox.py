@@ -0,0 +1,29 @@
+import time
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from jewellery.outbox import BATCH_SIZE, dispatch
+
+
+class Command(BaseCommand):
+    help = "Send the queued emails in batches over one SMTP connection, retrying failures with backoff"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain the outbox once and exit")
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--sleep', type=float, default=5.0, help="Seconds to wait when the outbox is empty")
+
+    def handle(self, *args, **options):
+        connection = get_connection()
+        try:
+            while True:
+                sent, retried, failed = dispatch(connection, options['batch_size'])
+                if sent or retried or failed:
+                    self.stdout.write(f"sent {sent}, retried {retried}, failed {failed}")
+                    continue
+                if options['once']:
+                    return
+                # idle SMTP servers drop the connection, it is opened again with the next message
+                connection.close()
+                time.sleep(options['sleep'])
+        finally:
+            connection.close()
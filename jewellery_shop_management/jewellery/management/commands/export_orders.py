@@ -0,0 +1,40 @@
+import sys
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from jewellery.exports import CHUNK_SIZE, STREAMS, export_queryset
+from jewellery.models import Order
+
+
+def parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Invalid date {value!r}, expected YYYY-MM-DD")
+
+
+class Command(BaseCommand):
+    help = "Stream the order lines, with their specifications, to a CSV or XLSX file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="File to write, - for standard output")
+        parser.add_argument('--format', choices=tuple(STREAMS), help="Defaults to the output file's extension, else csv")
+        parser.add_argument('--status', action='append', dest='statuses', choices=[code for code, label in Order.STATUS_CHOICES])
+        parser.add_argument('--from', dest='date_from', type=parse_date, help="First order date to include (YYYY-MM-DD)")
+        parser.add_argument('--to', dest='date_to', type=parse_date, help="Last order date to include (YYYY-MM-DD)")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        output = options['output']
+        export_format = options['format'] or ('xlsx' if output.endswith('.xlsx') else 'csv')
+        lines = export_queryset(options['statuses'], options['date_from'], options['date_to'])
+        chunks = STREAMS[export_format](lines, options['chunk_size'])
+        if output == '-':
+            if export_format != 'csv':
+                raise CommandError("Only CSV can be written to standard output")
+            for chunk in chunks:
+                sys.stdout.write(chunk)
+            return
+        with open(output, 'wb') as export_file:
+            for chunk in chunks:
+                export_file.write(chunk.encode() if isinstance(chunk, str) else chunk)
+        self.stdout.write(self.style.SUCCESS(f"Order lines written to {output}"))
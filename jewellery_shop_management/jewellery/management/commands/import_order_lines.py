@@ -0,0 +1,156 @@
+import csv
+import json
+import sys
+import time
+from itertools import islice
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from jewellery.models import Order, OrderLine, Product, MetalType, Pearl, defer_order_totals
+from jewellery.stock import InsufficientStock, reserve_pearls
+
+
+SIMPLE_FIELDS = (
+    'quantity', 'price', 'hand', 'finger', 'ring_size', 'measurement', 'weight',
+    'specification', 'engraving', 'certificate', 'restoration',
+)
+MAX_REPORTED_ERRORS = 50
+
+
+def read_csv(stream):
+    for row in csv.DictReader(stream):
+        for key in ('metal_type', 'pearl'):
+            row[key] = [value.strip() for value in (row.get(key) or '').split(';') if value.strip()]
+        yield row
+
+
+def read_json_lines(stream):
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def as_list(value):
+    if value in (None, ''):
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(item).strip() for item in value]
+    return [str(value).strip()]
+
+
+class Command(BaseCommand):
+    help = "Import order lines from CSV or JSON Lines, with one lookup per batch and bulk inserts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV (.csv) or JSON Lines (.jsonl) file, '-' for stdin")
+        parser.add_argument('--format', choices=('csv', 'jsonl'))
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="Validate every row without writing anything")
+
+    def handle(self, *args, **options):
+        input_format = options['format'] or ('jsonl' if options['path'].endswith(('.jsonl', '.ndjson', '.json')) else 'csv')
+        reader = read_json_lines if input_format == 'jsonl' else read_csv
+        stream = sys.stdin if options['path'] == '-' else open(options['path'], newline='', encoding='utf-8')
+        self.errors = []
+        started = time.perf_counter()
+        rows = created = 0
+        try:
+            with transaction.atomic():
+                with defer_order_totals():
+                    numbered = enumerate(reader(stream), start=1)
+                    while batch := list(islice(numbered, options['batch_size'])):
+                        rows += len(batch)
+                        lines, metal_types, pearls = self.build_batch(batch)
+                        if not options['dry_run'] and not self.errors:
+                            created += self.write_batch(lines, metal_types, pearls)
+                if options['dry_run'] or self.errors:
+                    transaction.set_rollback(True)
+        except (ValueError, csv.Error) as error:
+            raise CommandError(f"Could not read {options['path']}: {error}")
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        elapsed = time.perf_counter() - started
+        for number, message in self.errors[:MAX_REPORTED_ERRORS]:
+            self.stderr.write(f"row {number}: {message}")
+        rate = rows / elapsed if elapsed else 0
+        summary = f"{rows} rows in {elapsed:.2f}s ({rate:.0f} rows/s)"
+        if self.errors:
+            raise CommandError(f"{len(self.errors)} invalid rows, nothing imported. {summary}")
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f"Dry run: all rows valid. {summary}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Imported {created} order lines. {summary}"))
+
+    def build_batch(self, batch):
+        order_ids = {str(row.get('order', '')).strip() for number, row in batch}
+        product_ids = {str(row.get('product', '')).strip() for number, row in batch}
+        metal_refs = {ref for number, row in batch for ref in as_list(row.get('metal_type'))}
+        pearl_ids = {ref for number, row in batch for ref in as_list(row.get('pearl'))}
+        orders = set(str(pk) for pk in Order.objects.filter(pk__in=[pk for pk in order_ids if pk.isdigit()]).values_list('pk', flat=True))
+        products = {str(product.pk): product for product in Product.objects.filter(pk__in=[pk for pk in product_ids if pk.isdigit()]).only('pk', 'price')}
+        metals = {}
+        for metal in MetalType.objects.filter(pk__in=[ref for ref in metal_refs if ref.isdigit()]) | MetalType.objects.filter(alloy__in=metal_refs):
+            metals.setdefault(str(metal.pk), metal.pk)
+            metals.setdefault(metal.alloy, metal.pk)
+        pearls = set(str(pk) for pk in Pearl.objects.filter(pk__in=[ref for ref in pearl_ids if ref.isdigit()]).values_list('pk', flat=True))
+
+        lines, line_metals, line_pearls = [], [], []
+        for number, row in batch:
+            problems = []
+            order_id = str(row.get('order', '')).strip()
+            product = products.get(str(row.get('product', '')).strip())
+            if order_id not in orders:
+                problems.append(f"unknown order {order_id!r}")
+            if product is None:
+                problems.append(f"unknown product {row.get('product')!r}")
+            values = {}
+            for name in SIMPLE_FIELDS:
+                value = row.get(name)
+                if value in (None, ''):
+                    continue
+                try:
+                    values[name] = OrderLine._meta.get_field(name).clean(value, None)
+                except ValidationError as error:
+                    problems.append(f"{name}: {' '.join(error.messages)}")
+            if values.get('quantity', 1) < 1:
+                problems.append("quantity: must be at least 1")
+            metal_ids = [metals.get(ref) for ref in as_list(row.get('metal_type'))]
+            if not metal_ids or None in metal_ids:
+                problems.append(f"unknown or missing metal type in {as_list(row.get('metal_type'))}")
+            row_pearls = as_list(row.get('pearl'))
+            missing_pearls = [ref for ref in row_pearls if ref not in pearls]
+            if missing_pearls:
+                problems.append(f"unknown pearls {missing_pearls}")
+            if problems:
+                self.errors.append((number, '; '.join(problems)))
+                continue
+            if 'price' not in values:
+                values['price'] = product.price
+            lines.append(OrderLine(order_id=int(order_id), product=product, **values))
+            line_metals.append(metal_ids)
+            line_pearls.append([int(ref) for ref in row_pearls])
+        return lines, line_metals, line_pearls
+
+    def write_batch(self, lines, metal_types, pearls):
+        lines = OrderLine.objects.bulk_create(lines)
+        if lines and lines[0].pk is None:
+            ids = dict(OrderLine.objects.filter(unique_id__in=[line.unique_id for line in lines]).values_list('unique_id', 'pk'))
+            for line in lines:
+                line.pk = ids[line.unique_id]
+        MetalThrough = OrderLine.metal_type.through
+        PearlThrough = OrderLine.pearl.through
+        MetalThrough.objects.bulk_create(
+            MetalThrough(orderline_id=line.pk, metaltype_id=metal_id)
+            for line, metal_ids in zip(lines, metal_types) for metal_id in set(metal_ids)
+        )
+        PearlThrough.objects.bulk_create(
+            PearlThrough(orderline_id=line.pk, pearl_id=pearl_id)
+            for line, pearl_ids in zip(lines, pearls) for pearl_id in set(pearl_ids)
+        )
+        # bulk_create sends no m2m_changed, take the pearls from stock for the whole batch here
+        try:
+            reserve_pearls(zip(lines, pearls))
+        except InsufficientStock as error:
+            raise CommandError(f"{error}, nothing imported")
+        return len(lines)
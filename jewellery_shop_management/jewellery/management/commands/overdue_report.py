@@ -0,0 +1,32 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from jewellery.models import Order
+
+
+class Command(BaseCommand):
+    help = "List overdue orders grouped by stage, streaming each stage from the (status, due_date) index"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help="Report as of this date (YYYY-MM-DD), today by default")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            today = date.fromisoformat(options['date']) if options['date'] else date.today()
+        except ValueError:
+            raise CommandError(f"Invalid date {options['date']!r}, expected YYYY-MM-DD")
+        labels = dict(Order.STATUS_CHOICES)
+        total = 0
+        for status in Order.OPEN_STATUSES:
+            # one query per stage keeps the status an equality match, so due_date is an index range
+            orders = Order.objects.overdue(today).filter(status=status) \
+                .order_by('due_date', 'id').values_list('id', 'due_date', 'total', 'customer__user__username')
+            heading = False
+            for order_id, due_date, order_total, username in orders.iterator(chunk_size=options['batch_size']):
+                if not heading:
+                    self.stdout.write(self.style.MIGRATE_HEADING(f"{labels[status]}"))
+                    heading = True
+                days = (today - due_date).days
+                self.stdout.write(f"  #{order_id}  {username}  due {due_date} ({days} days late)  {order_total}")
+                total += 1
+        self.stdout.write(self.style.SUCCESS(f"{total} overdue orders as of {today}"))
@@ -0,0 +1,22 @@
+import time
+from django.core.management.base import BaseCommand
+from jewellery.imaging import run_jobs
+
+
+class Command(BaseCommand):
+    help = "Process queued image jobs (thumbnails for uploaded photos)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain the queue once and exit")
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--sleep', type=float, default=2.0, help="Seconds to wait when the queue is empty")
+
+    def handle(self, *args, **options):
+        while True:
+            processed, retried, failed = run_jobs(options['batch_size'])
+            if processed or retried or failed:
+                self.stdout.write(f"processed {processed}, retried {retried}, failed {failed}")
+                continue
+            if options['once']:
+                return
+            time.sleep(options['sleep'])
@@ -0,0 +1,21 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from jewellery.reporting import rebuild_months
+
+
+def parse_month(value):
+    try:
+        return datetime.strptime(value, '%Y-%m').date()
+    except ValueError:
+        raise CommandError(f"Invalid month {value!r}, expected YYYY-MM")
+
+
+class Command(BaseCommand):
+    help = "Recompute the monthly sales summaries from the order lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', action='append', dest='months', type=parse_month, help="Only this month (YYYY-MM), repeatable; every month by default")
+
+    def handle(self, *args, **options):
+        rows = rebuild_months(options['months'])
+        self.stdout.write(self.style.SUCCESS(f"Sales summaries rebuilt: {rows} rows"))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Round
+from jewellery.models import Order
+
+
+class Command(BaseCommand):
+    help = "Find orders whose total differs from the sum of their lines, and optionally fix them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help="Rewrite the drifted totals")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        drifted = Order.objects.with_line_total().filter(~Q(total=Round(F('line_total'), 2)))
+        drifted_ids = []
+        for order_id, total, line_total in drifted.values_list('id', 'total', 'line_total').iterator(chunk_size=options['batch_size']):
+            drifted_ids.append(order_id)
+            if options['verbosity'] > 1:
+                self.stdout.write(f"order {order_id}: total {total}, lines {line_total}")
+        if options['fix']:
+            with transaction.atomic():
+                for start in range(0, len(drifted_ids), options['batch_size']):
+                    Order.objects.filter(pk__in=drifted_ids[start:start + options['batch_size']]).refresh_totals()
+            self.stdout.write(self.style.SUCCESS(f"fixed {len(drifted_ids)} drifted order totals"))
+        else:
+            self.stdout.write(f"{len(drifted_ids)} drifted order totals, run with --fix to correct them")
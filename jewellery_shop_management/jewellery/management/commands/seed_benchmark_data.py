@@ -0,0 +1,159 @@
+import io
+import random
+import time
+from datetime import date, timedelta
+from PIL import Image
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from jewellery.imaging import create_renditions
+from jewellery.models import Category, JewelleryType, MetalType, Pearl, Product, Customer, Order, OrderLine, ReviewProduct
+from jewellery.search import get_search_backend
+from user_profile.models import Profile
+
+
+BATCH_SIZE = 2000
+PASSWORD = 'benchmark'
+CATEGORIES = ('Engagement', 'Wedding', 'Everyday', 'Heritage', 'Gifts', 'Men', 'Bridal', 'Vintage', 'Minimal', 'Statement')
+JEWELLERY_TYPES = ('ring', 'necklace', 'earrings', 'bracelet', 'brooch', 'pendant')
+ALLOYS = ('Au 375', 'Au 585', 'Au 750', 'Ag 925', 'Pt 950', 'Pd 500', 'Rose Au 585', 'White Au 750')
+PEARL_TYPES = ('akoya', 'south sea', 'tahitian', 'freshwater', 'baroque')
+PEARL_SHAPES = ('round', 'oval', 'drop', 'button', 'baroque')
+PEARL_COLORS = ('white', 'cream', 'pink', 'gold', 'black', 'grey')
+WORDS = (
+    'gold', 'silver', 'platinum', 'pearl', 'diamond', 'sapphire', 'emerald', 'ruby', 'amber',
+    'vintage', 'classic', 'twisted', 'signet', 'solitaire', 'eternity', 'halo', 'filigree', 'baroque',
+)
+IMAGE_COLORS = ('gold', 'silver', 'lightpink', 'khaki', 'lavender', 'wheat', 'peachpuff', 'beige')
+
+
+def bulk_create(model, objs):
+    """bulk_create in batches; returns the objects with primary keys on every backend."""
+    objs = model._default_manager.bulk_create(objs, batch_size=BATCH_SIZE)
+    if objs and objs[0].pk is None:
+        pks = model._default_manager.order_by('-pk').values_list('pk', flat=True)[:len(objs)]
+        for obj, pk in zip(objs, reversed(list(pks))):
+            obj.pk = pk
+    return objs
+
+
+class Command(BaseCommand):
+    help = "Bulk-generate realistic shop data for benchmarks; every count scales with --scale"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0)
+        parser.add_argument('--products', type=int, help="2000 per scale unit by default")
+        parser.add_argument('--customers', type=int, help="500 per scale unit by default")
+        parser.add_argument('--orders', type=int, help="2000 per scale unit by default")
+        parser.add_argument('--reviews', type=int, help="5000 per scale unit by default")
+        parser.add_argument('--max-lines', type=int, default=5, help="Order lines per order, at most")
+        parser.add_argument('--images', type=int, default=8, help="Distinct product images shared by the products, 0 for none")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        scale = options['scale']
+        counts = {
+            name: options[name] if options[name] is not None else max(1, int(default * scale))
+            for name, default in (('products', 2000), ('customers', 500), ('orders', 2000), ('reviews', 5000))
+        }
+        self.rng = random.Random(options['seed'])
+        started = time.perf_counter()
+        with transaction.atomic():
+            categories = bulk_create(Category, [Category(name=name) for name in CATEGORIES])
+            jewellery_types = bulk_create(JewelleryType, [JewelleryType(name=name) for name in JEWELLERY_TYPES])
+            metals = bulk_create(MetalType, [MetalType(alloy=alloy) for alloy in ALLOYS])
+            pearls = bulk_create(Pearl, [
+                Pearl(
+                    parcel=f"P{number:04d}", shape=self.rng.choice(PEARL_SHAPES), color=self.rng.choice(PEARL_COLORS),
+                    size=f"{self.rng.randint(4, 14)}mm", type_name=self.rng.choice(PEARL_TYPES),
+                ) for number in range(40)
+            ])
+            products = self.create_products(counts['products'], categories, jewellery_types, self.create_images(options['images']))
+            users = self.create_customers(counts['customers'])
+            self.create_orders(counts['orders'], [user.customer_id for user in users], products, metals, pearls, options['max_lines'])
+            self.create_reviews(counts['reviews'], users, products)
+        indexed = get_search_backend().rebuild()
+        elapsed = time.perf_counter() - started
+        summary = ', '.join(f"{count} {name}" for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Seeded {summary} and indexed {indexed} products in {elapsed:.1f}s"))
+
+    def create_images(self, count):
+        names = []
+        for number in range(count):
+            buffer = io.BytesIO()
+            Image.new('RGB', (800, 800), IMAGE_COLORS[number % len(IMAGE_COLORS)]).save(buffer, format='JPEG', quality=85)
+            name = default_storage.save(f"{Product.image.field.upload_to}/benchmark_{number}.jpg", ContentFile(buffer.getvalue()))
+            product = Product(image=name)
+            create_renditions(product.image)
+            names.append(name)
+        return names
+
+    def create_products(self, count, categories, jewellery_types, images):
+        rng = self.rng
+        products = bulk_create(Product, [
+            Product(
+                name=' '.join(rng.sample(WORDS, 3)).capitalize(),
+                price=rng.randint(50, 5000),
+                jewellery_type=rng.choice(jewellery_types),
+                image=rng.choice(images) if images else None,
+            ) for _ in range(count)
+        ])
+        Through = Product.category.through
+        bulk_create(Through, [
+            Through(product_id=product.pk, category_id=category.pk)
+            for product in products for category in rng.sample(categories, rng.randint(1, 3))
+        ])
+        return products
+
+    def create_customers(self, count):
+        User = get_user_model()
+        start = User.objects.count()
+        password = make_password(PASSWORD)
+        users = bulk_create(User, [
+            User(username=f"bench_{start + number}", email=f"bench_{start + number}@example.com", password=password)
+            for number in range(count)
+        ])
+        bulk_create(Profile, [Profile(user_id=user.pk) for user in users])
+        customers = bulk_create(Customer, [Customer(user_id=user.pk, phone=f"+3706{self.rng.randint(1000000, 9999999)}") for user in users])
+        for user, customer in zip(users, customers):
+            user.customer_id = customer.pk
+        return users
+
+    def create_orders(self, count, customer_ids, products, metals, pearls, max_lines):
+        rng = self.rng
+        statuses = [code for code, label in Order.STATUS_CHOICES]
+        today = date.today()
+        orders = bulk_create(Order, [
+            Order(customer_id=rng.choice(customer_ids), status=rng.choice(statuses), due_date=today + timedelta(days=rng.randint(-90, 60)))
+            for _ in range(count)
+        ])
+        for start in range(0, len(orders), BATCH_SIZE):
+            lines = []
+            for order in orders[start:start + BATCH_SIZE]:
+                for _ in range(rng.randint(1, max_lines)):
+                    product = rng.choice(products)
+                    lines.append(OrderLine(
+                        order_id=order.pk, product_id=product.pk, price=product.price, quantity=rng.randint(1, 3),
+                        hand=rng.choice('lr'), finger=rng.choice('timrp'), ring_size=str(rng.randint(15, 21)),
+                    ))
+            # the OrderLine manager refreshes the totals of every order in the batch
+            lines = bulk_create(OrderLine, lines)
+            MetalThrough, PearlThrough = OrderLine.metal_type.through, OrderLine.pearl.through
+            bulk_create(MetalThrough, [
+                MetalThrough(orderline_id=line.pk, metaltype_id=metal.pk)
+                for line in lines for metal in rng.sample(metals, rng.randint(1, 2))
+            ])
+            bulk_create(PearlThrough, [
+                PearlThrough(orderline_id=line.pk, pearl_id=rng.choice(pearls).pk)
+                for line in lines if rng.random() < 0.3
+            ])
+
+    def create_reviews(self, count, users, products):
+        rng = self.rng
+        bulk_create(ReviewProduct, [
+            ReviewProduct(customer_id=rng.choice(users).pk, product_id=rng.choice(products).pk, review=' '.join(rng.choices(WORDS, k=12)))
+            for _ in range(count)
+        ])
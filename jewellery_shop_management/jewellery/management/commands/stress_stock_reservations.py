@@ -0,0 +1,152 @@
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction, OperationalError
+from django.db.models import Sum
+from jewellery.benchmarking import summarize, format_summary
+from jewellery.models import Customer, Order, OrderLine, Pearl, Product, StockReservation
+from jewellery.stock import InsufficientStock, reserve_pearls
+
+
+USERNAME = 'stress_stock'
+
+
+def use_database(database):
+    if database:
+        connections['default'].settings_dict['NAME'] = database
+
+
+def run_worker(worker, database, line_id, pearl_ids, hold):
+    django.setup()
+    use_database(database)
+    line = OrderLine.objects.only('pk', 'quantity').get(pk=line_id)
+    samples, reserved, errors = [], 0, 0
+    # every worker goes after every parcel, rotated so they collide on different rows first
+    parcels = pearl_ids[worker % len(pearl_ids):] + pearl_ids[:worker % len(pearl_ids)]
+    while parcels:
+        pearl_id = parcels[0]
+        started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                reserve_pearls([(line, [pearl_id])])
+                time.sleep(hold)
+        except InsufficientStock:
+            parcels.pop(0)
+            continue
+        except OperationalError:
+            errors += 1
+            continue
+        samples.append(time.perf_counter() - started)
+        reserved += line.quantity
+    connections.close_all()
+    return samples, reserved, errors
+
+
+class Command(BaseCommand):
+    help = "Let concurrent workers reserve pearls until the parcels run out and check that nothing is oversold"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--parcels', type=int, default=3)
+        parser.add_argument('--stock', type=int, default=500, help="Pearls in each parcel")
+        parser.add_argument('--quantity', type=int, default=1, help="Pearls each reservation takes")
+        parser.add_argument('--hold', type=float, default=0, help="Seconds each reservation transaction stays open")
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['parcels'] < 1 or options['quantity'] < 1:
+            raise CommandError("--workers, --parcels and --quantity must be at least 1")
+        if connection.vendor != 'sqlite':
+            # PostgreSQL and the like: the configured database, cleaned up afterwards
+            with transaction.atomic():
+                fixtures = self.create_fixtures(options)
+            try:
+                self.report(connection.vendor, options, fixtures, self.run(None, fixtures, options))
+            finally:
+                with transaction.atomic():
+                    get_user_model().objects.filter(username=USERNAME).delete()
+                    Product.objects.filter(pk=fixtures['product']).delete()
+                    Pearl.objects.filter(pk__in=fixtures['pearls']).delete()
+            return
+        directory = tempfile.mkdtemp()
+        original = settings.DATABASES['default']['NAME']
+        try:
+            # a WAL copy, the stress data never reaches the real database
+            database = os.path.join(directory, 'stock.sqlite3')
+            self.copy_database(original, database)
+            connections.close_all()
+            use_database(database)
+            with transaction.atomic():
+                fixtures = self.create_fixtures(options)
+            self.report('sqlite wal', options, fixtures, self.run(database, fixtures, options))
+        finally:
+            connections.close_all()
+            use_database(original)
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def copy_database(self, source_path, path):
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(path)
+        try:
+            source.backup(target)
+            target.execute("PRAGMA journal_mode = wal")
+        finally:
+            source.close()
+            target.close()
+
+    def create_fixtures(self, options):
+        user = get_user_model().objects.create_user(USERNAME)
+        order = Order.objects.create(customer=Customer.objects.create(user=user, phone='0'))
+        product = Product.objects.create(name='Stress test pearl strand', price=1)
+        lines = [
+            OrderLine.objects.create(order=order, product=product, price=1, quantity=options['quantity'])
+            for _ in range(options['workers'])
+        ]
+        pearls = [
+            Pearl.objects.create(parcel=f'STRESS-{number}', shape='round', color='white', size='6mm', type_name='akoya', quantity=options['stock'])
+            for number in range(options['parcels'])
+        ]
+        return {'product': product.pk, 'lines': [line.pk for line in lines], 'pearls': [pearl.pk for pearl in pearls]}
+
+    def run(self, database, fixtures, options):
+        connections.close_all()
+        arguments = [
+            (worker, database, line_id, fixtures['pearls'], options['hold'])
+            for worker, line_id in enumerate(fixtures['lines'])
+        ]
+        started = time.perf_counter()
+        with multiprocessing.get_context().Pool(len(arguments)) as pool:
+            results = pool.starmap(run_worker, arguments)
+        return results, time.perf_counter() - started
+
+    def report(self, label, options, fixtures, run):
+        results, elapsed = run
+        samples = [sample for worker_samples, reserved, errors in results for sample in worker_samples]
+        reserved = sum(reserved for worker_samples, reserved, errors in results)
+        errors = sum(errors for worker_samples, reserved, errors in results)
+        pearls = Pearl.objects.filter(pk__in=fixtures['pearls'])
+        left = pearls.aggregate(left=Sum('quantity'))['left']
+        recorded = StockReservation.objects.filter(pearl__in=fixtures['pearls']).aggregate(taken=Sum('quantity'))['taken'] or 0
+        stock = options['stock'] * options['parcels']
+        self.stdout.write(self.style.MIGRATE_HEADING(label))
+        self.stdout.write(f"{format_summary('reservations', summarize(samples))} locked={errors}")
+        self.stdout.write(
+            f"{len(samples) / elapsed if elapsed else 0:.1f} reservations/s with {options['workers']} workers, "
+            f"{reserved} of {stock} pearls reserved, {left} left"
+        )
+        problems = []
+        if pearls.filter(quantity__lt=0).exists() or reserved + left != stock:
+            problems.append(f"stock does not add up: {reserved} reserved + {left} left != {stock}")
+        if recorded != reserved:
+            problems.append(f"{recorded} pearls in reservations, the workers reserved {reserved}")
+        if pearls.filter(quantity__gte=options['quantity']).exists():
+            problems.append("workers stopped before the parcels ran out")
+        if problems:
+            raise CommandError('; '.join(problems))
+        self.stdout.write(self.style.SUCCESS("No overselling"))
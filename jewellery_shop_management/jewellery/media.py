@@ -0,0 +1,154 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from . models import ImageRendition, OrderLine
+
+
+MEDIA_MAX_AGE = 60 * 60 * 24
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+ORDER_FILE_FIELDS = ('photo', 'engraving_file')
+
+
+def order_file_prefixes():
+    return {f"{OrderLine._meta.get_field(name).upload_to.rstrip('/')}/": name for name in ORDER_FILE_FIELDS}
+
+
+def rendition_prefix():
+    return f"{ImageRendition.file.field.upload_to}/"
+
+
+def owning_field(path):
+    """The OrderLine field a media path belongs to, renditions included, or None for public files."""
+    if path.startswith(rendition_prefix()):
+        path = path[len(rendition_prefix()):]
+    return next((field for prefix, field in order_file_prefixes().items() if path.startswith(prefix)), None)
+
+
+def can_access(request, path):
+    field = owning_field(path)
+    if field is None or request.user.is_staff:
+        return True
+    if not request.user.is_authenticated:
+        return False
+    if path.startswith(rendition_prefix()):
+        path = ImageRendition.objects.filter(file=path).values_list('source', flat=True).first()
+    return OrderLine.objects.filter(**{field: path}, order__customer__user_id=request.user.pk).exists()
+
+
+def byte_range(header, size):
+    """The inclusive ``(start, end)`` of a single ``bytes=`` range, or None to send the whole file.
+
+    Several ranges or a malformed header get the whole file, which RFC 9110
+    allows. Raises ValueError when the range cannot be satisfied.
+    """
+    match = RANGE.match(header.replace(' ', ''))
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        if not int(last) or not size:
+            raise ValueError(header)
+        return max(0, size - int(last)), size - 1
+    start = int(first)
+    if start >= size:
+        raise ValueError(header)
+    end = min(int(last), size - 1) if last else size - 1
+    return (start, end) if end >= start else None
+
+
+class RangeFile:
+    """A window onto an open file, positioned at its start.
+
+    Keeps ``fileno()`` so WSGI servers with a sendfile() file wrapper can
+    still send it without copying; they stop at the Content-Length.
+    """
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def sendfile_response(path, content_type):
+    """Leaves the body to the front proxy, which also answers Range requests itself."""
+    header = settings.MEDIA_SENDFILE_HEADER
+    response = HttpResponse(content_type=content_type)
+    if header == 'X-Accel-Redirect':
+        response[header] = f"{settings.MEDIA_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{quote(path)}"
+    else:
+        response[header] = safe_join(settings.MEDIA_ROOT, path)
+    return response
+
+
+def file_response(request, path, full_path, size, validators):
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if getattr(settings, 'MEDIA_SENDFILE_HEADER', None):
+        return sendfile_response(path, content_type)
+    span = None
+    if 'Range' in request.headers and request.headers.get('If-Range', validators[0]) in validators:
+        try:
+            span = byte_range(request.headers['Range'], size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f"bytes */{size}"
+            return response
+    handle = open(full_path, 'rb')
+    if span is None:
+        # FileResponse hands the open file to wsgi.file_wrapper, which sendfile()s it
+        return FileResponse(handle, content_type=content_type)
+    start, end = span
+    handle.seek(start)
+    response = FileResponse(RangeFile(handle, end - start + 1), status=206, content_type=content_type)
+    response['Content-Length'] = end - start + 1
+    response['Content-Range'] = f"bytes {start}-{end}/{size}"
+    return response
+
+
+def serve_media(request, path):
+    """Serves MEDIA_ROOT without reading files into memory, with Range and conditional requests.
+
+    Order photos and engraving files, and their renditions, are only served
+    to staff and to the customer who placed the order.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    # the checks below must see the file that is opened: ./, ../ and // are resolved first
+    path = os.path.relpath(full_path, os.path.abspath(settings.MEDIA_ROOT)).replace(os.sep, '/')
+    if not os.path.isfile(full_path) or not can_access(request, path):
+        # a private file is not admitted to exist
+        raise Http404
+    stat = os.stat(full_path)
+    etag = quote_etag(f"{stat.st_size:x}-{stat.st_mtime_ns:x}")
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = file_response(request, path, full_path, stat.st_size, (etag, http_date(last_modified)))
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    if owning_field(path):
+        response['Cache-Control'] = 'private, no-cache'
+    else:
+        response['Cache-Control'] = f"public, max-age={getattr(settings, 'MEDIA_MAX_AGE', MEDIA_MAX_AGE)}"
+    return response
@@ -0,0 +1,185 @@
+import atexit
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from . throttling import client_ip
+
+
+HISTOGRAMS = {
+    'request_duration_seconds': ("Total time spent in the view, middleware and rendering", (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)),
+    'db_duration_seconds': ("Time spent executing SQL per request", (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)),
+    'db_queries': ("SQL queries executed per request", (0, 1, 2, 5, 10, 20, 50, 100, 200)),
+    'template_duration_seconds': ("Time spent rendering the TemplateResponse per request", (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)),
+}
+COUNTERS = {
+    'page_cache_requests_total': ("Requests to cached pages by result: hit, miss, not_modified or skip", 'result'),
+}
+PREFIX = 'jewellery_'
+FLUSH_INTERVAL = 5
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+
+def metrics_dir():
+    return str(getattr(settings, 'METRICS_DIR', None) or os.path.join(tempfile.gettempdir(), 'jewellery_metrics'))
+
+
+def snapshot_pid(path):
+    try:
+        return int(os.path.basename(path)[len('metrics-'):-len('.json')])
+    except ValueError:
+        return None
+
+
+def pid_alive(pid):
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # alive, owned by another user
+        return True
+    return True
+
+
+class Registry:
+    """Histograms and counters of this process, written to a per-pid snapshot file every few seconds.
+
+    Each worker process only ever writes its own file, so no locking between
+    processes is needed; the metrics endpoint sums the snapshots of the live
+    processes. A process removes its file when it exits, the files of killed
+    ones are pruned when the endpoint finds their pid gone.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.series = {}
+        self.flushed_at = 0.0
+        atexit.register(self.remove)
+
+    def check_fork(self):
+        if os.getpid() != self.pid:
+            # forked after import, the parent's samples are not ours to report
+            self.pid, self.series = os.getpid(), {}
+
+    def observe(self, view, values):
+        with self.lock:
+            self.check_fork()
+            for name, value in values.items():
+                buckets = HISTOGRAMS[name][1]
+                series = self.series.setdefault(f"{name}|{view}", [[0] * (len(buckets) + 1), 0.0, 0])
+                series[0][bisect_left(buckets, value)] += 1
+                series[1] += value
+                series[2] += 1
+        if time.monotonic() - self.flushed_at > FLUSH_INTERVAL:
+            self.flush()
+
+    def increment(self, name, view, label):
+        with self.lock:
+            self.check_fork()
+            # same shape as a histogram without buckets, so snapshots merge alike
+            self.series.setdefault(f"{name}|{view}|{label}", [[], 0.0, 0])[2] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return json.loads(json.dumps(self.series))
+
+    def path(self):
+        return os.path.join(metrics_dir(), f"metrics-{self.pid}.json")
+
+    def flush(self):
+        self.flushed_at = time.monotonic()
+        directory = metrics_dir()
+        os.makedirs(directory, exist_ok=True)
+        handle, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(handle, 'w') as snapshot_file:
+            json.dump(self.snapshot(), snapshot_file)
+        os.replace(temporary, self.path())
+
+    def remove(self):
+        # a forked child that never observed anything still carries the parent's pid
+        if os.getpid() != self.pid:
+            return
+        try:
+            os.remove(self.path())
+        except OSError:
+            pass
+
+    def collect(self):
+        """Sums the snapshots of every process, using the live series for this one."""
+        merged = {}
+        own = self.path()
+        sources = [self.snapshot()]
+        for path in glob.glob(os.path.join(metrics_dir(), 'metrics-*.json')):
+            if path == own:
+                continue
+            if not pid_alive(snapshot_pid(path)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(path) as snapshot_file:
+                    sources.append(json.load(snapshot_file))
+            except (OSError, ValueError):
+                continue
+        for source in sources:
+            for key, (counts, total, count) in source.items():
+                series = merged.setdefault(key, [[0] * len(counts), 0.0, 0])
+                series[0] = [a + b for a, b in zip(series[0], counts)]
+                series[1] += total
+                series[2] += count
+        return merged
+
+
+registry = Registry()
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(series):
+    lines = []
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        metric = f"{PREFIX}{name}"
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} histogram")
+        for key in sorted(key for key in series if key.split('|', 1)[0] == name):
+            counts, total, count = series[key]
+            view = escape_label(key.split('|', 1)[1])
+            cumulative = 0
+            for bound, bucket_count in zip([*map(str, buckets), '+Inf'], counts):
+                cumulative += bucket_count
+                lines.append(f'{metric}_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{view="{view}"}} {total}')
+            lines.append(f'{metric}_count{{view="{view}"}} {count}')
+    for name, (help_text, label_name) in COUNTERS.items():
+        metric = f"{PREFIX}{name}"
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        for key in sorted(key for key in series if key.split('|', 1)[0] == name):
+            view, label = (escape_label(part) for part in key.split('|', 2)[1:])
+            lines.append(f'{metric}{{view="{view}",{label_name}="{label}"}} {series[key][2]}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        allowed = request.headers.get('Authorization') == f"Bearer {token}"
+    else:
+        allowed = client_ip(request) in LOCAL_ADDRESSES
+    if not (allowed or request.user.is_staff):
+        raise PermissionDenied
+    return HttpResponse(render_prometheus(registry.collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import mimetypes
+import os
+import re
+import time
+from contextvars import ContextVar
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from . metrics import registry
+from . staticfiles import ENCODINGS
+
+
+logger = logging.getLogger('jewellery.metrics')
+
+STATIC_MAX_AGE = 60
+STATIC_IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+# the content hash ManifestStaticFilesStorage puts before the extension
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+NO_QUALITY = re.compile(r'q=0(\.0*)?$')
+
+# context variables follow a request into sync_to_async threads, unlike a per-connection wrapper
+_current_timer = ContextVar('jewellery_query_timer', default=None)
+
+
+class QueryTimer:
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+def time_query(execute, sql, params, many, context):
+    """Execute wrapper installed on every connection; cheap when no request is being timed."""
+    timer = _current_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.duration += time.perf_counter() - started
+        timer.count += 1
+
+
+def instrument_connection(connection):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+class RequestMetricsMiddleware:
+    """Times SQL, template rendering and the whole request.
+
+    The timings go out as a ``Server-Timing`` header and into per view
+    histograms served by ``jewellery.metrics.metrics_view``.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # lets Django call this middleware without a thread under ASGI
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        started, timer = time.perf_counter(), QueryTimer()
+        token = _current_timer.set(timer)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_timer.reset(token)
+        return self.record(request, response, started, timer)
+
+    async def __acall__(self, request):
+        started, timer = time.perf_counter(), QueryTimer()
+        token = _current_timer.set(timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_timer.reset(token)
+        return self.record(request, response, started, timer)
+
+    def record(self, request, response, started, queries):
+        duration = time.perf_counter() - started
+        template = getattr(request, '_template_duration', 0.0)
+        match = request.resolver_match
+        view = match.view_name if match else '<unresolved>'
+        registry.observe(view, {
+            'request_duration_seconds': duration,
+            'db_duration_seconds': queries.duration,
+            'db_queries': queries.count,
+            'template_duration_seconds': template,
+        })
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={queries.duration * 1000:.1f};desc="{queries.count} queries"',
+            f'tpl;dur={template * 1000:.1f}',
+            f'total;dur={duration * 1000:.1f}',
+        ))
+        threshold = getattr(settings, 'METRICS_SLOW_REQUEST_MS', None)
+        if threshold is not None and duration * 1000 >= threshold:
+            logger.warning(
+                "Slow request %s %s (%s): %.0fms, %d queries in %.0fms, template %.0fms",
+                request.method, request.get_full_path(), view, duration * 1000, queries.count, queries.duration * 1000, template * 1000,
+            )
+        return response
+
+    def process_template_response(self, request, response):
+        # the outermost middleware runs last, right before the handler renders the response
+        render_started = time.perf_counter()
+
+        def rendered(response):
+            request._template_duration = time.perf_counter() - render_started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+def accepted_encodings(header):
+    accepted = set()
+    for item in header.split(','):
+        coding, _, parameters = item.partition(';')
+        if not NO_QUALITY.match(parameters.strip().replace(' ', '')):
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticFilesMiddleware:
+    """Serves STATIC_ROOT ahead of the rest of the stack, preferring the precompressed variants.
+
+    Hashed names are cached for a year as immutable, other names revalidate
+    against their modification time. Sits first in MIDDLEWARE so asset
+    requests skip sessions, CSRF and the request metrics.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        response = self.serve(request)
+        return self.get_response(request) if response is None else response
+
+    async def __acall__(self, request):
+        # a few stat() calls, cheaper than a hop to a thread
+        response = self.serve(request)
+        return await self.get_response(request) if response is None else response
+
+    def find(self, name):
+        try:
+            path = safe_join(settings.STATIC_ROOT, name)
+        except SuspiciousFileOperation:
+            return None
+        if os.path.isfile(path):
+            return path
+        if settings.DEBUG:
+            # uncollected app files, as runserver would serve them
+            return finders.find(name)
+        return None
+
+    def serve(self, request):
+        if request.method not in ('GET', 'HEAD') or not self.prefix.startswith('/') or not request.path.startswith(self.prefix):
+            return None
+        name = request.path[len(self.prefix):]
+        path = self.find(name) if name else None
+        if path is None:
+            return None
+        modified = int(os.stat(path).st_mtime)
+        if HASHED_NAME.search(name):
+            cache_control = f"public, max-age={STATIC_IMMUTABLE_MAX_AGE}, immutable"
+        else:
+            cache_control = f"public, max-age={getattr(settings, 'STATIC_MAX_AGE', STATIC_MAX_AGE)}"
+        response = get_conditional_response(request, last_modified=modified)
+        if response is None:
+            accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+            variants = [(coding, path + suffix) for coding, suffix in ENCODINGS.items() if os.path.isfile(path + suffix)]
+            coding, served = next(((coding, variant) for coding, variant in variants if coding in accepted), (None, path))
+            content_type, encoding = mimetypes.guess_type(name)
+            response = FileResponse(open(served, 'rb'), content_type=content_type or 'application/octet-stream')
+            # named after the variant otherwise, and an asset is never a download
+            del response['Content-Disposition']
+            if coding:
+                response['Content-Encoding'] = coding
+            if variants:
+                response['Vary'] = 'Accept-Encoding'
+            response['Last-Modified'] = http_date(modified)
+        response['Cache-Control'] = cache_control
+        return response
@@ -0,0 +1,39 @@
+from django.db import migrations, OperationalError
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS jewellery_product_fts "
+            "USING fts5(name, jewellery_type, categories, tokenize='unicode61 remove_diacritics 2')"
+        )
+    except OperationalError:
+        # SQLite built without FTS5, search falls back to icontains lookups
+        return
+    schema_editor.execute("""
+        INSERT INTO jewellery_product_fts (rowid, name, jewellery_type, categories)
+        SELECT product.id, product.name, COALESCE(jewellery_type.name, ''), COALESCE(GROUP_CONCAT(category.name, ' '), '')
+        FROM jewellery_product product
+        LEFT JOIN jewellery_jewellerytype jewellery_type ON jewellery_type.id = product.jewellery_type_id
+        LEFT JOIN jewellery_product_category product_category ON product_category.product_id = product.id
+        LEFT JOIN jewellery_category category ON category.id = product_category.category_id
+        GROUP BY product.id
+    """)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS jewellery_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jewellery', '0010_orderline_restoration'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
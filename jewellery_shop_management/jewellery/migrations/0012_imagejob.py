@@ -0,0 +1,44 @@
+# Generated by Django 4.1.3 on 2026-10-18 06:50
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jewellery', '0011_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('app_label', models.CharField(max_length=100, verbose_name='app label')),
+                ('model_name', models.CharField(max_length=100, verbose_name='model name')),
+                ('object_id', models.BigIntegerField(verbose_name='object ID')),
+                ('field_name', models.CharField(max_length=100, verbose_name='field name')),
+                ('file_name', models.CharField(max_length=255, verbose_name='file name')),
+                ('status', models.CharField(choices=[('q', 'queued'), ('r', 'running'), ('d', 'done'), ('f', 'failed')], default='q', max_length=1, verbose_name='status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='attempts')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='run after')),
+                ('last_error', models.TextField(blank=True, verbose_name='last error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated at')),
+            ],
+            options={
+                'verbose_name': 'image job',
+                'verbose_name_plural': 'image jobs',
+                'ordering': ['run_after'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='imagejob',
+            index=models.Index(fields=['status', 'run_after'], name='jewellery_i_status_be625b_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='imagejob',
+            constraint=models.UniqueConstraint(fields=('app_label', 'model_name', 'object_id', 'field_name', 'file_name'), name='unique_image_job_per_file'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.1.3 on 2026-10-18 06:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jewellery', '0013_imagerendition'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'due_date'], name='order_status_due_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['customer', 'date'], name='order_customer_date_idx'),
+        ),
+    ]
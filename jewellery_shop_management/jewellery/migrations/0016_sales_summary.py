@@ -0,0 +1,45 @@
+# Generated by Django 4.1.3 on 2026-10-18 07:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jewellery', '0015_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='month')),
+                ('dimension', models.CharField(choices=[('total', 'all sales'), ('status', 'order status'), ('category', 'category'), ('jewellery_type', 'jewellery type'), ('metal_type', 'metal type')], max_length=20, verbose_name='dimension')),
+                ('key', models.CharField(blank=True, max_length=40, verbose_name='key')),
+                ('label', models.CharField(blank=True, max_length=100, verbose_name='label')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='revenue')),
+                ('quantity', models.IntegerField(default=0, verbose_name='quantity')),
+                ('line_count', models.PositiveIntegerField(default=0, verbose_name='lines')),
+                ('order_count', models.PositiveIntegerField(default=0, verbose_name='orders')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated at')),
+            ],
+            options={
+                'verbose_name': 'sales summary',
+                'verbose_name_plural': 'sales summaries',
+                'ordering': ['-month', 'dimension', 'label'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['date'], name='order_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salessummary',
+            index=models.Index(fields=['dimension', 'month'], name='jewellery_s_dimensi_8befea_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='salessummary',
+            constraint=models.UniqueConstraint(fields=('month', 'dimension', 'key'), name='unique_sales_summary_row'),
+        ),
+    ]
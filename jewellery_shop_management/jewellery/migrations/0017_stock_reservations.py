@@ -0,0 +1,60 @@
+# Generated by Django 4.1.3 on 2026-10-18 07:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jewellery', '0016_sales_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=0, verbose_name='quantity')),
+                ('weight', models.DecimalField(blank=True, decimal_places=3, max_digits=10, null=True, verbose_name='weight (g)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+                ('released_at', models.DateTimeField(blank=True, null=True, verbose_name='released at')),
+            ],
+            options={
+                'verbose_name': 'stock reservation',
+            },
+        ),
+        migrations.AddField(
+            model_name='metaltype',
+            name='stock_weight',
+            field=models.DecimalField(blank=True, decimal_places=3, help_text='Leave empty when the stock of this metal is not tracked', max_digits=10, null=True, verbose_name='stock weight (g)'),
+        ),
+        migrations.AddField(
+            model_name='pearl',
+            name='quantity',
+            field=models.PositiveIntegerField(blank=True, help_text='Leave empty when the stock of this parcel is not tracked', null=True, verbose_name='in stock'),
+        ),
+        migrations.AddConstraint(
+            model_name='metaltype',
+            constraint=models.CheckConstraint(check=models.Q(('stock_weight__gte', 0)), name='metal_type_stock_weight_not_negative'),
+        ),
+        migrations.AddField(
+            model_name='stockreservation',
+            name='line',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_reservations', to='jewellery.orderline', verbose_name='order line'),
+        ),
+        migrations.AddField(
+            model_name='stockreservation',
+            name='metal_type',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='jewellery.metaltype', verbose_name='metal type'),
+        ),
+        migrations.AddField(
+            model_name='stockreservation',
+            name='pearl',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='jewellery.pearl', verbose_name='pearl'),
+        ),
+        migrations.AddConstraint(
+            model_name='stockreservation',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(('metal_type__isnull', True), ('pearl__isnull', False)), models.Q(('metal_type__isnull', False), ('pearl__isnull', True)), _connector='OR'), name='stock_reservation_one_item'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.1.3 on 2026-10-18 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def delete_metal_reservations(apps, schema_editor):
+    # metal stock was never reserved by the app, only pearl reservations are kept
+    apps.get_model('jewellery', 'StockReservation').objects.filter(pearl__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jewellery', '0018_email_outbox'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='metaltype',
+            name='metal_type_stock_weight_not_negative',
+        ),
+        migrations.RemoveConstraint(
+            model_name='stockreservation',
+            name='stock_reservation_one_item',
+        ),
+        migrations.RunPython(delete_metal_reservations, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='metaltype',
+            name='stock_weight',
+        ),
+        migrations.RemoveField(
+            model_name='stockreservation',
+            name='metal_type',
+        ),
+        migrations.RemoveField(
+            model_name='stockreservation',
+            name='weight',
+        ),
+        migrations.AlterField(
+            model_name='stockreservation',
+            name='pearl',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='jewellery.pearl', verbose_name='pearl'),
+        ),
+    ]
@@ -1,10 +1,17 @@
-from django.db import models
+from django.db import models, transaction
+from django.dispatch import Signal
+from django.db.models import F, Q, Sum, Subquery, OuterRef, Value, ExpressionWrapper, Case, When
+from django.db.models.functions import Coalesce
+from . tracking import TrackedFieldsMixin
 import uuid
-from PIL import Image
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from django.utils import timezone
 from django.utils.timezone import datetime, timedelta
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from django.template.loader import render_to_string
 from django.utils.html import format_html
 from datetime import date
 
@@ -12,12 +19,113 @@ from datetime import date
 User = get_user_model()
 
 
+class ImageJob(models.Model):
+    STATUS_CHOICES = (
+        ('q', _('queued')),
+        ('r', _('running')),
+        ('d', _('done')),
+        ('f', _('failed')),
+    )
+    app_label = models.CharField(_("app label"), max_length=100)
+    model_name = models.CharField(_("model name"), max_length=100)
+    object_id = models.BigIntegerField(_("object ID"))
+    field_name = models.CharField(_("field name"), max_length=100)
+    file_name = models.CharField(_("file name"), max_length=255)
+    status = models.CharField(_("status"), max_length=1, choices=STATUS_CHOICES, default='q')
+    attempts = models.PositiveIntegerField(_("attempts"), default=0)
+    run_after = models.DateTimeField(_("run after"), default=timezone.now)
+    last_error = models.TextField(_("last error"), blank=True)
+    created_at = models.DateTimeField(_("created at"), auto_now_add=True)
+    updated_at = models.DateTimeField(_("updated at"), auto_now=True)
+
+    class Meta:
+        ordering = ['run_after']
+        verbose_name = _('image job')
+        verbose_name_plural = _('image jobs')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['app_label', 'model_name', 'object_id', 'field_name', 'file_name'],
+                name='unique_image_job_per_file',
+            ),
+        ]
+        indexes = [models.Index(fields=['status', 'run_after'])]
+
+    def __str__(self) -> str:
+        return f"{self.app_label}.{self.model_name} {self.object_id} {self.file_name} ({self.get_status_display()})"
+
+    @classmethod
+    def enqueue(cls, instance, field_name):
+        job, created = cls.objects.get_or_create(
+            app_label=instance._meta.app_label,
+            model_name=instance._meta.model_name,
+            object_id=instance.pk,
+            field_name=field_name,
+            file_name=getattr(instance, field_name).name,
+        )
+        return job
+
+
+class EmailOutbox(models.Model):
+    """Emails written in the transaction that causes them and sent later by dispatch_outbox."""
+    STATUS_CHOICES = (
+        ('q', _('queued')),
+        ('s', _('sending')),
+        ('d', _('sent')),
+        ('f', _('failed')),
+    )
+    dedup_key = models.CharField(_("deduplication key"), max_length=200, unique=True)
+    recipient = models.EmailField(_("recipient"))
+    subject = models.CharField(_("subject"), max_length=255)
+    body = models.TextField(_("body"))
+    status = models.CharField(_("status"), max_length=1, choices=STATUS_CHOICES, default='q')
+    attempts = models.PositiveIntegerField(_("attempts"), default=0)
+    run_after = models.DateTimeField(_("run after"), default=timezone.now)
+    last_error = models.TextField(_("last error"), blank=True)
+    sent_at = models.DateTimeField(_("sent at"), blank=True, null=True)
+    created_at = models.DateTimeField(_("created at"), auto_now_add=True)
+    updated_at = models.DateTimeField(_("updated at"), auto_now=True)
+
+    class Meta:
+        ordering = ['run_after']
+        verbose_name = _('outgoing email')
+        verbose_name_plural = _('outgoing emails')
+        indexes = [models.Index(fields=['status', 'run_after'])]
+
+    def __str__(self) -> str:
+        return f"{self.recipient}: {self.subject} ({self.get_status_display()})"
+
+
+class ImageRendition(models.Model):
+    FORMAT_CHOICES = (
+        ('jpeg', 'JPEG'),
+        ('webp', 'WebP'),
+    )
+    source = models.CharField(_("source file"), max_length=255, db_index=True)
+    width = models.PositiveIntegerField(_("width"))
+    height = models.PositiveIntegerField(_("height"))
+    format = models.CharField(_("format"), max_length=4, choices=FORMAT_CHOICES)
+    file = models.FileField(_("file"), upload_to='renditions', max_length=255)
+    created_at = models.DateTimeField(_("created at"), auto_now_add=True)
+
+    class Meta:
+        ordering = ['source', 'format', 'width']
+        verbose_name = _('image rendition')
+        verbose_name_plural = _('image renditions')
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'format', 'width'], name='unique_rendition_per_source'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.source} {self.width}w {self.format}"
+
+
 class Pearl(models.Model):
     parcel = models.CharField(_("parcel"), max_length = 30)
     shape = models.CharField(_("shape"), max_length = 30)
     color = models.CharField(_("color"), max_length = 30)
     size = models.CharField(_("size"), max_length = 30)
     type_name = models.CharField(_("type name"), max_length = 30)
+    quantity = models.PositiveIntegerField(_("in stock"), blank=True, null=True, help_text=_("Leave empty when the stock of this parcel is not tracked"))
 
     def __str__(self) -> str:
         return f"{self.color} {self.type_name} {self.size}"
@@ -61,21 +169,21 @@ class Category(models.Model):
         link = reverse('products')+'?category_id='+str(self.id)
         return format_html('<a class="category" href="{link}">{name}</a>', link=link, name=self.name)
 
-class Product(models.Model):
+class Product(TrackedFieldsMixin, models.Model):
     category = models.ManyToManyField(Category, verbose_name=_("category(-ies)"), help_text=_("Choose category(-ies) for this product"))
     name = models.CharField(_("product name"), max_length = 100)
     price = models.DecimalField(_("product price"), max_digits=18, decimal_places=2)
     image = models.ImageField(_("product image"), upload_to='product_images', blank=True, null=True)
     jewellery_type = models.ForeignKey(JewelleryType, verbose_name=_("jewellery type"), on_delete=models.CASCADE, blank=True, null=True)
+    updated_at = models.DateTimeField(_("updated at"), auto_now=True)
+
+    tracked_fields = ('image', 'jewellery_type')
 
     def save(self, *args, **kwargs):
+        image_changed = self.has_changed('image')
         super().save(*args, **kwargs)
-        if self.image:
-            image = Image.open(self.image.path)
-            if image.width > 500 or image.height > 500:
-                output_size = (500, 500)
-                image.thumbnail(output_size)
-                image.save(self.image.path)
+        if self.image and image_changed:
+            ImageJob.enqueue(self, 'image')
 
     def display_category(self) -> str:
         return ', '.join(category.name for category in self.category.all())
@@ -97,7 +205,95 @@ def get_due_date():
         return date.today() + timedelta(days=30)
 
 
-class Order(models.Model):
+_pending_order_totals = ContextVar('pending_order_totals', default=None)
+
+# sent with the ids of the orders whose lines changed, once their totals are refreshed
+order_lines_changed = Signal()
+# sent by OrderQuerySet.update() with the new status and {order id: previous status} of the orders it changed
+order_statuses_updated = Signal()
+
+
+@contextmanager
+def defer_order_totals():
+    """Collects the orders touched inside the block and refreshes their totals once on exit."""
+    if _pending_order_totals.get() is not None:
+        yield
+        return
+    pending = set()
+    token = _pending_order_totals.set(pending)
+    try:
+        yield
+    finally:
+        _pending_order_totals.reset(token)
+    if pending:
+        Order.objects.filter(pk__in=pending).refresh_totals()
+        order_lines_changed.send(sender=Order, order_ids=pending)
+
+
+def refresh_order_totals(order_ids):
+    order_ids = {order_id for order_id in order_ids if order_id is not None}
+    pending = _pending_order_totals.get()
+    if pending is not None:
+        pending.update(order_ids)
+    elif order_ids:
+        Order.objects.filter(pk__in=order_ids).refresh_totals()
+        order_lines_changed.send(sender=Order, order_ids=order_ids)
+
+
+def line_total_expression():
+    return ExpressionWrapper(F('quantity') * F('price'), output_field=models.DecimalField(max_digits=18, decimal_places=2))
+
+
+def order_line_total():
+    line_totals = OrderLine.objects.filter(order=OuterRef('pk')).order_by().values('order') \
+        .annotate(line_total=Sum(line_total_expression())).values('line_total')
+    return Coalesce(Subquery(line_totals), Value(0), output_field=models.DecimalField(max_digits=18, decimal_places=2))
+
+
+class OrderQuerySet(models.QuerySet):
+
+    def with_line_total(self):
+        return self.annotate(line_total=order_line_total())
+
+    def queue_ready_emails(self):
+        """Writes the ready for pick up email of each order to the outbox; the dedup key keeps it to one per order."""
+        emails = [order.ready_email() for order in self.select_related('customer__user') if order.customer.user.email]
+        return EmailOutbox.objects.bulk_create(emails, ignore_conflicts=True)
+
+    def update(self, **kwargs):
+        # update() skips auto_now, the conditional GET validators rely on updated_at moving with every change
+        kwargs.setdefault('updated_at', timezone.now())
+        if 'status' not in kwargs:
+            return super().update(**kwargs)
+        status = kwargs['status']
+        # the outbox rows and the stock moved by the receivers commit or roll back with the status change
+        with transaction.atomic(using=self.db):
+            previous = dict(self.exclude(status=status).select_for_update().values_list('pk', 'status'))
+            rows = super().update(**kwargs)
+            if status == 'd':
+                Order.objects.filter(pk__in=previous).queue_ready_emails()
+            if previous:
+                order_statuses_updated.send(sender=Order, status=status, previous=previous)
+        return rows
+    update.alters_data = True
+
+    def refresh_totals(self):
+        return self.update(total=order_line_total())
+
+    def overdue_condition(self, today=None):
+        return Q(status__in=Order.OPEN_STATUSES, due_date__lt=today or date.today())
+
+    def with_overdue(self, today=None):
+        return self.annotate(overdue=Case(
+            When(self.overdue_condition(today), then=Value(True)),
+            default=Value(False), output_field=models.BooleanField(),
+        ))
+
+    def overdue(self, today=None):
+        return self.filter(self.overdue_condition(today))
+
+
+class Order(TrackedFieldsMixin, models.Model):
     STATUS_CHOICES = (
         ('n', _('new - not approved')),
         ('a', _('advance payment taken - approved')),
@@ -108,44 +304,104 @@ class Order(models.Model):
         ('c', _('cancelled')),
         ('f', _('fully paid')),
     )
+    # picked up, cancelled and fully paid orders are finished and can no longer be late
+    OPEN_STATUSES = ('n', 'a', 'b', 'm', 'd')
     status = models.CharField(_('status'), max_length=1, choices=STATUS_CHOICES, default='n')
     date = models.DateField(_("order date"), auto_now_add=True)
     total = models.DecimalField(_("total amount"), max_digits=18, decimal_places=2, default=0)
     customer = models.ForeignKey(Customer, verbose_name=_("customer"), on_delete=models.CASCADE)
     due_date = models.DateField(_('due date'), default=get_due_date)
+    updated_at = models.DateTimeField(_("updated at"), auto_now=True)
+
+    objects = OrderQuerySet.as_manager()
+
+    tracked_fields = ('status', 'total')
 
     @property
     def is_overdue(self):
-        if self.due_date and self.due_date < datetime.date(datetime.now()):
+        if self.status in self.OPEN_STATUSES and self.due_date and self.due_date < date.today():
             return True
         return False
 
     class Meta:
         ordering = ['due_date']
+        indexes = [
+            models.Index(fields=['status', 'due_date'], name='order_status_due_date_idx'),
+            models.Index(fields=['customer', 'date'], name='order_customer_date_idx'),
+            models.Index(fields=['date'], name='order_date_idx'),
+        ]
 
     def get_total(self):
-        total = 0
-        for line in self.order_lines.all():
-            total += line.total
-        return total
-
-    # def save(self, *args, **kwargs ):
-    #     if not self._state.adding:
-    #         old = self.get_object(id=self.id)
-    #         if old.status != self.status and self.status == 'd':
-    #             print('siusti maila')
-    #     super().save(*args, **kwargs)
-     
+        return self.order_lines.aggregate(total=Coalesce(Sum(line_total_expression()), Value(0), output_field=self._meta.get_field('total')))['total']
+
+    def ready_email(self):
+        context = {'order': self, 'customer': self.customer}
+        return EmailOutbox(
+            dedup_key=f"order-ready:{self.pk}",
+            recipient=self.customer.user.email,
+            subject=render_to_string('jewellery/email/order_ready_subject.txt', context).strip(),
+            body=render_to_string('jewellery/email/order_ready.txt', context),
+        )
+
+    def save(self, *args, **kwargs):
+        if kwargs.get('update_fields') is None and not self._state.adding and not self.has_changed('total'):
+            # the lines keep total in step in the database, a copy loaded before they changed must not write it back
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields if not field.primary_key and field.name != 'total']
+        update_fields = kwargs.get('update_fields')
+        status_changed = self.has_changed('status') and (update_fields is None or 'status' in update_fields)
+        becoming_done = status_changed and self.status == 'd'
+        # cancelling releases the stock and reopening takes it again, in the post_save receivers
+        moves_stock = status_changed and 'c' in (self.status, self.loaded_value('status'))
+        if not (becoming_done or moves_stock):
+            return super().save(*args, **kwargs)
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+            if becoming_done:
+                Order.objects.filter(pk=self.pk).queue_ready_emails()
 
     def __str__(self) -> str:
         return f"{self.customer} - {self.due_date} - {self.total}"
 
-    # @classmethod
-    # def get_object(cls, id):
-    #     return cls.objects.get(id=id)
-
 
-class OrderLine(models.Model):
+class OrderLineQuerySet(models.QuerySet):
+    """Keeps Order.total in step for the bulk operations that bypass OrderLine.save()."""
+
+    def order_ids(self):
+        return set(self.order_by().values_list('order_id', flat=True).distinct())
+
+    def update(self, **kwargs):
+        order_ids = self.order_ids()
+        rows = super().update(**kwargs)
+        new_order = kwargs.get('order', kwargs.get('order_id'))
+        if new_order is not None:
+            order_ids.add(getattr(new_order, 'pk', new_order))
+        refresh_order_totals(order_ids)
+        return rows
+    update.alters_data = True
+
+    def delete(self):
+        with defer_order_totals():
+            refresh_order_totals(self.order_ids())
+            return super().delete()
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        refresh_order_totals(obj.order_id for obj in objs)
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        rows = super().bulk_update(objs, fields, *args, **kwargs)
+        if {'quantity', 'price', 'order', 'order_id'} & set(fields):
+            order_ids = {obj.order_id for obj in objs}
+            order_ids.update(obj.loaded_value('order') for obj in objs)
+            refresh_order_totals(order_ids)
+        return rows
+    bulk_update.alters_data = True
+
+
+class OrderLine(TrackedFieldsMixin, models.Model):
     unique_id = models.UUIDField(_('unique ID'), default=uuid.uuid4, editable=False)
     order = models.ForeignKey(Order, verbose_name=_("order"), on_delete=models.CASCADE, related_name="order_lines")
     product = models.ForeignKey(Product, verbose_name=_("product"), on_delete=models.CASCADE, related_name="order_lines")
@@ -175,6 +431,11 @@ class OrderLine(models.Model):
     engraving_file = models.FileField(_("engraving file"), upload_to='engraving_files', blank=True, null=True)
     certificate = models.CharField(_('certificate'), max_length=20, blank=True, null=True)
     restoration = models.DateField(_("restoration date"), blank=True, null=True)
+    updated_at = models.DateTimeField(_("updated at"), auto_now=True)
+
+    objects = OrderLineQuerySet.as_manager()
+
+    tracked_fields = ('order', 'photo', 'quantity')
 
     @property
     def total(self):
@@ -184,15 +445,15 @@ class OrderLine(models.Model):
         return f"{self.product} {self.quantity} {self.price}"
 
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        if self.photo or self.engraving_file:
-            photo = Image.open(self.photo.path)
-            if photo.width > 500 or photo.height > 500:
-                output_size = (500, 500)
-                photo.thumbnail(output_size)
-                photo.save(self.photo.path)
-        self.order.total = self.order.get_total()
-        self.order.save()
+        photo_changed = self.has_changed('photo')
+        previous_order_id = self.loaded_value('order')
+        # a new quantity resizes the pearl reservations in a post_save receiver, both commit together
+        resized = not self._state.adding and self.has_changed('quantity')
+        with transaction.atomic(using=kwargs.get('using')) if resized else nullcontext():
+            super().save(*args, **kwargs)
+        if self.photo and photo_changed:
+            ImageJob.enqueue(self, 'photo')
+        refresh_order_totals({self.order_id, previous_order_id})
             
     def display_metal_type(self) -> str:
         return ', '.join(metal_type.alloy for metal_type in self.metal_type.all())
@@ -202,6 +463,21 @@ class OrderLine(models.Model):
         return ', '.join(f"{pearl.type_name} {pearl.color} / {pearl.size}"  for pearl in self.pearl.all())
     display_pearl.short_description = _("pearl(s)")
 
+class StockReservation(models.Model):
+    """Pearls taken from stock for an order line, until released."""
+    line = models.ForeignKey(OrderLine, verbose_name=_("order line"), on_delete=models.CASCADE, related_name='stock_reservations')
+    pearl = models.ForeignKey(Pearl, verbose_name=_("pearl"), on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(_("quantity"), default=0)
+    created_at = models.DateTimeField(_("created at"), auto_now_add=True)
+    released_at = models.DateTimeField(_("released at"), blank=True, null=True)
+
+    class Meta:
+        verbose_name = _('stock reservation')
+
+    def __str__(self) -> str:
+        return f"{self.pearl} x{self.quantity}"
+
+
 class ReviewProduct(models.Model):
     customer = models.ForeignKey(get_user_model(), verbose_name=_('customer'), on_delete=models.CASCADE, related_name='product_reviews')
     product = models.ForeignKey(Product, verbose_name=_("product"), on_delete=models.CASCADE, related_name='reviews')
@@ -213,3 +489,34 @@ class ReviewProduct(models.Model):
 
     def __str__(self) -> str:
         return f"{self.customer} review on {self.product} at {self.created_at}"
+
+
+class SalesSummary(models.Model):
+    DIMENSION_CHOICES = (
+        ('total', _('all sales')),
+        ('status', _('order status')),
+        ('category', _('category')),
+        ('jewellery_type', _('jewellery type')),
+        ('metal_type', _('metal type')),
+    )
+    month = models.DateField(_("month"))
+    dimension = models.CharField(_("dimension"), max_length=20, choices=DIMENSION_CHOICES)
+    key = models.CharField(_("key"), max_length=40, blank=True)
+    label = models.CharField(_("label"), max_length=100, blank=True)
+    revenue = models.DecimalField(_("revenue"), max_digits=18, decimal_places=2, default=0)
+    quantity = models.IntegerField(_("quantity"), default=0)
+    line_count = models.PositiveIntegerField(_("lines"), default=0)
+    order_count = models.PositiveIntegerField(_("orders"), default=0)
+    updated_at = models.DateTimeField(_("updated at"), auto_now=True)
+
+    class Meta:
+        ordering = ['-month', 'dimension', 'label']
+        verbose_name = _('sales summary')
+        verbose_name_plural = _('sales summaries')
+        constraints = [
+            models.UniqueConstraint(fields=['month', 'dimension', 'key'], name='unique_sales_summary_row'),
+        ]
+        indexes = [models.Index(fields=['dimension', 'month'])]
+
+    def __str__(self) -> str:
+        return f"{self.month:%Y-%m} {self.get_dimension_display()} {self.label or self.key}: {self.revenue}"
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import get_language
+from . models import Category
+
+
+NAV_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def nav_cache_key(language_code):
+    return f"jewellery:nav_categories:{language_code}"
+
+
+def get_nav_categories():
+    key = nav_cache_key(get_language() or settings.LANGUAGE_CODE)
+    categories = cache.get(key)
+    if categories is None:
+        categories = list(Category.objects.all())
+        cache.set(key, categories, NAV_CACHE_TIMEOUT)
+    return categories
+
+
+async def aget_nav_categories():
+    key = nav_cache_key(get_language() or settings.LANGUAGE_CODE)
+    categories = await cache.aget(key)
+    if categories is None:
+        categories = [category async for category in Category.objects.all()]
+        await cache.aset(key, categories, NAV_CACHE_TIMEOUT)
+    return categories
+
+
+def invalidate_nav_categories():
+    cache.delete_many([nav_cache_key(code) for code, name in settings.LANGUAGES])
@@ -0,0 +1,55 @@
+from datetime import timedelta
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Q
+from django.utils import timezone
+from . models import EmailOutbox
+
+
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 6
+RETRY_DELAY = timedelta(minutes=1)
+# a message left sending this long belonged to a dispatcher that died; sending it again may duplicate it
+SENDING_TIMEOUT = timedelta(minutes=10)
+
+
+def claim_messages(limit):
+    now = timezone.now()
+    candidates = EmailOutbox.objects.filter(
+        Q(status='q', run_after__lte=now) | Q(status='s', updated_at__lt=now - SENDING_TIMEOUT)
+    ).values_list('id', 'status', 'updated_at')[:limit]
+    claimed = []
+    for message_id, status, updated_at in candidates:
+        # as with image jobs, the conditional update keeps two dispatchers from sending one message twice
+        claim = EmailOutbox.objects.filter(id=message_id, status=status, updated_at=updated_at)
+        if claim.update(status='s', updated_at=timezone.now()):
+            claimed.append(message_id)
+    return EmailOutbox.objects.filter(id__in=claimed).order_by('run_after', 'id')
+
+
+def dispatch(connection=None, limit=BATCH_SIZE):
+    """Sends one batch over ``connection``, which stays open for the next batch."""
+    connection = connection or get_connection()
+    sent = retried = failed = 0
+    for message in claim_messages(limit):
+        message.attempts += 1
+        try:
+            connection.open()
+            EmailMessage(message.subject, message.body, to=[message.recipient], connection=connection).send()
+        except Exception as error:
+            # a broken connection is reopened for the next message
+            connection.close()
+            message.last_error = f"{error.__class__.__name__}: {error}"
+            if message.attempts >= MAX_ATTEMPTS:
+                message.status = 'f'
+                failed += 1
+            else:
+                message.status = 'q'
+                message.run_after = timezone.now() + RETRY_DELAY * 2 ** (message.attempts - 1)
+                retried += 1
+        else:
+            message.status = 'd'
+            message.sent_at = timezone.now()
+            message.last_error = ''
+            sent += 1
+        message.save(update_fields=['status', 'attempts', 'run_after', 'last_error', 'sent_at', 'updated_at'])
+    return sent, retried, failed
@@ -0,0 +1,126 @@
+import asyncio
+import hashlib
+import re
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response
+from django.utils.translation import get_language
+from . caching import get_versions, bump_versions
+from . conditional import make_etag
+from . metrics import registry
+from . reviews import reviews_cache_tag
+
+
+PAGE_CACHE_TIMEOUT = 60 * 60
+CSRF_PLACEHOLDER = '__jewellery_csrf_token__'
+CSRF_INPUT = re.compile(r'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+CACHED_METHODS = ('GET', 'HEAD')
+# every page shows the category navigation
+NAV_TAG = 'pages:nav'
+PRODUCT_LIST_TAG = 'pages:products'
+
+
+def product_page_tag(product_id):
+    return f"pages:product:{product_id}"
+
+
+def product_detail_tags(pk):
+    return (NAV_TAG, product_page_tag(pk), reviews_cache_tag(pk))
+
+
+def invalidate_catalogue_pages():
+    bump_versions(NAV_TAG, PRODUCT_LIST_TAG)
+
+
+def invalidate_product_pages(*product_ids):
+    bump_versions(PRODUCT_LIST_TAG, *(product_page_tag(product_id) for product_id in product_ids))
+
+
+def page_cache_key(request, view_name, tags):
+    query = sorted((key, value) for key in request.GET for value in request.GET.getlist(key))
+    digest = hashlib.md5(repr((request.path, query)).encode()).hexdigest()
+    versions = get_versions(*tags)
+    version = '.'.join(str(versions[tag]) for tag in tags)
+    return f"jewellery:page:{view_name}:{get_language()}:{digest}:{version}"
+
+
+def cacheable(request):
+    # pending messages and signed-in users both change the page, they always get a fresh render
+    return request.method in CACHED_METHODS and not request.user.is_authenticated and not len(request._messages)
+
+
+def cached_response(request, etag, content, content_type):
+    response = HttpResponse(content.replace(CSRF_PLACEHOLDER, get_token(request)), content_type=content_type)
+    response['X-Page-Cache'] = 'hit'
+    response['ETag'] = etag
+    return response
+
+
+def store(key, etag, response, timeout):
+    def store_rendered(response):
+        if response.status_code == 200 and not response.cookies:
+            content = CSRF_INPUT.sub(rf'\g<1>{CSRF_PLACEHOLDER}\g<2>', response.content.decode(response.charset))
+            cache.set(key, (content, response['Content-Type']), timeout)
+
+    response['X-Page-Cache'] = 'miss'
+    # the key already covers everything the page depends on, so hits and misses share one validator
+    response['ETag'] = etag
+    if response.has_header('Last-Modified'):
+        del response['Last-Modified']
+    if hasattr(response, 'render') and not response.is_rendered:
+        response.add_post_render_callback(store_rendered)
+    else:
+        store_rendered(response)
+    return response
+
+
+def anonymous_page_cache(view, view_name, tags, timeout=None):
+    """Caches the whole page for anonymous visitors, per language, path and query string.
+
+    ``tags`` lists cache version tags, or is a callable taking the URL kwargs;
+    bumping one of them (see ``jewellery.signals``) retires every page keyed on
+    it. The CSRF token is stored as a placeholder and filled in per request.
+    The ETag is derived from the key, so revalidations are answered with a
+    304 without even reading the cache.
+    """
+    timeout = timeout or getattr(settings, 'PAGE_CACHE_TIMEOUT', PAGE_CACHE_TIMEOUT)
+
+    def lookup(request, kwargs):
+        if not cacheable(request):
+            registry.increment('page_cache_requests_total', view_name, 'skip')
+            return None, None, None
+        key = page_cache_key(request, view_name, tags(**kwargs) if callable(tags) else tags)
+        etag = make_etag(request, key)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            registry.increment('page_cache_requests_total', view_name, 'not_modified')
+            not_modified['ETag'] = etag
+            return key, etag, not_modified
+        hit = cache.get(key)
+        registry.increment('page_cache_requests_total', view_name, 'hit' if hit else 'miss')
+        if hit:
+            return key, etag, cached_response(request, etag, *hit)
+        return key, etag, None
+
+    if asyncio.iscoroutinefunction(view):
+        @wraps(view)
+        async def cached_view(request, *args, **kwargs):
+            # reading request.user may load the session from the database
+            key, etag, response = await sync_to_async(lookup)(request, kwargs)
+            if response is not None:
+                return response
+            response = await view(request, *args, **kwargs)
+            return store(key, etag, response, timeout) if key else response
+    else:
+        @wraps(view)
+        def cached_view(request, *args, **kwargs):
+            key, etag, response = lookup(request, kwargs)
+            if response is not None:
+                return response
+            response = view(request, *args, **kwargs)
+            return store(key, etag, response, timeout) if key else response
+    return cached_view
@@ -0,0 +1,200 @@
+import hashlib
+import json
+from django.core import signing
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.http import Http404
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+
+
+CURSOR_SALT = 'jewellery.pagination.cursor'
+COUNT_CACHE_TIMEOUT = 60 * 5
+
+
+class CursorSerializer(signing.JSONSerializer):
+
+    def dumps(self, obj):
+        return json.dumps(obj, separators=(',', ':'), cls=DjangoJSONEncoder).encode('latin-1')
+
+
+def encode_cursor(key, direction, filters):
+    return signing.dumps(
+        {'k': key, 'd': direction, 'f': filters},
+        salt=CURSOR_SALT, serializer=CursorSerializer, compress=True,
+    )
+
+
+def decode_cursor(token):
+    try:
+        payload = signing.loads(token, salt=CURSOR_SALT, serializer=CursorSerializer)
+        return payload['k'], payload['d'], payload['f']
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        raise Http404(_("Invalid page."))
+
+
+class CursorPage:
+
+    def __init__(self, object_list, next_cursor, previous_cursor, count=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """Seeks past the last row seen instead of counting and skipping with OFFSET.
+
+    ``ordering`` must end with a unique field (usually ``id``) so every row has
+    a distinct key; a leading ``-`` sorts that field in descending order.
+    """
+
+    def __init__(self, queryset, ordering, per_page, filters=None):
+        self.queryset = queryset
+        self.ordering = list(ordering)
+        self.per_page = per_page
+        self.filters = filters or {}
+
+    def fields(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    def key(self, obj):
+        return [getattr(obj, field) for field in self.fields()]
+
+    def seek(self, key, forward):
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, key):
+            name = field.lstrip('-')
+            descending = field.startswith('-')
+            lookup = 'lt' if descending == forward else 'gt'
+            condition |= Q(**equal, **{f"{name}__{lookup}": value})
+            equal[name] = value
+        return condition
+
+    def reversed_ordering(self):
+        return [field[1:] if field.startswith('-') else f"-{field}" for field in self.ordering]
+
+    def page_queryset(self, cursor):
+        key, direction = None, 'n'
+        if cursor:
+            key, direction, _filters = decode_cursor(cursor)
+        forward = direction == 'n'
+        queryset = self.queryset.order_by(*(self.ordering if forward else self.reversed_ordering()))
+        if key is not None:
+            queryset = queryset.filter(self.seek(key, forward))
+        return queryset[:self.per_page + 1], key, forward
+
+    def page(self, cursor=None, count=None):
+        queryset, key, forward = self.page_queryset(cursor)
+        return self.build_page(list(queryset), key, forward, count)
+
+    async def apage(self, cursor=None, count=None):
+        queryset, key, forward = self.page_queryset(cursor)
+        return self.build_page([row async for row in queryset], key, forward, count)
+
+    def build_page(self, rows, key, forward, count):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+        has_next = has_more if forward else True
+        has_previous = key is not None if forward else has_more
+        return CursorPage(
+            rows,
+            encode_cursor(self.key(rows[-1]), 'n', self.filters) if rows and has_next else None,
+            encode_cursor(self.key(rows[0]), 'p', self.filters) if rows and has_previous else None,
+            count,
+        )
+
+    def count_cache_key(self):
+        digest = hashlib.md5(
+            json.dumps([self.queryset.model._meta.label, self.filters], sort_keys=True, cls=DjangoJSONEncoder).encode()
+        ).hexdigest()
+        return f"jewellery:keyset_count:{digest}"
+
+    def approximate_count(self):
+        """Count cached per filter set, so the COUNT(*) runs once per timeout rather than per page."""
+        key = self.count_cache_key()
+        count = cache.get(key)
+        if count is None:
+            count = self.queryset.count()
+            cache.set(key, count, COUNT_CACHE_TIMEOUT)
+        return count
+
+    async def aapproximate_count(self):
+        key = self.count_cache_key()
+        count = await cache.aget(key)
+        if count is None:
+            count = await self.queryset.acount()
+            await cache.aset(key, count, COUNT_CACHE_TIMEOUT)
+        return count
+
+
+class KeysetPaginationMixin:
+    """Cursor pagination for a ListView; the cursor token carries the filters of the first page."""
+    keyset_pagination = False
+    keyset_ordering = ('id',)
+    keyset_filters = ()
+    keyset_count = True
+
+    def get_keyset_ordering(self):
+        return self.keyset_ordering
+
+    def get_filters(self):
+        if not hasattr(self, '_filters'):
+            cursor = self.request.GET.get('cursor') if self.keyset_pagination else None
+            if cursor:
+                self._filters = decode_cursor(cursor)[2]
+            else:
+                self._filters = {name: self.request.GET.get(name) for name in self.keyset_filters if self.request.GET.get(name)}
+        return self._filters
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.keyset_pagination:
+            return super().paginate_queryset(queryset, page_size)
+        paginator = KeysetPaginator(queryset, self.get_keyset_ordering(), page_size, self.get_filters())
+        count = paginator.approximate_count() if self.keyset_count else None
+        page = paginator.page(self.request.GET.get('cursor'), count)
+        return (paginator, page, page.object_list, page.has_next or page.has_previous)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Counts exactly up to ``count_limit`` rows and estimates beyond that.
+
+    On PostgreSQL an unfiltered table uses the planner's row estimate;
+    otherwise the count stops at the limit instead of scanning the table.
+    """
+    count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        capped = queryset.order_by()[:self.count_limit + 1].count()
+        if capped <= self.count_limit:
+            return capped
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT reltuples FROM pg_class WHERE relname = %s", [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] > capped:
+                return int(row[0])
+        return capped
@@ -0,0 +1,125 @@
+"""Monthly sales summaries, kept in step with the orders so reports never scan the order lines.
+
+Whatever changes an order's lines, status or attribution marks the order
+dirty; the months of the dirty orders are recomputed from the lines once
+the transaction commits. A line in several categories or metal types counts
+towards each of them. Months are recomputed rather than patched with deltas:
+the distinct order counts cannot be adjusted from one order's change, and a
+month is a single indexed date range.
+"""
+from contextvars import ContextVar
+from datetime import date
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+from . models import Order, OrderLine, SalesSummary, line_total_expression
+
+
+# cancelled orders still show under their status, but bring in no revenue elsewhere
+EXCLUDED_STATUSES = ('c',)
+# dimension: (key field, label field) on OrderLine
+DIMENSIONS = {
+    'total': (None, None),
+    'status': ('order__status', None),
+    'category': ('product__category', 'product__category__name'),
+    'jewellery_type': ('product__jewellery_type', 'product__jewellery_type__name'),
+    'metal_type': ('metal_type', 'metal_type__alloy'),
+}
+BATCH_SIZE = 500
+
+_dirty_months = ContextVar('dirty_sales_months', default=None)
+
+
+def first_of_month(value):
+    return date(value.year, value.month, 1)
+
+
+def next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def summary_rows(months=None):
+    lines = OrderLine.objects.annotate(month=TruncMonth('order__date')).order_by()
+    if months is not None:
+        period = Q()
+        for month in months:
+            period |= Q(order__date__gte=month, order__date__lt=next_month(month))
+        lines = lines.filter(period)
+    for dimension, (key_field, label_field) in DIMENSIONS.items():
+        dimension_lines = lines if dimension == 'status' else lines.exclude(order__status__in=EXCLUDED_STATUSES)
+        if key_field:
+            dimension_lines = dimension_lines.filter(**{f'{key_field}__isnull': False})
+        grouping = ['month'] + [field for field in (key_field, label_field) if field]
+        totals = dimension_lines.values(*grouping).annotate(
+            revenue=Sum(line_total_expression()),
+            quantity_sum=Sum('quantity'),
+            line_count=Count('id'),
+            order_count=Count('order', distinct=True),
+        )
+        for row in totals:
+            yield SalesSummary(
+                month=row['month'],
+                dimension=dimension,
+                key=str(row[key_field]) if key_field else '',
+                label=row[label_field] if label_field else '',
+                revenue=row['revenue'] or 0,
+                quantity=row['quantity_sum'] or 0,
+                line_count=row['line_count'],
+                order_count=row['order_count'],
+            )
+
+
+def rebuild_months(months=None):
+    """Recompute the summaries of the given months, every month when None."""
+    if months is not None:
+        months = sorted({first_of_month(month) for month in months})
+        if not months:
+            return 0
+    with transaction.atomic():
+        stale = SalesSummary.objects.all() if months is None else SalesSummary.objects.filter(month__in=months)
+        stale.delete()
+        return len(SalesSummary.objects.bulk_create(summary_rows(months), batch_size=BATCH_SIZE))
+
+
+def pending_changes():
+    pending = _dirty_months.get()
+    if pending is None:
+        pending = {'months': set(), 'orders': set()}
+        _dirty_months.set(pending)
+    return pending
+
+
+def flush_dirty_months():
+    pending = pending_changes()
+    months, order_ids = set(pending['months']), sorted(pending['orders'])
+    pending['months'].clear()
+    pending['orders'].clear()
+    for start in range(0, len(order_ids), BATCH_SIZE):
+        orders = Order.objects.filter(pk__in=order_ids[start:start + BATCH_SIZE]).order_by()
+        months.update(orders.annotate(month=TruncMonth('date')).values_list('month', flat=True).distinct())
+    if months:
+        rebuild_months(months)
+
+
+def mark_months_dirty(months):
+    months = {first_of_month(month) for month in months if month}
+    if months:
+        pending_changes()['months'].update(months)
+        # one flush empties the pending changes, the callbacks queued by later marks find nothing to do
+        transaction.on_commit(flush_dirty_months)
+
+
+def mark_orders_dirty(order_ids):
+    """The orders' months are looked up when the transaction commits, keeping the extra query off each save."""
+    order_ids = {order_id for order_id in order_ids if order_id is not None}
+    if order_ids:
+        pending_changes()['orders'].update(order_ids)
+        transaction.on_commit(flush_dirty_months)
+
+
+def mark_products_dirty(product_ids):
+    mark_orders_dirty(OrderLine.objects.filter(product__in=list(product_ids)).values_list('order_id', flat=True).distinct())
+
+
+def relabel(dimension, key, label):
+    SalesSummary.objects.filter(dimension=dimension, key=str(key)).exclude(label=label).update(label=label)
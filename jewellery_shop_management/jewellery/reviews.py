@@ -0,0 +1,13 @@
+from . caching import bump_versions
+
+
+REVIEWS_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def reviews_cache_tag(product_id):
+    return f"reviews:{product_id}"
+
+
+def invalidate_reviews(*product_ids):
+    if product_ids:
+        bump_versions(*(reviews_cache_tag(product_id) for product_id in product_ids))
@@ -0,0 +1,124 @@
+import re
+from django.db import connection
+from django.db.models import Q, Case, When, Value, Exists, OuterRef, FloatField
+from django.db.models.expressions import RawSQL
+from . models import Product, Category, JewelleryType
+
+
+FTS_TABLE = 'jewellery_product_fts'
+# bm25() column weights for name, jewellery type and category names
+FTS_WEIGHTS = (10.0, 3.0, 1.0)
+INDEX_BATCH_SIZE = 500
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query or '')
+
+
+def batches(product_ids):
+    product_ids = list(product_ids)
+    for start in range(0, len(product_ids), INDEX_BATCH_SIZE):
+        batch = product_ids[start:start + INDEX_BATCH_SIZE]
+        yield batch, ', '.join(['%s'] * len(batch))
+
+
+class SearchBackend:
+    """Filters and ranks products; ``search_rank`` ascends from the best match."""
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+    def index_products(self, product_ids):
+        pass
+
+    def remove_products(self, product_ids):
+        pass
+
+    def rebuild(self):
+        return 0
+
+
+class FallbackSearchBackend(SearchBackend):
+
+    def search(self, queryset, query):
+        terms = search_terms(query)
+        if not terms:
+            return queryset.none()
+        score = Value(0)
+        for term in terms:
+            category_match = Exists(Category.objects.filter(product=OuterRef('pk'), name__icontains=term))
+            queryset = queryset.filter(
+                Q(name__icontains=term) | Q(jewellery_type__name__icontains=term) | category_match
+            )
+            score = score \
+                + Case(When(name__icontains=term, then=Value(3)), default=Value(0)) \
+                + Case(When(jewellery_type__name__icontains=term, then=Value(2)), default=Value(0)) \
+                + Case(When(category_match, then=Value(1)), default=Value(0))
+        return queryset.annotate(search_rank=-score)
+
+
+class SQLiteFTSBackend(SearchBackend):
+    select_documents = f"""
+        SELECT product.id, product.name, COALESCE(jewellery_type.name, ''), COALESCE(GROUP_CONCAT(category.name, ' '), '')
+        FROM {Product._meta.db_table} product
+        LEFT JOIN {JewelleryType._meta.db_table} jewellery_type
+            ON jewellery_type.id = product.jewellery_type_id
+        LEFT JOIN {Product.category.through._meta.db_table} product_category
+            ON product_category.product_id = product.id
+        LEFT JOIN {Category._meta.db_table} category
+            ON category.id = product_category.category_id
+    """
+
+    def match_expression(self, query):
+        return ' '.join('"%s"*' % term for term in search_terms(query))
+
+    def rank_sql(self):
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        return f"bm25({FTS_TABLE}, {weights})"
+
+    def search(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return queryset.none()
+        # a join lets SQLite run the MATCH once instead of once per product row
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f"{FTS_TABLE} MATCH %s", f"{FTS_TABLE}.rowid = {Product._meta.db_table}.id"],
+            params=[match],
+        ).annotate(search_rank=RawSQL(self.rank_sql(), (), output_field=FloatField()))
+
+    def index_products(self, product_ids):
+        with connection.cursor() as cursor:
+            for batch, placeholders in batches(product_ids):
+                cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", batch)
+                cursor.execute(
+                    f"INSERT INTO {FTS_TABLE} (rowid, name, jewellery_type, categories) {self.select_documents} "
+                    f"WHERE product.id IN ({placeholders}) GROUP BY product.id",
+                    batch,
+                )
+
+    def remove_products(self, product_ids):
+        with connection.cursor() as cursor:
+            for batch, placeholders in batches(product_ids):
+                cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", batch)
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, name, jewellery_type, categories) {self.select_documents} "
+                "GROUP BY product.id"
+            )
+            return cursor.rowcount
+
+
+_fts_available = {}
+
+
+def get_search_backend():
+    if connection.vendor != 'sqlite':
+        return FallbackSearchBackend()
+    name = connection.settings_dict['NAME']
+    if name not in _fts_available:
+        _fts_available[name] = FTS_TABLE in connection.introspection.table_names()
+    return SQLiteFTSBackend() if _fts_available[name] else FallbackSearchBackend()
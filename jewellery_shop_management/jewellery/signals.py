@@ -0,0 +1,257 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+from . middleware import instrument_connection
+from . models import (
+    Category, Product, JewelleryType, MetalType, Order, OrderLine, ReviewProduct, ImageRendition, StockReservation,
+    order_lines_changed, order_statuses_updated, refresh_order_totals,
+)
+from . page_cache import invalidate_catalogue_pages, invalidate_product_pages
+from . reviews import invalidate_reviews
+from . navigation import invalidate_nav_categories
+from . search import get_search_backend
+from . reporting import mark_months_dirty, mark_orders_dirty, mark_products_dirty, relabel
+from . stock import release, release_order, reserve_orders, reserve_pearls, resize_line
+
+
+@receiver(connection_created)
+def instrument_new_connection(sender, connection, **kwargs):
+    instrument_connection(connection)
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category_navigation(sender, **kwargs):
+    invalidate_nav_categories()
+    invalidate_catalogue_pages()
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_page(sender, instance, **kwargs):
+    invalidate_product_pages(instance.pk)
+
+
+@receiver(m2m_changed, sender=Product.category.through)
+def invalidate_category_product_pages(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_product_pages()
+
+
+@receiver([post_save, post_delete], sender=JewelleryType)
+def invalidate_jewellery_type_pages(sender, instance, created=False, **kwargs):
+    if not created:
+        invalidate_product_pages(*instance.product_set.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=ImageRendition)
+def invalidate_rendition_pages(sender, instance, **kwargs):
+    # the pages switch from the original image to the responsive one
+    invalidate_product_pages(*Product.objects.filter(image=instance.source).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    get_search_backend().index_products([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    get_search_backend().remove_products([instance.pk])
+
+
+@receiver(m2m_changed, sender=Product.category.through)
+def index_product_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse and action == 'pre_clear':
+        instance._search_product_ids = list(instance.product_set.values_list('id', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        product_ids = [instance.pk]
+    elif action == 'post_clear':
+        product_ids = getattr(instance, '_search_product_ids', [])
+    else:
+        product_ids = pk_set
+    get_search_backend().index_products(product_ids)
+
+
+@receiver(post_save, sender=Category)
+def index_category_products(sender, instance, created, **kwargs):
+    if not created:
+        get_search_backend().index_products(instance.product_set.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Category)
+def collect_category_products(sender, instance, **kwargs):
+    instance._search_product_ids = list(instance.product_set.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def index_deleted_category_products(sender, instance, **kwargs):
+    get_search_backend().index_products(getattr(instance, '_search_product_ids', []))
+
+
+@receiver(post_save, sender=JewelleryType)
+def index_jewellery_type_products(sender, instance, created, **kwargs):
+    if not created:
+        get_search_backend().index_products(instance.product_set.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Order)
+def collect_deleted_order(sender, instance, origin=None, **kwargs):
+    # the lines of a deleted order go with it, noted on the delete() call's origin for the receiver below
+    if origin is not None:
+        if not hasattr(origin, '_deleted_order_ids'):
+            origin._deleted_order_ids = set()
+        origin._deleted_order_ids.add(instance.pk)
+
+
+@receiver(post_delete, sender=OrderLine)
+def refresh_deleted_line_order_total(sender, instance, origin=None, **kwargs):
+    if instance.order_id not in getattr(origin, '_deleted_order_ids', ()):
+        refresh_order_totals([instance.order_id])
+
+
+@receiver([post_save, post_delete], sender=ReviewProduct)
+def invalidate_product_reviews(sender, instance, **kwargs):
+    invalidate_reviews(instance.product_id)
+
+
+@receiver(post_save, sender='user_profile.Profile')
+def invalidate_reviewer_reviews(sender, instance, **kwargs):
+    invalidate_reviews(*ReviewProduct.objects.filter(customer_id=instance.user_id).values_list('product_id', flat=True).distinct())
+
+
+@receiver(order_lines_changed)
+def mark_changed_line_sales(sender, order_ids, **kwargs):
+    mark_orders_dirty(order_ids)
+
+
+@receiver(post_save, sender=Order)
+def mark_order_status_sales(sender, instance, created, **kwargs):
+    # a new order has no lines yet, they mark the month themselves
+    if not created and instance.has_changed('status'):
+        mark_months_dirty([instance.date])
+
+
+@receiver(order_statuses_updated)
+def mark_updated_order_sales(sender, previous, **kwargs):
+    mark_orders_dirty(previous)
+
+
+@receiver(post_delete, sender=Order)
+def mark_deleted_order_sales(sender, instance, **kwargs):
+    mark_months_dirty([instance.date])
+
+
+@receiver(m2m_changed, sender=OrderLine.metal_type.through)
+def mark_line_metal_sales(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        mark_orders_dirty([instance.order_id])
+    elif action == 'pre_clear':
+        mark_orders_dirty(instance.orderline_set.values_list('order_id', flat=True))
+    else:
+        mark_orders_dirty(OrderLine.objects.filter(pk__in=pk_set).values_list('order_id', flat=True))
+
+
+@receiver(m2m_changed, sender=Product.category.through)
+def mark_product_category_sales(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        mark_products_dirty([instance.pk])
+    elif action == 'pre_clear':
+        mark_products_dirty(instance.product_set.values_list('id', flat=True))
+    else:
+        mark_products_dirty(pk_set)
+
+
+@receiver(post_save, sender=Product)
+def mark_product_type_sales(sender, instance, created, **kwargs):
+    if not created and instance.has_changed('jewellery_type'):
+        mark_products_dirty([instance.pk])
+
+
+@receiver(pre_delete, sender=Category)
+def mark_deleted_category_sales(sender, instance, **kwargs):
+    # the through rows go without m2m_changed
+    mark_products_dirty(instance.product_set.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=MetalType)
+def mark_deleted_metal_sales(sender, instance, **kwargs):
+    mark_orders_dirty(instance.orderline_set.values_list('order_id', flat=True))
+
+
+@receiver(post_save, sender=Category)
+def relabel_category_sales(sender, instance, created, **kwargs):
+    if not created:
+        relabel('category', instance.pk, instance.name)
+
+
+@receiver(post_save, sender=JewelleryType)
+def relabel_jewellery_type_sales(sender, instance, created, **kwargs):
+    if not created:
+        relabel('jewellery_type', instance.pk, instance.name)
+
+
+@receiver(post_save, sender=MetalType)
+def relabel_metal_sales(sender, instance, created, **kwargs):
+    if not created:
+        relabel('metal_type', instance.pk, instance.alloy)
+
+
+@receiver(m2m_changed, sender=OrderLine.pearl.through)
+def reserve_line_pearls(sender, instance, action, reverse, pk_set, **kwargs):
+    # pre_add, so a shortfall raises InsufficientStock before the pearls are attached;
+    # add() runs without a savepoint, callers that carry on wrap it in atomic()
+    if action == 'pre_add':
+        if reverse:
+            reserve_pearls((line, [instance.pk]) for line in OrderLine.objects.filter(pk__in=pk_set).only('pk', 'quantity'))
+        else:
+            reserve_pearls([(instance, pk_set)])
+    elif action == 'post_remove':
+        release(StockReservation.objects.filter(pearl=instance, line__in=pk_set) if reverse else instance.stock_reservations.filter(pearl__in=pk_set))
+    elif action == 'pre_clear':
+        release(StockReservation.objects.filter(pearl=instance) if reverse else instance.stock_reservations.all())
+
+
+@receiver(post_save, sender=Order)
+def release_cancelled_order_stock(sender, instance, created, **kwargs):
+    if instance.status == 'c' and instance.has_changed('status'):
+        release_order(instance)
+
+
+@receiver(post_save, sender=Order)
+def reserve_reopened_order_stock(sender, instance, created, **kwargs):
+    if not created and instance.status != 'c' and instance.loaded_value('status') == 'c':
+        reserve_orders([instance.pk])
+
+
+@receiver(order_statuses_updated)
+def move_updated_order_stock(sender, status, previous, **kwargs):
+    if status == 'c':
+        release(StockReservation.objects.filter(line__order__in=list(previous)))
+    else:
+        reserve_orders([order_id for order_id, previous_status in previous.items() if previous_status == 'c'])
+
+
+@receiver(post_save, sender=OrderLine)
+def resize_line_stock(sender, instance, created, **kwargs):
+    if not created and instance.has_changed('quantity'):
+        resize_line(instance)
+
+
+@receiver(pre_delete, sender=OrderLine)
+def release_deleted_line_stock(sender, instance, **kwargs):
+    release(instance.stock_reservations.all())
@@ -0,0 +1,23 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite backend that can open transactions with ``BEGIN IMMEDIATE``.
+
+    A deferred transaction that reads before it writes cannot wait for the
+    write lock held by another connection and fails with "database is locked"
+    at once. Taking the lock at ``BEGIN`` lets the busy timeout apply instead.
+    Set ``OPTIONS['transaction_mode']`` to ``'IMMEDIATE'`` to enable it.
+    """
+    transaction_mode = None
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.transaction_mode = params.pop('transaction_mode', None)
+        return params
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode:
+            self.cursor().execute(f"BEGIN {self.transaction_mode}")
+        else:
+            super()._start_transaction_under_autocommit()
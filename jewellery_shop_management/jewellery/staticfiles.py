@@ -0,0 +1,60 @@
+import gzip
+import os
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.html', '.txt', '.json', '.xml', '.map', '.ico', '.ttf', '.otf', '.eot')
+# variants that save less than this are not worth the extra negotiation
+MIN_SAVING = 0.05
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+
+
+def compress(data):
+    """Yields ``(suffix, compressed)`` for each encoding this process can produce."""
+    yield ENCODINGS['gzip'], gzip.compress(data, compresslevel=9, mtime=0)
+    if brotli is not None:
+        yield ENCODINGS['br'], brotli.compress(data, quality=11)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Hashed file names plus gzip, and brotli when installed, variants written at collectstatic time.
+
+    Names missing from the manifest resolve to themselves instead of raising,
+    so templates still render before collectstatic has run, as in the tests.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        hashed_names = {}
+        for name, hashed_name, processed in super().post_process(paths, dry_run=dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed_names[name] = hashed_name
+            yield name, hashed_name, processed
+        if not dry_run:
+            for name, hashed_name in hashed_names.items():
+                self.compress_file(name)
+                self.compress_file(hashed_name)
+
+    def compress_file(self, name):
+        if not name.lower().endswith(COMPRESSIBLE_EXTENSIONS):
+            return
+        with self.open(name) as original:
+            data = original.read()
+        for suffix, compressed in compress(data):
+            variant = self.path(name + suffix)
+            if len(compressed) > len(data) * (1 - MIN_SAVING):
+                if os.path.exists(variant):
+                    os.remove(variant)
+                continue
+            with open(variant, 'wb') as variant_file:
+                variant_file.write(compressed)
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
@@ -0,0 +1,106 @@
+"""Pearl stock, taken with conditional updates so concurrent reservations cannot oversell.
+
+Stock is taken with ``UPDATE ... SET quantity = quantity - n WHERE quantity >= n``;
+the database decides, there is no read-modify-write to race. Items whose
+stock is empty (NULL) are not tracked and reserve nothing.
+"""
+from collections import Counter, defaultdict
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from . models import OrderLine, Pearl, StockReservation
+
+
+class InsufficientStock(Exception):
+
+    def __init__(self, item, requested):
+        self.item = item
+        self.requested = requested
+        super().__init__(f"Not enough {item} in stock for {requested}")
+
+
+def take(model, field, demand):
+    """Takes ``demand`` ({pk: amount}) from ``field``; returns the tracked pks, raises InsufficientStock.
+
+    Rows are updated in primary key order so concurrent takers lock them in the same order.
+    Call inside a transaction, a shortfall leaves the earlier rows taken.
+    """
+    tracked = set()
+    for pk, amount in sorted(demand.items()):
+        if model.objects.filter(pk=pk, **{f'{field}__gte': amount}).update(**{field: F(field) - amount}):
+            tracked.add(pk)
+        elif model.objects.filter(pk=pk, **{f'{field}__isnull': False}).exists():
+            raise InsufficientStock(model.objects.get(pk=pk), amount)
+    return tracked
+
+
+def reserve_pearls(line_pearls):
+    """Reserves ``line.quantity`` of each pearl for (line, pearl ids) pairs, one UPDATE per pearl."""
+    pairs = [(line, pearl_id) for line, pearl_ids in line_pearls for pearl_id in set(pearl_ids)]
+    demand = Counter()
+    for line, pearl_id in pairs:
+        demand[pearl_id] += line.quantity
+    if not demand:
+        return []
+    with transaction.atomic():
+        tracked = take(Pearl, 'quantity', demand)
+        return StockReservation.objects.bulk_create(
+            StockReservation(line=line, pearl_id=pearl_id, quantity=line.quantity)
+            for line, pearl_id in pairs if pearl_id in tracked
+        )
+
+
+def resize_line(line):
+    """Brings the line's pearl reservations to ``line.quantity``, taking or giving back the difference."""
+    # no savepoint, OrderLine.save() already runs this in its own transaction
+    with transaction.atomic(savepoint=False):
+        held = list(line.stock_reservations.filter(released_at__isnull=True).select_for_update().order_by('pk'))
+        more = {reservation.pearl_id: line.quantity - reservation.quantity for reservation in held if reservation.quantity < line.quantity}
+        fewer = {reservation.pearl_id: reservation.quantity - line.quantity for reservation in held if reservation.quantity > line.quantity}
+        take(Pearl, 'quantity', more)
+        for pk, amount in sorted(fewer.items()):
+            Pearl.objects.filter(pk=pk, quantity__isnull=False).update(quantity=F('quantity') + amount)
+        StockReservation.objects.filter(pk__in=[reservation.pk for reservation in held]).update(quantity=line.quantity)
+
+
+def release(reservations):
+    """Puts the reserved stock back; each reservation is claimed first, so it is released only once."""
+    released = 0
+    with transaction.atomic():
+        for reservation in reservations.filter(released_at__isnull=True).order_by('pk'):
+            if not StockReservation.objects.filter(pk=reservation.pk, released_at__isnull=True).update(released_at=timezone.now()):
+                continue
+            Pearl.objects.filter(pk=reservation.pearl_id).update(quantity=F('quantity') + reservation.quantity)
+            released += 1
+    return released
+
+
+def release_order(order):
+    return release(StockReservation.objects.filter(line__order=order))
+
+
+def reopening_pearls(order_ids):
+    """The (line, pearl ids) pairs reopened orders take again, leaving out pearls a line still holds."""
+    lines = {line.pk: line for line in OrderLine.objects.filter(order__in=list(order_ids)).only('pk', 'quantity')}
+    held = set(StockReservation.objects.filter(line__in=list(lines), released_at__isnull=True).values_list('line_id', 'pearl_id'))
+    line_pearls = defaultdict(list)
+    for line_id, pearl_id in OrderLine.pearl.through.objects.filter(orderline__in=list(lines)).values_list('orderline_id', 'pearl_id'):
+        if (line_id, pearl_id) not in held:
+            line_pearls[lines[line_id]].append(pearl_id)
+    return line_pearls.items()
+
+
+def check_reopening(order_ids):
+    """Raises InsufficientStock when reopening the orders would; the reservation on save still has the final say."""
+    demand = Counter()
+    for line, pearl_ids in reopening_pearls(order_ids):
+        for pearl_id in set(pearl_ids):
+            demand[pearl_id] += line.quantity
+    for pearl in Pearl.objects.filter(pk__in=list(demand), quantity__isnull=False).order_by('pk'):
+        if pearl.quantity < demand[pearl.pk]:
+            raise InsufficientStock(pearl, demand[pearl.pk])
+
+
+def reserve_orders(order_ids):
+    """Takes the pearls of reopened orders again; raises InsufficientStock when another order has them now."""
+    return reserve_pearls(reopening_pearls(order_ids))
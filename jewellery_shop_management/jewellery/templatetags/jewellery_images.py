@@ -0,0 +1,38 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+from .. models import ImageRendition
+
+
+register = template.Library()
+
+DEFAULT_SIZES = '(max-width: 640px) 90vw, 19rem'
+
+
+def srcset(renditions):
+    return ', '.join(f"{rendition.file.url} {rendition.width}w" for rendition in renditions)
+
+
+@register.simple_tag
+def responsive_image(fieldfile, sizes=DEFAULT_SIZES, placeholder='jewellery/img/ring_icon.jpg', alt=''):
+    """Renders a <picture> with WebP and JPEG srcsets, or the original until the renditions exist."""
+    if not fieldfile:
+        return format_html('<img src="{}" alt="{}">', static(placeholder), alt)
+    renditions = getattr(fieldfile, 'renditions', None)
+    if renditions is None:
+        renditions = list(ImageRendition.objects.filter(source=fieldfile.name))
+    if not renditions:
+        return format_html('<img src="{}" alt="{}">', fieldfile.url, alt)
+    by_format = {}
+    for rendition in sorted(renditions, key=lambda rendition: rendition.width):
+        by_format.setdefault(rendition.format, []).append(rendition)
+    fallback = by_format.get('jpeg') or next(iter(by_format.values()))
+    largest = fallback[-1]
+    sources = format_html_join(
+        '', '<source type="image/{}" srcset="{}" sizes="{}">',
+        ((image_format, srcset(items), sizes) for image_format, items in by_format.items() if image_format != 'jpeg'),
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" loading="lazy" decoding="async"></picture>',
+        sources, largest.file.url, srcset(fallback), sizes, largest.width, largest.height, alt,
+    )
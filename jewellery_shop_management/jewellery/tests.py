@@ -1,3 +1,1446 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import smtplib
+import subprocess
+import sys
+import shutil
+import tempfile
+import time
+from unittest import mock
+import zipfile
+from datetime import date, timedelta
+from xml.etree import ElementTree
+from PIL import Image
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends import locmem
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command, CommandError
+from django.db import connection, transaction
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.http import Http404
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone, translation
+from . import async_views, exports
+from . checks import check_shared_cache
+from . imaging import run_jobs
+from . metrics import registry
+from . models import Category, Product, JewelleryType, ImageJob, ImageRendition, Customer, Order, OrderLine, MetalType, Pearl, ReviewProduct, SalesSummary, StockReservation, EmailOutbox
+from . navigation import get_nav_categories
+from . pagination import EstimatedCountPaginator
+from . reporting import first_of_month, rebuild_months
+from . search import get_search_backend, FallbackSearchBackend
+from . stock import InsufficientStock, release_order
+from . throttling import Throttle
 
-# Create your tests here.
+
+def category_queries(captured_queries):
+    return [query for query in captured_queries if 'jewellery_category' in query['sql']]
+
+
+def uploaded_image(name='photo.jpg', size=(1200, 800)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'gold').save(buffer, format='JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class MediaRootMixin:
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class CategoryNavigationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Rings')
+
+    def test_warm_page_load_runs_no_category_queries(self):
+        for url in (reverse('index'), reverse('products'), reverse('register')):
+            self.client.get(url)
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            self.assertContains(response, 'Rings')
+            self.assertEqual(category_queries(context.captured_queries), [])
+
+    def test_navigation_is_cached_per_language(self):
+        with translation.override('lt'):
+            get_nav_categories()
+        with translation.override('en-us'):
+            with self.assertNumQueries(1):
+                get_nav_categories()
+            with self.assertNumQueries(0):
+                get_nav_categories()
+
+    def test_category_changes_invalidate_navigation(self):
+        self.client.get(reverse('index'))
+        self.category.name = 'Earrings'
+        self.category.save()
+        self.assertContains(self.client.get(reverse('index')), 'Earrings')
+        self.category.delete()
+        self.assertNotContains(self.client.get(reverse('index')), 'Earrings')
+
+
+class ProductSearchTests(TestCase):
+
+    def setUp(self):
+        self.rings = Category.objects.create(name='Rings')
+        self.ring_type = JewelleryType.objects.create(name='ring')
+        self.signet = Product.objects.create(name='Gold signet ring', price=300, jewellery_type=self.ring_type)
+        self.pendant = Product.objects.create(name='Pearl pendant', price=120)
+        self.pendant.category.add(self.rings)
+
+    def search(self, query, backend=None):
+        backend = backend or get_search_backend()
+        return list(backend.search(Product.objects.all(), query).order_by('search_rank', 'id'))
+
+    def test_results_are_ranked_by_relevance(self):
+        self.assertEqual(self.search('ring'), [self.signet, self.pendant])
+        self.assertEqual(self.search('ring', FallbackSearchBackend()), [self.signet, self.pendant])
+
+    def test_index_follows_product_and_category_changes(self):
+        self.assertEqual(self.search('brooch'), [])
+        self.pendant.name = 'Pearl brooch'
+        self.pendant.save()
+        self.assertEqual(self.search('brooch'), [self.pendant])
+        self.rings.product_set.clear()
+        self.assertEqual(self.search('rings'), [])
+        self.signet.category.add(self.rings)
+        self.assertEqual(self.search('rings'), [self.signet])
+        self.signet.delete()
+        self.assertEqual(self.search('gold'), [])
+
+    def test_product_list_uses_search_backend(self):
+        response = self.client.get(reverse('products'), {'search': 'pearl'})
+        self.assertEqual(list(response.context['product_list']), [self.pendant])
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.gold = Category.objects.create(name='Gold')
+        for number in range(45):
+            product = Product.objects.create(name=f"Ring {number}" if number % 3 else f"Brooch {number}", price=100)
+            if number % 2:
+                product.category.add(self.gold)
+
+    def walk(self, params):
+        seen, response = [], self.client.get(reverse('products'), params)
+        while True:
+            seen.extend(response.context['product_list'])
+            page = response.context['page_obj']
+            if not page.has_next:
+                return seen, response
+            response = self.client.get(reverse('products'), {'cursor': page.next_cursor})
+
+    def test_pages_cover_catalogue_once_in_order(self):
+        seen, response = self.walk({})
+        self.assertEqual([product.id for product in seen], list(Product.objects.order_by('id').values_list('id', flat=True)))
+        previous = self.client.get(reverse('products'), {'cursor': response.context['page_obj'].previous_cursor})
+        self.assertEqual(len(previous.context['product_list']), 21)
+        self.assertLess(previous.context['product_list'][-1].id, seen[-3].id)
+
+    def test_cursor_carries_filters(self):
+        seen, response = self.walk({'search': 'ring', 'category_id': self.gold.id})
+        expected = Product.objects.filter(name__startswith='Ring', category=self.gold)
+        self.assertEqual(sorted(product.id for product in seen), sorted(expected.values_list('id', flat=True)))
+        self.assertEqual(response.context['search'], 'ring')
+        self.assertEqual(response.context['category'], self.gold)
+
+    def test_warm_pages_skip_count_and_offset(self):
+        first = self.client.get(reverse('products'))
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(reverse('products'), {'cursor': first.context['page_obj'].next_cursor})
+        product_queries = [query['sql'] for query in context.captured_queries if 'jewellery_product' in query['sql']]
+        self.assertEqual(len(product_queries), 1)
+        self.assertNotIn('COUNT', product_queries[0])
+        self.assertNotIn('OFFSET', product_queries[0])
+
+    def test_tampered_cursor_is_rejected(self):
+        self.assertEqual(self.client.get(reverse('products'), {'cursor': 'not-a-cursor'}).status_code, 404)
+
+
+class ImageJobTests(MediaRootMixin, TestCase):
+
+    def test_save_enqueues_instead_of_resizing(self):
+        product = Product.objects.create(name='Signet', price=100, image=uploaded_image())
+        product.save()
+        job = ImageJob.objects.get()
+        self.assertEqual((job.file_name, job.status), (product.image.name, 'q'))
+        with Image.open(product.image.path) as image:
+            self.assertEqual(image.size, (1200, 800))
+
+    def test_worker_resizes_once(self):
+        product = Product.objects.create(name='Signet', price=100, image=uploaded_image())
+        self.assertEqual(run_jobs(), (1, 0, 0))
+        with Image.open(product.image.path) as image:
+            self.assertEqual(image.size, (500, 333))
+        self.assertEqual(run_jobs(), (0, 0, 0))
+        self.assertEqual(ImageJob.objects.get().status, 'd')
+
+    def test_failed_job_is_retried_later(self):
+        product = Product.objects.create(name='Signet', price=100, image=uploaded_image())
+        product.image.storage.delete(product.image.name)
+        self.assertEqual(run_jobs(), (0, 1, 0))
+        job = ImageJob.objects.get()
+        self.assertEqual((job.status, job.attempts), ('q', 1))
+        self.assertIn('FileNotFoundError', job.last_error)
+        self.assertEqual(run_jobs(), (0, 0, 0))
+
+    def image_job_queries(self, save):
+        with CaptureQueriesContext(connection) as context:
+            save()
+        return [query for query in context.captured_queries if 'jewellery_imagejob' in query['sql']]
+
+    def test_only_a_new_file_is_enqueued(self):
+        product = Product.objects.create(name='Signet', price=100, image=uploaded_image())
+        product.name = 'Signet ring'
+        self.assertEqual(self.image_job_queries(product.save), [])
+        product = Product.objects.get()
+        self.assertEqual(self.image_job_queries(product.save), [])
+        product.image = uploaded_image('other.jpg')
+        self.assertTrue(self.image_job_queries(product.save))
+        self.assertEqual(ImageJob.objects.count(), 2)
+        self.assertEqual(self.image_job_queries(product.save), [])
+
+    def test_order_line_photo_changes_are_tracked(self):
+        order = Order.objects.create(customer=Customer.objects.create(user=get_user_model().objects.create_user('ruta'), phone='1'))
+        line = OrderLine.objects.create(order=order, product=Product.objects.create(name='Signet', price=10), price=10, photo=uploaded_image())
+        line = OrderLine.objects.get()
+        line.price = 12
+        self.assertEqual(self.image_job_queries(line.save), [])
+        self.assertEqual(line.loaded_value('order'), order.pk)
+        line.photo = uploaded_image('after.jpg')
+        self.assertTrue(self.image_job_queries(line.save))
+
+
+class ImageRenditionTests(MediaRootMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.products = [
+            Product.objects.create(name=f"Pendant {number}", price=100, image=uploaded_image(f"pendant{number}.jpg"))
+            for number in range(3)
+        ]
+        run_jobs()
+
+    def test_worker_records_renditions_in_every_format(self):
+        renditions = ImageRendition.objects.filter(source=self.products[0].image.name)
+        self.assertEqual(
+            sorted((rendition.format, rendition.width) for rendition in renditions),
+            [('jpeg', 160), ('jpeg', 320), ('jpeg', 500), ('webp', 160), ('webp', 320), ('webp', 500)],
+        )
+        with Image.open(renditions.get(format='webp', width=320).file.path) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (320, 213)))
+
+    def test_product_list_emits_srcset_with_one_rendition_query(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('products'))
+        self.assertContains(response, 'type="image/webp"', count=3)
+        self.assertContains(response, '-160w.webp 160w')
+        self.assertEqual(len([query for query in context.captured_queries if 'jewellery_imagerendition' in query['sql']]), 1)
+
+    def test_pending_image_falls_back_to_original(self):
+        product = Product.objects.create(name='New', price=100, image=uploaded_image('new.jpg'))
+        response = self.client.get(reverse('product', kwargs={'pk': product.pk}))
+        self.assertContains(response, f'<img src="{product.image.url}"')
+
+
+class OrderTotalTests(TestCase):
+
+    def setUp(self):
+        user = get_user_model().objects.create_user('jonas', 'jonas@example.com', 'secret')
+        self.customer = Customer.objects.create(user=user, phone='+37060000000')
+        self.product = Product.objects.create(name='Signet', price=100)
+        self.order = Order.objects.create(customer=self.customer)
+
+    def add_line(self, quantity=1, price='100.00', order=None):
+        return OrderLine.objects.create(order=order or self.order, product=self.product, quantity=quantity, price=Decimal(price))
+
+    def total(self, order=None):
+        return (order or self.order).__class__.objects.get(pk=(order or self.order).pk).total
+
+    def test_line_save_updates_total_in_one_statement(self):
+        line = self.add_line(quantity=2, price='49.50')
+        self.assertEqual(self.total(), Decimal('99.00'))
+        line.price = Decimal('50.00')
+        with self.assertNumQueries(2):
+            line.save()
+        self.assertEqual(self.total(), Decimal('100.00'))
+        # a new quantity also looks up the pearl reservations to resize
+        line.quantity = 3
+        with CaptureQueriesContext(connection) as context:
+            line.save()
+        updates = [query['sql'] for query in context.captured_queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(self.total(), Decimal('150.00'))
+
+    def test_saving_an_order_loaded_before_its_lines_keeps_the_total(self):
+        line = OrderLine.objects.select_related('order').get(pk=self.add_line(price='20.00').pk)
+        line.quantity = 2
+        line.save()
+        line.order.due_date = date.today() + timedelta(days=7)
+        line.order.save()
+        self.assertEqual(self.total(), Decimal('40.00'))
+        order = Order.objects.get(pk=self.order.pk)
+        order.total = Decimal('1.00')
+        order.save()
+        self.assertEqual(self.total(), Decimal('1.00'))
+
+    def test_moving_a_line_updates_both_orders(self):
+        other = Order.objects.create(customer=self.customer)
+        line = OrderLine.objects.get(pk=self.add_line().pk)
+        line.order = other
+        line.save()
+        self.assertEqual((self.total(), self.total(other)), (Decimal('0'), Decimal('100.00')))
+
+    def test_bulk_operations_keep_total_fresh(self):
+        OrderLine.objects.bulk_create([OrderLine(order=self.order, product=self.product, price=10) for _ in range(3)])
+        self.assertEqual(self.total(), Decimal('30.00'))
+        self.order.order_lines.update(price=20)
+        self.assertEqual(self.total(), Decimal('60.00'))
+        with CaptureQueriesContext(connection) as context:
+            self.order.order_lines.filter(pk__in=self.order.order_lines.values('pk')[:2]).delete()
+        self.assertEqual(len([query for query in context.captured_queries if query['sql'].startswith('UPDATE')]), 1)
+        self.assertEqual(self.total(), Decimal('20.00'))
+        self.order.order_lines.get().delete()
+        self.assertEqual(self.total(), Decimal('0'))
+
+    def test_deleting_orders_skips_their_totals(self):
+        for _ in range(3):
+            self.add_line()
+        other = Order.objects.create(customer=self.customer)
+        self.add_line(order=other)
+        with CaptureQueriesContext(connection) as context:
+            self.order.delete()
+        self.assertFalse([query for query in context.captured_queries if query['sql'].startswith('UPDATE "jewellery_order"')])
+        with CaptureQueriesContext(connection) as context:
+            self.customer.delete()
+        self.assertFalse([query for query in context.captured_queries if query['sql'].startswith('UPDATE "jewellery_order"')])
+        self.assertFalse(OrderLine.objects.exists())
+
+    def test_deleting_a_product_refreshes_the_orders_of_its_lines(self):
+        self.add_line()
+        brooch = Product.objects.create(name='Brooch', price=50)
+        OrderLine.objects.create(order=self.order, product=brooch, price=Decimal('50.00'))
+        self.assertEqual(self.total(), Decimal('150.00'))
+        brooch.delete()
+        self.assertEqual(self.total(), Decimal('100.00'))
+
+    def test_reconcile_fixes_drifted_totals(self):
+        self.add_line(price='75.25')
+        Order.objects.filter(pk=self.order.pk).update(total=1)
+        call_command('reconcile_order_totals', stdout=io.StringIO())
+        self.assertEqual(self.total(), Decimal('1'))
+        call_command('reconcile_order_totals', '--fix', stdout=io.StringIO())
+        self.assertEqual(self.total(), Decimal('75.25'))
+
+
+class ImportOrderLinesTests(TestCase):
+
+    def setUp(self):
+        user = get_user_model().objects.create_user('ona', 'ona@example.com', 'secret')
+        self.order = Order.objects.create(customer=Customer.objects.create(user=user, phone='1'))
+        self.product = Product.objects.create(name='Band', price=80)
+        self.gold = MetalType.objects.create(alloy='Au 585')
+        self.silver = MetalType.objects.create(alloy='Ag 925')
+        self.pearl = Pearl.objects.create(parcel='P1', shape='round', color='white', size='6mm', type_name='akoya')
+
+    def import_rows(self, content, *args):
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        with open(handle, 'w', encoding='utf-8') as stream:
+            stream.write(content)
+        self.addCleanup(os.unlink, path)
+        output = io.StringIO()
+        call_command('import_order_lines', path, *args, stdout=output, stderr=io.StringIO())
+        return output.getvalue()
+
+    def csv_rows(self, count, metal='Au 585;Ag 925', pearl=None):
+        header = 'order,product,quantity,price,hand,finger,ring_size,metal_type,pearl,engraving\n'
+        row = f"{self.order.pk},{self.product.pk},2,,r,r,17,{metal},{pearl or self.pearl.pk},For you\n"
+        return header + row * count
+
+    def test_import_bulk_inserts_lines_and_m2m_rows(self):
+        with CaptureQueriesContext(connection) as context:
+            output = self.import_rows(self.csv_rows(250), '--batch-size', '100')
+        self.assertIn('Imported 250 order lines', output)
+        self.assertIn('rows/s', output)
+        self.assertLess(len(context.captured_queries), 40)
+        self.assertEqual(OrderLine.metal_type.through.objects.count(), 500)
+        self.assertEqual(self.pearl.orderline_set.count(), 250)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).total, Decimal('40000.00'))
+
+    def test_dry_run_validates_without_writing(self):
+        output = self.import_rows(self.csv_rows(3), '--dry-run')
+        self.assertIn('Dry run: all rows valid', output)
+        self.assertFalse(OrderLine.objects.exists())
+
+    def test_invalid_rows_abort_the_whole_import(self):
+        content = self.csv_rows(3) + f"{self.order.pk},{self.product.pk},1,,x,r,17,Pt 950,999,\n"
+        with self.assertRaisesMessage(CommandError, '1 invalid rows'):
+            self.import_rows(content, '--batch-size', '2')
+        self.assertFalse(OrderLine.objects.exists())
+
+    def test_import_reserves_pearl_stock(self):
+        Pearl.objects.filter(pk=self.pearl.pk).update(quantity=5)
+        with self.assertRaisesMessage(CommandError, 'nothing imported'):
+            self.import_rows(self.csv_rows(3))
+        self.assertFalse(OrderLine.objects.exists())
+        self.import_rows(self.csv_rows(2))
+        self.assertEqual(Pearl.objects.get(pk=self.pearl.pk).quantity, 1)
+
+
+class OrderDetailQueryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user('rasa', 'rasa@example.com', 'secret')
+        self.customer = Customer.objects.create(user=self.user, phone='1')
+        self.metals = [MetalType.objects.create(alloy=alloy) for alloy in ('Au 585', 'Ag 925')]
+        self.pearl = Pearl.objects.create(parcel='P1', shape='round', color='white', size='6mm', type_name='akoya')
+        self.client.force_login(self.user)
+
+    def order_with_lines(self, count):
+        order = Order.objects.create(customer=self.customer)
+        for number in range(count):
+            product = Product.objects.create(name=f"Ring {number}", price=10, jewellery_type=JewelleryType.objects.create(name=f"type {number}"))
+            line = OrderLine.objects.create(order=order, product=product, price=10, ring_size='17', hand='l', finger='r')
+            line.metal_type.set(self.metals)
+            line.pearl.add(self.pearl)
+        return order
+
+    def query_count(self, order):
+        self.client.get(reverse('order', kwargs={'pk': order.pk}))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('order', kwargs={'pk': order.pk}))
+        self.assertContains(response, 'Ag 925, Au 585')
+        return len(context.captured_queries)
+
+    def test_query_count_does_not_grow_with_lines(self):
+        single = self.query_count(self.order_with_lines(1))
+        self.assertEqual(self.query_count(self.order_with_lines(30)), single)
+        # one of them is the conditional GET validator query
+        self.assertLessEqual(single, 7)
+
+
+class ProductReviewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(name='Signet', price=100)
+        self.url = reverse('product', kwargs={'pk': self.product.pk})
+
+    def add_reviews(self, count, product=None):
+        for number in range(count):
+            user = get_user_model().objects.create_user(f"reviewer{ReviewProduct.objects.count()}")
+            ReviewProduct.objects.create(customer=user, product=product or self.product, review=f"Review {number}")
+
+    def review_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        # the validator query only joins the reviews for their latest timestamp
+        return response, [query for query in context.captured_queries if 'FROM "jewellery_reviewproduct"' in query['sql']]
+
+    def test_reviews_are_paged_with_customers_joined(self):
+        self.add_reviews(25)
+        response, queries = self.review_queries(self.url)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('user_profile_profile', queries[0]['sql'])
+        self.assertContains(response, "class='product_review'", count=10)
+        self.assertContains(response, 'Review 24')
+        cursor = response.context['review_page'].next_cursor
+        self.assertContains(self.client.get(self.url, {'reviews': cursor}), 'Review 14')
+
+    def test_warm_review_block_runs_no_review_queries(self):
+        self.add_reviews(5)
+        popular = Product.objects.create(name='Pendant', price=10)
+        self.add_reviews(200, product=popular)
+        for url in (self.url, reverse('product', kwargs={'pk': popular.pk})):
+            self.client.get(url)
+            response, queries = self.review_queries(url)
+            self.assertEqual(queries, [])
+            self.assertContains(response, "class='product_review'", count=5 if url == self.url else 10)
+
+    def test_new_review_invalidates_cached_block(self):
+        self.add_reviews(1)
+        self.client.get(self.url)
+        self.add_reviews(1)
+        self.assertContains(self.client.get(self.url), "class='product_review'", count=2)
+        ReviewProduct.objects.first().delete()
+        self.assertContains(self.client.get(self.url), "class='product_review'", count=1)
+
+
+class ReviewThrottleTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        # the whole test inside one throttle window
+        clock = mock.patch.object(Throttle, 'timer', mock.Mock(return_value=time.time()))
+        clock.start()
+        self.addCleanup(clock.stop)
+        self.user = get_user_model().objects.create_user('aiste')
+        self.product = Product.objects.create(name='Signet', price=100)
+        self.client.force_login(self.user)
+
+    def test_second_review_within_a_day_is_rejected_without_review_queries(self):
+        url = reverse('product', kwargs={'pk': self.product.pk})
+        data = {'review': 'Lovely', 'product': self.product.pk, 'customer': self.user.pk}
+        self.client.post(url, data)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(url, data)
+        self.assertContains(response, "You&#x27;re posting too much!")
+        self.assertEqual(ReviewProduct.objects.count(), 1)
+        self.assertFalse([query for query in context.captured_queries if '"created_at" >=' in query['sql']])
+
+    def test_posted_customer_does_not_choose_the_allowance(self):
+        url = reverse('product', kwargs={'pk': self.product.pk})
+        other = get_user_model().objects.create_user('ieva')
+        self.client.post(url, {'review': 'Lovely', 'product': self.product.pk, 'customer': other.pk})
+        self.client.post(url, {'review': 'Again', 'product': self.product.pk, 'customer': other.pk + 1})
+        self.assertEqual(list(ReviewProduct.objects.values_list('customer__username', flat=True)), ['aiste'])
+        self.client.force_login(other)
+        self.client.post(url, {'review': 'Mine too', 'product': self.product.pk, 'customer': self.user.pk})
+        self.assertEqual(ReviewProduct.objects.filter(customer=other).count(), 1)
+
+    def test_denied_retries_do_not_extend_the_wait(self):
+        throttle, day = Throttle('test', '1/d'), 60 * 60 * 24
+        with mock.patch.object(throttle, 'timer') as clock:
+            for now, allowed in ((1000, True), (2000, False), (day - 1, False), (day, True), (day + 1, False), (2 * day + 5000, True)):
+                clock.return_value = now
+                self.assertEqual(throttle.allow(self.user.pk), allowed, now)
+
+    def test_hits_are_counted_atomically_in_the_cache(self):
+        throttle = Throttle('test', '3/m')
+        with mock.patch.object(throttle, 'timer', return_value=600), mock.patch.object(throttle.cache, 'set') as cache_set:
+            self.assertEqual([throttle.allow(self.user.pk) for _ in range(4)], [True, True, True, False])
+        # add() and incr() only, a read-modify-write set() could lose a concurrent worker's hit
+        cache_set.assert_not_called()
+        self.assertEqual(cache.get(throttle.key(self.user.pk, 10)), 4)
+
+
+class AdminChangelistQueryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(self.admin)
+        self.metals = [MetalType.objects.create(alloy=alloy) for alloy in ('Au 585', 'Ag 925')]
+        self.categories = [Category.objects.create(name=name) for name in ('Rings', 'Gifts')]
+
+    def add_rows(self, count):
+        for number in range(count):
+            user = get_user_model().objects.create_user(f"customer{get_user_model().objects.count()}")
+            order = Order.objects.create(customer=Customer.objects.create(user=user, phone='1'))
+            product = Product.objects.create(name=f"Ring {number}", price=10, jewellery_type=JewelleryType.objects.create(name=f"type {number}"))
+            product.category.set(self.categories)
+            line = OrderLine.objects.create(order=order, product=product, price=10, ring_size='17', hand='l', finger='r')
+            line.metal_type.set(self.metals)
+
+    def query_count(self, model_name):
+        url = reverse(f'admin:jewellery_{model_name}_changelist')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        self.add_rows(2)
+        few = {name: self.query_count(name) for name in ('order', 'orderline', 'product')}
+        self.add_rows(30)
+        for name, count in few.items():
+            with self.subTest(name):
+                self.assertEqual(self.query_count(name), count)
+                self.assertLessEqual(count, 12)
+
+    def test_order_change_form_uses_autocomplete_widgets(self):
+        self.add_rows(3)
+        order = OrderLine.objects.get(product__name='Ring 0').order
+        response = self.client.get(reverse('admin:jewellery_order_change', args=[order.pk]))
+        self.assertContains(response, 'data-field-name="product"')
+        self.assertContains(response, 'Ring 0 type 0')
+        self.assertNotContains(response, 'Ring 2 type 2')
+        self.assertNotContains(response, 'customer2')
+
+    def test_estimated_count_stops_at_the_limit(self):
+        self.add_rows(3)
+        paginator = EstimatedCountPaginator(OrderLine.objects.order_by('pk'), 100)
+        paginator.count_limit = 2
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(paginator.count, 3)
+        self.assertIn('LIMIT 3', context.captured_queries[0]['sql'])
+
+
+class OverdueOrderTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('egle')
+        self.customer = Customer.objects.create(user=self.user, phone='1')
+        self.today = date.today()
+        self.late = Order.objects.create(customer=self.customer, status='m', due_date=self.today - timedelta(days=3))
+        self.paid = Order.objects.create(customer=self.customer, status='f', due_date=self.today - timedelta(days=3))
+        self.on_time = Order.objects.create(customer=self.customer, status='n', due_date=self.today + timedelta(days=3))
+
+    def query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            return ' '.join(row[-1] for row in cursor.fetchall())
+
+    def test_overdue_matches_property(self):
+        self.assertEqual(list(Order.objects.overdue()), [self.late])
+        annotated = {order.pk: order.overdue for order in Order.objects.with_overdue()}
+        self.assertEqual(annotated, {order.pk: order.is_overdue for order in Order.objects.all()})
+
+    def test_overdue_uses_status_due_date_index(self):
+        plan = self.query_plan(Order.objects.overdue())
+        self.assertIn('SEARCH jewellery_order USING INDEX order_status_due_date_idx', plan)
+        self.assertNotIn('SCAN jewellery_order', plan)
+
+    def test_customer_order_list_uses_customer_date_index(self):
+        plan = self.query_plan(Order.objects.filter(customer=self.customer).order_by('date'))
+        self.assertIn('SEARCH jewellery_order USING INDEX order_customer_date_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_order_list_marks_overdue_orders(self):
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get(reverse('user_orders')), ' overdue', count=2)
+
+    def test_overdue_report_groups_by_stage(self):
+        Order.objects.create(customer=self.customer, status='n', due_date=self.today - timedelta(days=1))
+        output = io.StringIO()
+        call_command('overdue_report', stdout=output, no_color=True)
+        report = output.getvalue()
+        self.assertLess(report.index('new - not approved'), report.index('manufacturing stage'))
+        self.assertNotIn('fully paid', report)
+        self.assertIn('2 overdue orders', report)
+
+    def test_finished_orders_are_not_overdue(self):
+        past = self.today - timedelta(days=3)
+        cancelled = Order.objects.create(customer=self.customer, status='c', due_date=past)
+        picked_up = Order.objects.create(customer=self.customer, status='p', due_date=past)
+        self.assertFalse(cancelled.is_overdue)
+        self.assertFalse(picked_up.is_overdue)
+        self.assertEqual(list(Order.objects.overdue()), [self.late])
+        annotated = {order.pk: order.overdue for order in Order.objects.with_overdue()}
+        self.assertEqual(annotated, {order.pk: order.is_overdue for order in Order.objects.all()})
+        output = io.StringIO()
+        call_command('overdue_report', stdout=output, no_color=True)
+        report = output.getvalue()
+        self.assertNotIn('cancelled', report)
+        self.assertNotIn('done and picked up', report)
+        self.assertIn('1 overdue orders', report)
+
+
+class BenchmarkCommandTests(MediaRootMixin, TestCase):
+
+    def test_seed_and_benchmark_every_view(self):
+        call_command('seed_benchmark_data', '--products', '30', '--customers', '5', '--orders', '10', '--reviews', '20', '--images', '1', stdout=io.StringIO())
+        self.assertEqual(Product.objects.count(), 30)
+        self.assertTrue(ImageRendition.objects.exists())
+        self.assertTrue(Order.objects.exclude(total=0).exists())
+        output = os.path.join(tempfile.mkdtemp(), 'results.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(output))
+        call_command('benchmark_views', '--processes', '1', '--requests', '12', '--warmup', '0', '--output', output, stdout=io.StringIO())
+        with open(output) as results_file:
+            results = json.load(results_file)
+        self.assertEqual(results['requests'], 12)
+        for name, summary in results['views'].items():
+            with self.subTest(name):
+                self.assertEqual(summary['errors'], 0)
+                self.assertEqual(summary['count'], 2)
+                self.assertGreater(summary['queries_mean'], 0)
+
+
+class RequestMetricsTests(TestCase):
+
+    def setUp(self):
+        metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, metrics_dir, ignore_errors=True)
+        settings_override = override_settings(METRICS_DIR=metrics_dir, METRICS_TOKEN=None)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.metrics_dir = metrics_dir
+        registry.series = {}
+        self.product = Product.objects.create(name='Signet', price=100)
+
+    def test_server_timing_reports_queries_and_template(self):
+        url = reverse('product', kwargs={'pk': self.product.pk})
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        timing = dict(part.strip().split(';', 1) for part in response['Server-Timing'].split(','))
+        self.assertIn(f'desc="{len(context.captured_queries)} queries"', timing['db'])
+        self.assertNotEqual(timing['tpl'], 'dur=0.0')
+        self.assertIn('total', timing)
+
+    def test_endpoint_merges_snapshots_of_every_process(self):
+        self.client.get(reverse('product', kwargs={'pk': self.product.pk}))
+        other = {'request_duration_seconds|product': [[1] + [0] * 11, 0.002, 1]}
+        # a live process: the one that started the tests
+        with open(os.path.join(self.metrics_dir, f'metrics-{os.getppid()}.json'), 'w') as snapshot:
+            json.dump(other, snapshot)
+        response = self.client.get(reverse('metrics'))
+        self.assertContains(response, '# TYPE jewellery_request_duration_seconds histogram')
+        self.assertContains(response, 'jewellery_request_duration_seconds_count{view="product"} 2')
+        self.assertContains(response, 'jewellery_request_duration_seconds_bucket{view="product",le="+Inf"} 2')
+
+    def test_snapshots_of_exited_processes_are_pruned(self):
+        self.client.get(reverse('product', kwargs={'pk': self.product.pk}))
+        exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+        exited.wait()
+        stale = os.path.join(self.metrics_dir, f'metrics-{exited.pid}.json')
+        with open(stale, 'w') as snapshot:
+            json.dump({'request_duration_seconds|product': [[1] + [0] * 11, 0.002, 1]}, snapshot)
+        self.assertContains(self.client.get(reverse('metrics')), 'jewellery_request_duration_seconds_count{view="product"} 1')
+        self.assertFalse(os.path.exists(stale))
+        registry.flush()
+        registry.remove()
+        self.assertFalse(os.path.exists(registry.path()))
+
+    @override_settings(METRICS_SLOW_REQUEST_MS=0)
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs('jewellery.metrics', 'WARNING') as logs:
+            self.client.get(reverse('products'))
+        self.assertIn('Slow request GET /products/ (products)', logs.output[0])
+
+    @override_settings(METRICS_TOKEN='scrape')
+    def test_endpoint_requires_token_when_configured(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape').status_code, 200)
+
+
+class DatabaseProfileTests(TransactionTestCase):
+
+    def test_sqlite_connections_are_tuned(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 20000)
+
+    def test_transactions_take_the_write_lock_up_front(self):
+        with CaptureQueriesContext(connection) as context:
+            with transaction.atomic():
+                Product.objects.count()
+        self.assertEqual(context.captured_queries[0]['sql'], 'BEGIN IMMEDIATE')
+
+
+class AsyncViewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.factory = AsyncRequestFactory()
+        self.user = get_user_model().objects.create_user('ona')
+        self.customer = Customer.objects.create(user=self.user, phone='1')
+        self.ring = Product.objects.create(name='Gold ring', price=100)
+        self.order = Order.objects.create(customer=self.customer, status='m', due_date=date.today() - timedelta(days=1))
+        OrderLine.objects.create(order=self.order, product=self.ring, price=100)
+
+    async def get(self, view, path, user=None, **kwargs):
+        request = self.factory.get(path)
+        request.user = user or AnonymousUser()
+        response = await view(request, **kwargs)
+        if hasattr(response, 'render'):
+            await sync_to_async(response.render)()
+        return response
+
+    async def test_catalogue_pages(self):
+        await sync_to_async(Category.objects.create)(name='Rings')
+        response = await self.get(async_views.index, '/')
+        self.assertContains(response, 'Rings')
+        response = await self.get(async_views.ProductListView.as_view(), '/products/?search=gold')
+        self.assertContains(response, 'Gold ring')
+        self.assertEqual(response.context_data['page_obj'].count, 1)
+        response = await self.get(async_views.ProductDetailView.as_view(), '/product/', pk=self.ring.pk)
+        self.assertContains(response, '<h1>Gold ring</h1>', html=True)
+
+    async def test_missing_product_is_404(self):
+        with self.assertRaises(Http404):
+            await self.get(async_views.ProductDetailView.as_view(), '/product/', pk=self.ring.pk + 1)
+
+    async def test_order_pages_require_login(self):
+        response = await self.get(async_views.OrderListView.as_view(), '/my_orders/')
+        self.assertEqual(response.status_code, 302)
+        response = await self.get(async_views.OrderListView.as_view(), '/my_orders/', user=self.user)
+        self.assertContains(response, ' overdue', count=2)
+        response = await self.get(async_views.OrderDetailView.as_view(), '/order/', user=self.user, pk=self.order.pk)
+        self.assertContains(response, 'Gold ring')
+
+
+class AnonymousPageCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.jewellery_type = JewelleryType.objects.create(name='ring')
+        self.product = Product.objects.create(name='Signet', price=100, jewellery_type=self.jewellery_type)
+        self.detail_url = reverse('product', kwargs={'pk': self.product.pk})
+
+    def fetch(self, url, **extra):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, **extra)
+        return response, len(context.captured_queries)
+
+    def test_deploy_check_warns_about_a_per_process_cache(self):
+        self.assertEqual([warning.id for warning in check_shared_cache(None)], ['jewellery.W001'])
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://127.0.0.1:6379/1'}}
+        with override_settings(CACHES=shared):
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_second_anonymous_request_is_served_from_cache(self):
+        for url in (reverse('index'), reverse('products'), self.detail_url):
+            with self.subTest(url):
+                self.assertEqual(self.fetch(url)[0]['X-Page-Cache'], 'miss')
+                response, queries = self.fetch(url)
+                self.assertEqual(response['X-Page-Cache'], 'hit')
+                self.assertEqual(queries, 0)
+
+    def test_csrf_token_is_filled_in_per_request(self):
+        self.client.get(reverse('index'))
+        response = self.client.get(reverse('index'))
+        self.assertNotContains(response, 'csrf_token__')
+        self.assertContains(response, 'name="csrfmiddlewaretoken"')
+        self.assertIn('csrftoken', response.cookies)
+
+    def test_languages_are_cached_separately(self):
+        self.client.get(reverse('products'))
+        self.assertEqual(self.client.get(reverse('products'), HTTP_ACCEPT_LANGUAGE='lt')['X-Page-Cache'], 'miss')
+
+    def test_signed_in_users_are_not_served_cached_pages(self):
+        self.client.force_login(get_user_model().objects.create_user('ruta'))
+        self.client.get(self.detail_url)
+        self.assertNotIn('X-Page-Cache', self.client.get(self.detail_url))
+
+    def test_model_changes_invalidate_the_pages_showing_them(self):
+        self.client.get(self.detail_url)
+        self.client.get(reverse('products'))
+        self.product.name = 'Signet ring'
+        self.product.save()
+        self.assertContains(self.client.get(self.detail_url), 'Signet ring')
+        self.assertContains(self.client.get(reverse('products')), 'Signet ring')
+        self.jewellery_type.name = 'band'
+        self.jewellery_type.save()
+        self.assertContains(self.client.get(self.detail_url), '<title>Signet ring band</title>', html=True)
+        Category.objects.create(name='Heirlooms')
+        self.assertContains(self.client.get(self.detail_url), 'Heirlooms')
+        ReviewProduct.objects.create(customer=get_user_model().objects.create_user('ieva'), product=self.product, review='Beautiful')
+        self.assertContains(self.client.get(self.detail_url), 'Beautiful')
+
+    def test_unrelated_product_change_keeps_detail_page(self):
+        self.client.get(self.detail_url)
+        Product.objects.create(name='Pendant', price=10)
+        self.assertEqual(self.client.get(self.detail_url)['X-Page-Cache'], 'hit')
+        self.assertEqual(self.client.get(reverse('products'))['X-Page-Cache'], 'miss')
+
+
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user('ruta')
+        self.customer = Customer.objects.create(user=self.user, phone='1')
+        self.product = Product.objects.create(name='Signet', price=100)
+        self.order = Order.objects.create(customer=self.customer)
+        OrderLine.objects.create(order=self.order, product=self.product, price=100)
+        self.client.force_login(self.user)
+
+    def revalidate(self, url, response):
+        with CaptureQueriesContext(connection) as context:
+            revalidated = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        return revalidated, len(context.captured_queries)
+
+    def test_unchanged_pages_answer_not_modified(self):
+        urls = (
+            reverse('products'), reverse('product', kwargs={'pk': self.product.pk}),
+            reverse('user_orders'), reverse('order', kwargs={'pk': self.order.pk}),
+        )
+        for url in urls:
+            with self.subTest(url):
+                response = self.client.get(url)
+                revalidated, queries = self.revalidate(url, response)
+                self.assertEqual(revalidated.status_code, 304)
+                self.assertEqual(revalidated['ETag'], response['ETag'])
+                self.assertEqual(revalidated.content, b'')
+                self.assertLess(queries, 5)
+
+    def test_last_modified_follows_the_order_lines(self):
+        url = reverse('order', kwargs={'pk': self.order.pk})
+        response = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        OrderLine.objects.filter(order=self.order).update(price=120)
+        self.assertContains(self.revalidate(url, response)[0], '120')
+
+    def test_bulk_status_changes_change_the_etag(self):
+        urls = (reverse('user_orders'), reverse('order', kwargs={'pk': self.order.pk}))
+        pages = [self.client.get(url) for url in urls]
+        Order.objects.filter(pk=self.order.pk).update(status='d')
+        for url, page in zip(urls, pages):
+            with self.subTest(url):
+                self.assertEqual(self.revalidate(url, page)[0].status_code, 200)
+        self.assertContains(self.client.get(urls[0]), 'done but not picked up')
+
+    def test_changes_shown_on_the_page_change_the_etag(self):
+        product_url = reverse('product', kwargs={'pk': self.product.pk})
+        order_url = reverse('order', kwargs={'pk': self.order.pk})
+        product_page, order_page = self.client.get(product_url), self.client.get(order_url)
+        self.product.name = 'Signet ring'
+        self.product.save()
+        self.assertContains(self.revalidate(order_url, order_page)[0], 'Signet ring')
+        product_page = self.client.get(product_url)
+        ReviewProduct.objects.create(customer=self.user, product=self.product, review='Beautiful')
+        self.assertContains(self.revalidate(product_url, product_page)[0], 'Beautiful')
+        list_page = self.client.get(reverse('user_orders'))
+        Order.objects.create(customer=self.customer)
+        self.assertEqual(self.revalidate(reverse('user_orders'), list_page)[0].status_code, 200)
+
+    def test_etag_differs_per_user_and_language(self):
+        url = reverse('products')
+        etag = self.client.get(url)['ETag']
+        self.assertNotEqual(self.client.get(url, HTTP_ACCEPT_LANGUAGE='lt')['ETag'], etag)
+        self.client.force_login(get_user_model().objects.create_user('ieva'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_cached_anonymous_pages_revalidate_without_reading_the_cache(self):
+        self.client.logout()
+        url = reverse('product', kwargs={'pk': self.product.pk})
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        revalidated, queries = self.revalidate(url, response)
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(queries, 0)
+
+
+class StaticPipelineTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.static_root = tempfile.mkdtemp()
+        cls.settings = override_settings(STATIC_ROOT=cls.static_root)
+        cls.settings.enable()
+        call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(cls.static_root, 'staticfiles.json')) as manifest:
+            cls.hashed_css = json.load(manifest)['paths']['jewellery/css/base.css']
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings.disable()
+        shutil.rmtree(cls.static_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        # the index page is cached whole
+        cache.clear()
+
+    def test_collectstatic_writes_hashed_and_compressed_files(self):
+        self.assertRegex(self.hashed_css, r'^jewellery/css/base\.[0-9a-f]{12}\.css$')
+        for name in (self.hashed_css, 'jewellery/css/base.css'):
+            with open(os.path.join(self.static_root, name), 'rb') as original, open(os.path.join(self.static_root, name + '.gz'), 'rb') as variant:
+                self.assertEqual(gzip.decompress(variant.read()), original.read())
+        self.assertFalse(os.path.exists(os.path.join(self.static_root, 'jewellery/img/ring_icon.jpg.gz')))
+        self.assertContains(self.client.get(reverse('index')), f'/static/{self.hashed_css}')
+
+    def test_hashed_files_are_immutable_and_negotiated(self):
+        url = f'/static/{self.hashed_css}'
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='br;q=0, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn(b'body', gzip.decompress(b''.join(response.streaming_content)))
+        for header in ('', 'gzip;q=0'):
+            with self.subTest(header):
+                self.assertFalse(self.client.get(url, HTTP_ACCEPT_ENCODING=header).has_header('Content-Encoding'))
+
+    def test_unhashed_files_revalidate(self):
+        response = self.client.get('/static/jewellery/img/ring_icon.jpg')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        self.assertNotIn('Vary', response)
+        revalidated = self.client.get('/static/jewellery/img/ring_icon.jpg', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_missing_and_outside_files_fall_through(self):
+        self.assertEqual(self.client.get('/static/jewellery/css/missing.css').status_code, 404)
+        self.assertEqual(self.client.get('/static/../manage.py').status_code, 404)
+
+    def test_templates_render_before_collectstatic(self):
+        empty_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, empty_root, ignore_errors=True)
+        with override_settings(STATIC_ROOT=empty_root):
+            self.assertContains(self.client.get(reverse('index')), '/static/jewellery/css/base.css')
+
+
+class MediaServingTests(MediaRootMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.owner = get_user_model().objects.create_user('ruta')
+        order = Order.objects.create(customer=Customer.objects.create(user=self.owner, phone='1'))
+        self.line = OrderLine.objects.create(order=order, product=Product.objects.create(name='Signet', price=10), price=10)
+        self.data = bytes(range(256)) * 40
+        self.line.engraving_file.save('crest.dxf', SimpleUploadedFile('crest.dxf', self.data))
+        self.url = f"/media/{self.line.engraving_file.name}"
+
+    def content(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_order_files_are_served_to_the_owner_and_staff_only(self):
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.client.force_login(get_user_model().objects.create_user('ieva'))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        for user in (self.owner, get_user_model().objects.create_user('admin', is_staff=True)):
+            self.client.force_login(user)
+            response = self.client.get(self.url)
+            self.assertEqual(self.content(response), self.data)
+            self.assertEqual(response['Cache-Control'], 'private, no-cache')
+
+    def test_dot_segments_do_not_bypass_access_checks(self):
+        name = self.line.engraving_file.name
+        for url in (f"/media/./{name}", f"/media/x/../{name}", f"/media/product_images/%2e%2e/{name}", f"/media/engraving_files//{name.split('/', 1)[1]}"):
+            with self.subTest(url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.force_login(self.owner)
+        response = self.client.get(f"/media/x/../{name}")
+        self.assertEqual(self.content(response), self.data)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+
+    @override_settings(MEDIA_SENDFILE_HEADER='X-Sendfile')
+    def test_sendfile_header_names_the_normalized_file(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(f"/media/./{self.line.engraving_file.name}")
+        self.assertEqual(response['X-Sendfile'], os.path.join(os.path.abspath(settings.MEDIA_ROOT), self.line.engraving_file.name))
+
+    def test_rendition_of_an_order_photo_is_private(self):
+        rendition = ImageRendition.objects.create(source='product_photos/ring.jpg', width=160, height=100, format='jpeg', file='renditions/product_photos/ring-160w.jpg')
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, 'renditions/product_photos'))
+        with open(os.path.join(settings.MEDIA_ROOT, rendition.file.name), 'wb') as rendition_file:
+            rendition_file.write(b'jpeg')
+        OrderLine.objects.filter(pk=self.line.pk).update(photo='product_photos/ring.jpg')
+        self.assertEqual(self.client.get(f"/media/{rendition.file.name}").status_code, 404)
+        self.client.force_login(self.owner)
+        self.assertEqual(self.content(self.client.get(f"/media/{rendition.file.name}")), b'jpeg')
+
+    def test_range_requests(self):
+        self.client.force_login(self.owner)
+        cases = (('bytes=0-9', 0, 9), ('bytes=10200-', 10200, 10239), ('bytes=-5', 10235, 10239), ('bytes=100-99999', 100, 10239))
+        for header, start, end in cases:
+            with self.subTest(header):
+                response = self.client.get(self.url, HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response['Content-Range'], f"bytes {start}-{end}/10240")
+                self.assertEqual(int(response['Content-Length']), end - start + 1)
+                self.assertEqual(self.content(response), self.data[start:end + 1])
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=20000-').status_code, 416)
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=0-1,5-6').status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"').status_code, 200)
+
+    def test_conditional_requests(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(self.url)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=response['ETag']).status_code, 206)
+
+    @override_settings(MEDIA_SENDFILE_HEADER='X-Accel-Redirect')
+    def test_front_proxy_handoff(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f"/protected-media/{self.line.engraving_file.name}")
+        self.assertEqual(response.content, b'')
+
+    def test_public_files_and_traversal(self):
+        with open(os.path.join(settings.MEDIA_ROOT, 'notice.txt'), 'w') as notice:
+            notice.write('open')
+        response = self.client.get('/media/notice.txt')
+        self.assertEqual(self.content(response), b'open')
+        self.assertIn('public', response['Cache-Control'])
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+
+
+class OrderExportTests(TestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(user=get_user_model().objects.create_user('ruta'), phone='+370')
+        gold = MetalType.objects.create(alloy='Au 585')
+        pearl = Pearl.objects.create(parcel='P1', shape='round', color='white', size='6mm', type_name='akoya')
+        self.orders = []
+        for number, status in enumerate(('n', 'n', 'f')):
+            order = Order.objects.create(customer=self.customer, status=status)
+            for line_number in range(2):
+                line = OrderLine.objects.create(
+                    order=order, product=Product.objects.create(name=f'Ring {number}.{line_number}', price=10),
+                    price=10, ring_size='17', hand='l', finger='r', engraving='"Forever" & <always>',
+                )
+                line.metal_type.add(gold)
+                line.pearl.add(pearl)
+            self.orders.append(order)
+        self.output = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output, ignore_errors=True)
+
+    def test_csv_cells_cannot_start_a_formula(self):
+        line = OrderLine.objects.filter(order=self.orders[0]).first()
+        OrderLine.objects.filter(pk=line.pk).update(engraving='=HYPERLINK("http://evil.example","x")', specification='@SUM(1)', measurement='\t-1+1')
+        Product.objects.filter(pk=line.product_id).update(name='+cmd|calc')
+        content = ''.join(exports.stream_csv(OrderLine.objects.filter(pk=line.pk)))
+        row = list(csv.DictReader(io.StringIO(content.lstrip('\ufeff'))))[0]
+        self.assertEqual(
+            (row['engraving text'], row['specification'], row['measurement'], row['product']),
+            ('\'=HYPERLINK("http://evil.example","x")', "'@SUM(1)", "'\t-1+1", "'+cmd|calc"),
+        )
+        self.assertEqual((row['quantity'], row['price']), ('1', '10.00'))
+
+    def test_csv_has_line_specifications_and_filters(self):
+        path = os.path.join(self.output, 'lines.csv')
+        call_command('export_orders', path, '--status', 'n', '--from', date.today().isoformat(), stdout=io.StringIO())
+        with open(path, encoding='utf-8-sig', newline='') as export_file:
+            rows = list(csv.DictReader(export_file))
+        self.assertEqual([row['product'] for row in rows], ['Ring 0.0', 'Ring 0.1', 'Ring 1.0', 'Ring 1.1'])
+        self.assertEqual(
+            {key: rows[0][key] for key in ('status', 'ring_size', 'hand', 'finger', 'metal type(s)', 'pearl(s)', 'engraving text', 'phone')},
+            {'status': 'new - not approved', 'ring_size': '17', 'hand': 'left', 'finger': 'ring', 'metal type(s)': 'Au 585',
+             'pearl(s)': 'akoya white / 6mm', 'engraving text': '"Forever" & <always>', 'phone': "'+370"},
+        )
+        call_command('export_orders', path, '--to', (date.today() - timedelta(days=1)).isoformat(), stdout=io.StringIO())
+        with open(path, encoding='utf-8-sig') as export_file:
+            self.assertEqual(len(export_file.readlines()), 1)
+
+    def test_prefetches_once_per_chunk(self):
+        lines = exports.export_queryset()
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(len(list(exports.stream_csv(lines, chunk_size=4))), 7)
+        # the lines query, then metal types and pearls for each of the two chunks
+        self.assertEqual(len(context.captured_queries), 5)
+
+    def test_xlsx_is_a_valid_workbook(self):
+        path = os.path.join(self.output, 'lines.xlsx')
+        call_command('export_orders', path, stdout=io.StringIO())
+        with zipfile.ZipFile(path) as workbook:
+            self.assertIsNone(workbook.testzip())
+            sheet = ElementTree.fromstring(workbook.read('xl/worksheets/sheet1.xml'))
+        namespace = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        rows = sheet.findall('.//s:row', namespace)
+        self.assertEqual(len(rows), 7)
+        texts = [text.text for text in rows[1].findall('.//s:t', namespace)]
+        self.assertIn('"Forever" & <always>', texts)
+        self.assertEqual(rows[1].find('s:c', namespace).find('s:v', namespace).text, str(self.orders[0].pk))
+
+    def test_admin_action_streams_selected_orders(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'secret'))
+        response = self.client.post(reverse('admin:jewellery_order_changelist'), {
+            'action': 'export_lines_csv', '_selected_action': [self.orders[2].pk],
+        })
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment;', response['Content-Disposition'])
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        self.assertEqual(content.count('Ring 2.'), 2)
+        self.assertNotIn('Ring 0.', content)
+
+
+class SalesSummaryTests(TestCase):
+
+    def setUp(self):
+        self.customer = Customer.objects.create(user=get_user_model().objects.create_user('ruta'), phone='+370')
+        self.rings = Category.objects.create(name='Rings')
+        self.gifts = Category.objects.create(name='Gifts')
+        self.gold = MetalType.objects.create(alloy='Au 585')
+        self.ring = Product.objects.create(name='Ring', price=10, jewellery_type=JewelleryType.objects.create(name='ring'))
+        self.ring.category.add(self.rings, self.gifts)
+        self.month = first_of_month(date.today())
+
+    def summaries(self):
+        return sorted(
+            (summary.month, summary.dimension, summary.key, summary.label, summary.revenue, summary.quantity, summary.line_count, summary.order_count)
+            for summary in SalesSummary.objects.all()
+        )
+
+    def revenue(self, dimension, key=''):
+        return SalesSummary.objects.get(month=self.month, dimension=dimension, key=str(key)).revenue
+
+    def test_incremental_updates_match_a_full_rebuild(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(customer=self.customer)
+            line = OrderLine.objects.create(order=order, product=self.ring, price=10, quantity=2)
+            line.metal_type.add(self.gold)
+            OrderLine.objects.create(order=order, product=self.ring, price=5)
+        self.assertEqual(self.revenue('total'), Decimal('25'))
+        self.assertEqual(self.revenue('metal_type', self.gold.pk), Decimal('20'))
+        with self.captureOnCommitCallbacks(execute=True):
+            line.quantity = 3
+            line.save()
+            OrderLine.objects.filter(price=5).delete()
+        self.assertEqual(self.revenue('total'), Decimal('30'))
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = 'c'
+            order.save()
+        self.assertFalse(SalesSummary.objects.filter(dimension='total').exists())
+        self.assertEqual(self.revenue('status', 'c'), Decimal('30'))
+        incremental = self.summaries()
+        rebuild_months()
+        self.assertEqual(incremental, self.summaries())
+
+    def test_bulk_status_changes_update_the_summaries(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.create(customer=self.customer)
+            OrderLine.objects.create(order=order, product=self.ring, price=10)
+        self.assertEqual(self.revenue('status', 'n'), Decimal('10'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.filter(pk=order.pk).update(status='c')
+        self.assertFalse(SalesSummary.objects.filter(dimension='status', key='n').exists())
+        self.assertEqual(self.revenue('status', 'c'), Decimal('10'))
+        incremental = self.summaries()
+        rebuild_months()
+        self.assertEqual(incremental, self.summaries())
+
+    def test_line_counts_towards_each_category(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            OrderLine.objects.create(order=Order.objects.create(customer=self.customer), product=self.ring, price=10)
+        self.assertEqual(self.revenue('category', self.rings.pk), Decimal('10'))
+        self.assertEqual(self.revenue('category', self.gifts.pk), Decimal('10'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ring.category.remove(self.gifts)
+            self.rings.name = 'Fine rings'
+            self.rings.save()
+        self.assertFalse(SalesSummary.objects.filter(dimension='category', key=str(self.gifts.pk)).exists())
+        self.assertEqual(SalesSummary.objects.get(dimension='category', key=str(self.rings.pk)).label, 'Fine rings')
+
+    def test_rebuild_command_limits_to_months(self):
+        order = Order.objects.create(customer=self.customer)
+        OrderLine.objects.create(order=order, product=self.ring, price=10)
+        Order.objects.filter(pk=order.pk).update(date=date(2020, 5, 17))
+        call_command('rebuild_sales_summary', '--month', '2020-05', stdout=io.StringIO())
+        self.assertEqual(set(SalesSummary.objects.values_list('month', flat=True)), {date(2020, 5, 1)})
+        with self.assertRaises(CommandError):
+            call_command('rebuild_sales_summary', '--month', 'May', stdout=io.StringIO())
+
+    def test_dashboard_reads_only_the_summaries(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            OrderLine.objects.create(order=Order.objects.create(customer=self.customer), product=self.ring, price=10)
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'secret'))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('admin:jewellery_salessummary_changelist'), {'months': 3})
+        self.assertContains(response, 'Rings')
+        self.assertContains(response, 'new - not approved')
+        self.assertFalse([query for query in context.captured_queries if 'jewellery_order' in query['sql']])
+
+
+class StockReservationTests(TestCase):
+
+    def setUp(self):
+        self.order = Order.objects.create(customer=Customer.objects.create(user=get_user_model().objects.create_user('ona'), phone='1'))
+        self.product = Product.objects.create(name='Strand', price=10)
+        self.pearl = Pearl.objects.create(parcel='P1', shape='round', color='white', size='6mm', type_name='akoya', quantity=5)
+
+    def line(self, quantity=2):
+        return OrderLine.objects.create(order=self.order, product=self.product, price=10, quantity=quantity)
+
+    def stock(self):
+        return Pearl.objects.get(pk=self.pearl.pk).quantity
+
+    def test_adding_pearls_takes_stock_with_a_conditional_update(self):
+        with CaptureQueriesContext(connection) as context:
+            self.line().pearl.add(self.pearl)
+        self.assertEqual(self.stock(), 3)
+        updates = [query['sql'] for query in context.captured_queries if query['sql'].startswith('UPDATE "jewellery_pearl"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"quantity" >= 2', updates[0])
+        line = self.line(quantity=4)
+        with self.assertRaises(InsufficientStock), transaction.atomic():
+            line.pearl.add(self.pearl)
+        self.assertEqual(self.stock(), 3)
+        self.assertFalse(line.pearl.exists())
+
+    def test_untracked_pearls_reserve_nothing(self):
+        untracked = Pearl.objects.create(parcel='P2', shape='round', color='black', size='8mm', type_name='tahiti')
+        self.line(quantity=100).pearl.add(untracked)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_cancelling_releases_once(self):
+        self.line().pearl.add(self.pearl)
+        self.line(quantity=1).pearl.add(self.pearl)
+        self.assertEqual(self.stock(), 2)
+        self.order.status = 'c'
+        self.order.save()
+        self.order.save()
+        self.assertEqual(release_order(self.order), 0)
+        self.assertEqual(self.stock(), 5)
+        self.assertFalse(StockReservation.objects.filter(released_at__isnull=True).exists())
+
+    def test_bulk_cancelling_releases_and_reopening_reserves_again(self):
+        self.line().pearl.add(self.pearl)
+        Order.objects.filter(pk=self.order.pk).update(status='c')
+        self.assertEqual(self.stock(), 5)
+        Order.objects.filter(pk=self.order.pk).update(status='c')
+        self.assertEqual(self.stock(), 5)
+        Order.objects.filter(pk=self.order.pk).update(status='a')
+        self.assertEqual(self.stock(), 3)
+        self.assertEqual(StockReservation.objects.filter(released_at__isnull=True).count(), 1)
+
+    def test_reopening_without_stock_is_refused(self):
+        self.line(quantity=4).pearl.add(self.pearl)
+        self.order.status = 'c'
+        self.order.save()
+        Pearl.objects.filter(pk=self.pearl.pk).update(quantity=2)
+        self.order.status = 'n'
+        with self.assertRaises(InsufficientStock), transaction.atomic():
+            self.order.save()
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, 'c')
+        with self.assertRaises(InsufficientStock), transaction.atomic():
+            Order.objects.filter(pk=self.order.pk).update(status='n')
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, 'c')
+        Pearl.objects.filter(pk=self.pearl.pk).update(quantity=5)
+        self.order.save()
+        self.assertEqual(self.stock(), 1)
+
+    def test_changing_the_quantity_resizes_the_reservations(self):
+        line = self.line()
+        line.pearl.add(self.pearl)
+        line.quantity = 4
+        line.save()
+        self.assertEqual(self.stock(), 1)
+        line.quantity = 1
+        line.save()
+        self.assertEqual(self.stock(), 4)
+        self.assertEqual(StockReservation.objects.get().quantity, 1)
+        line.quantity = 6
+        with self.assertRaises(InsufficientStock), transaction.atomic():
+            line.save()
+        self.assertEqual((OrderLine.objects.get(pk=line.pk).quantity, self.stock()), (1, 4))
+        line.delete()
+        self.assertEqual(self.stock(), 5)
+
+    def test_removing_pearls_or_deleting_lines_releases(self):
+        line = self.line()
+        line.pearl.add(self.pearl)
+        line.pearl.remove(self.pearl)
+        self.assertEqual(self.stock(), 5)
+        self.pearl.orderline_set.add(line)
+        self.assertEqual(self.stock(), 3)
+        line.delete()
+        self.assertEqual(self.stock(), 5)
+
+    def cancel_without_stock(self):
+        self.line(quantity=4).pearl.add(self.pearl)
+        self.order.status = 'c'
+        self.order.save()
+        Pearl.objects.filter(pk=self.pearl.pk).update(quantity=2)
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'secret'))
+
+    def test_admin_reports_orders_that_cannot_be_reopened(self):
+        self.cancel_without_stock()
+        response = self.client.post(reverse('admin:jewellery_order_changelist'), {
+            'action': 'mark_done', '_selected_action': [self.order.pk],
+        }, follow=True)
+        self.assertContains(response, 'No orders were marked as done')
+        response = self.client.post(reverse('admin:jewellery_order_changelist'), {
+            'form-TOTAL_FORMS': 1, 'form-INITIAL_FORMS': 1, 'form-0-id': self.order.pk,
+            'form-0-status': 'n', 'form-0-due_date': self.order.due_date.isoformat(), '_save': 'Save',
+        })
+        self.assertContains(response, 'left in stock to reopen the order')
+        response = self.client.post(reverse('admin:jewellery_order_change', args=[self.order.pk]), {
+            'customer': self.order.customer_id, 'status': 'n', 'due_date': self.order.due_date.isoformat(),
+            'total': '0', 'order_lines-TOTAL_FORMS': 0, 'order_lines-INITIAL_FORMS': 0,
+        })
+        self.assertContains(response, 'left in stock to reopen the order')
+        self.assertEqual((Order.objects.get(pk=self.order.pk).status, self.stock()), ('c', 2))
+
+    def test_admin_form_checks_stock(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'secret'))
+        line = self.line(quantity=6)
+        gold = MetalType.objects.create(alloy='Au 585')
+        response = self.client.post(reverse('admin:jewellery_orderline_change', args=[line.pk]), {
+            'order': self.order.pk, 'product': self.product.pk, 'quantity': 6, 'price': 10,
+            'metal_type': [gold.pk], 'pearl': [self.pearl.pk],
+        })
+        self.assertContains(response, 'Only 5 of')
+        self.assertEqual(self.stock(), 5)
+
+
+class FlakyEmailBackend(locmem.EmailBackend):
+    created = 0
+    failures = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        FlakyEmailBackend.created += 1
+
+    def send_messages(self, messages):
+        if FlakyEmailBackend.failures:
+            FlakyEmailBackend.failures -= 1
+            raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        return super().send_messages(messages)
+
+
+class EmailOutboxTests(TestCase):
+
+    def setUp(self):
+        self.orders = [
+            Order.objects.create(customer=Customer.objects.create(user=get_user_model().objects.create_user(name, email, first_name=name.title()), phone='1'))
+            for name, email in (('ona', 'ona@example.com'), ('rasa', 'rasa@example.com'), ('jonas', ''))
+        ]
+
+    def test_status_change_queues_email_in_the_same_transaction(self):
+        order = self.orders[0]
+        order.status = 'm'
+        order.save()
+        self.assertFalse(EmailOutbox.objects.exists())
+        with self.assertRaises(ValueError), transaction.atomic():
+            order.status = 'd'
+            order.save()
+            raise ValueError
+        self.assertFalse(EmailOutbox.objects.exists())
+        order = Order.objects.get(pk=order.pk)
+        order.status = 'd'
+        order.save()
+        order.save()
+        email = EmailOutbox.objects.get()
+        self.assertEqual((email.recipient, email.status), ('ona@example.com', 'q'))
+        self.assertIn(f'#{order.pk}', email.subject)
+        self.assertIn('Hi Ona!', email.body)
+        self.assertEqual(mail.outbox, [])
+
+    def test_bulk_status_changes_queue_once_per_order(self):
+        Order.objects.filter(pk=self.orders[0].pk).update(status='d')
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'secret'))
+        self.client.post(reverse('admin:jewellery_order_changelist'), {
+            'action': 'mark_done', '_selected_action': [order.pk for order in self.orders],
+        })
+        self.assertEqual(Order.objects.filter(status='d').count(), 3)
+        # the customer without an address gets nothing
+        self.assertEqual(sorted(EmailOutbox.objects.values_list('recipient', flat=True)), ['ona@example.com', 'rasa@example.com'])
+
+    @override_settings(EMAIL_BACKEND='jewellery.tests.FlakyEmailBackend')
+    def test_dispatch_reuses_one_connection_and_backs_off(self):
+        for order in self.orders:
+            order.status = 'd'
+            order.save()
+        FlakyEmailBackend.created, FlakyEmailBackend.failures = 0, 1
+        output = io.StringIO()
+        call_command('dispatch_outbox', '--once', stdout=output)
+        self.assertIn('sent 1, retried 1, failed 0', output.getvalue())
+        self.assertEqual(FlakyEmailBackend.created, 1)
+        retry = EmailOutbox.objects.get(status='q')
+        self.assertEqual(retry.attempts, 1)
+        self.assertIn('SMTPServerDisconnected', retry.last_error)
+        self.assertGreater(retry.run_after, timezone.now())
+        EmailOutbox.objects.filter(pk=retry.pk).update(run_after=timezone.now())
+        call_command('dispatch_outbox', '--once', stdout=output)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertFalse(EmailOutbox.objects.exclude(status='d').exists())
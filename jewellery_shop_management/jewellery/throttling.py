@@ -0,0 +1,63 @@
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 60 * 60 * 24}
+
+
+def parse_rate(rate):
+    try:
+        limit, period = rate.split('/')
+        return int(limit), PERIODS[period[-1]] * int(period[:-1] or 1)
+    except (ValueError, KeyError):
+        raise ImproperlyConfigured(f"Invalid throttle rate {rate!r}, expected e.g. '5/m' or '10/15m'")
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR', '')
+
+
+class Throttle:
+    """Fixed-window counter kept in the cache: one key and no SQL per decision.
+
+    Each period gets its own counter, created with ``add()`` and bumped with
+    ``incr()``, both atomic on Redis and memcached, so concurrent workers
+    cannot overwrite each other's hits. Denied hits only raise the count of
+    the current window, they never push the next window further away.
+    """
+
+    timer = staticmethod(time.time)
+
+    def __init__(self, scope, rate=None):
+        self.scope = scope
+        self.rate = rate
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'THROTTLE_CACHE', 'default')]
+
+    def get_rate(self):
+        return parse_rate(self.rate or settings.THROTTLE_RATES[self.scope])
+
+    def key(self, ident, window):
+        return f"jewellery:throttle:{self.scope}:{ident}:{window}"
+
+    def allow(self, ident):
+        limit, period = self.get_rate()
+        now = self.timer()
+        window = int(now // period)
+        key = self.key(ident, window)
+        # the counter lives until its window ends
+        timeout = max(1, int((window + 1) * period - now))
+        self.cache.add(key, 0, timeout)
+        try:
+            return self.cache.incr(key) <= limit
+        except ValueError:
+            # the window ended between add() and incr(), this is the first hit of the next one
+            return limit >= 1
+
+    def reset(self, ident):
+        limit, period = self.get_rate()
+        self.cache.delete(self.key(ident, int(self.timer() // period)))
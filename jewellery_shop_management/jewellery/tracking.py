@@ -0,0 +1,46 @@
+class TrackedFieldsMixin:
+    """Remembers what ``tracked_fields`` held when loaded or last saved, so a save can tell what changed.
+
+    File fields compare by stored name; deferred fields are not tracked
+    and always count as changed.
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = instance.tracked_values()
+        return instance
+
+    def tracked_values(self):
+        values = {}
+        for name in self.tracked_fields:
+            attname = self._meta.get_field(name).attname
+            if attname in self.__dict__:
+                value = self.__dict__[attname]
+                # a FieldFile, or a freshly assigned File that was never stored
+                values[name] = (value.name, getattr(value, '_committed', False)) if hasattr(value, 'name') else (value, True)
+        return values
+
+    def loaded_value(self, name):
+        """The value of a tracked field as last read from or written to the database, None when unknown."""
+        loaded = getattr(self, '_loaded_values', {}).get(name)
+        return loaded[0] if loaded else None
+
+    def changed_fields(self):
+        if self._state.adding:
+            return set(self.tracked_fields)
+        loaded, current = getattr(self, '_loaded_values', {}), self.tracked_values()
+        return {name for name in self.tracked_fields if name not in loaded or loaded.get(name) != current.get(name)}
+
+    def has_changed(self, name):
+        return name in self.changed_fields()
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        saved = self.tracked_values()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            updated = {self._meta.get_field(name).name for name in update_fields}
+            saved = {name: value for name, value in saved.items() if name in updated}
+        self._loaded_values = {**getattr(self, '_loaded_values', {}), **saved}
@@ -1,10 +1,16 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, async_views, metrics
+from . page_cache import anonymous_page_cache, product_detail_tags, NAV_TAG, PRODUCT_LIST_TAG
+
+# the async views need an ASGI server to pay off, under WSGI each request would run its own event loop
+pages = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
-    path('', views.index, name='index'),
-    path('products/', views.ProductListView.as_view(), name='products'),
-    path('product/<int:pk>/', views.ProductDetailView.as_view(), name='product'),
-    path('my_orders/', views.OrderListView.as_view(), name='user_orders'),
-    path('order/<int:pk>/', views.OrderDetailView.as_view(), name='order'),
-]
\ No newline at end of file
+    path('', anonymous_page_cache(pages.index, 'index', (NAV_TAG,)), name='index'),
+    path('products/', anonymous_page_cache(pages.ProductListView.as_view(), 'products', (NAV_TAG, PRODUCT_LIST_TAG)), name='products'),
+    path('product/<int:pk>/', anonymous_page_cache(pages.ProductDetailView.as_view(), 'product', product_detail_tags), name='product'),
+    path('my_orders/', pages.OrderListView.as_view(), name='user_orders'),
+    path('order/<int:pk>/', pages.OrderDetailView.as_view(), name='order'),
+    path('metrics/', metrics.metrics_view, name='metrics'),
+]
@@ -1,95 +1,154 @@
 from django.shortcuts import render, get_object_or_404
-from . models import Product, Category, Order
+from . models import Product, Category, Order, OrderLine
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.views import redirect_to_login
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.views.generic.edit import FormMixin
 from django.urls import reverse, reverse_lazy
 from django.utils.translation import gettext_lazy as _
-from django.db.models import Q
 from . forms import ProductReviewForm
+from . throttling import Throttle
+from . search import get_search_backend
+from . pagination import KeysetPaginationMixin, KeysetPaginator
+from . caching import get_version, get_versions
+from . conditional import ConditionalGetMixin
+from . page_cache import NAV_TAG, PRODUCT_LIST_TAG, product_page_tag
+from . reviews import reviews_cache_tag, REVIEWS_CACHE_TIMEOUT
+from django.utils.functional import SimpleLazyObject
+from . imaging import attach_renditions
+from urllib.parse import urlencode
 from django.contrib import messages
-from django.views.generic.base import ContextMixin
+from django.db.models import Prefetch, Max, Count
+from datetime import date
 from django.utils.timezone import datetime, timedelta
 
 
-def index(request):
-    return render(request, 'jewellery/index.html', {"categories": Category.objects.all()})
+review_throttle = Throttle('review')
 
 
-class CategoriesMixin(ContextMixin):
+def index(request):
+    return render(request, 'jewellery/index.html')
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context["categories"] = Category.objects.all()
-        return context
-    
 
-class ProductListView(ListView, CategoriesMixin):
+class ProductListView(ConditionalGetMixin, KeysetPaginationMixin, ListView):
     model = Product
     template_name = 'jewellery/product_list.html'
     paginate_by = 21
+    ordering = ('id',)
+    keyset_pagination = True
+    keyset_filters = ('search', 'category_id')
+
+    def get_keyset_ordering(self):
+        if self.get_filters().get('search'):
+            return ('search_rank', 'id')
+        return self.keyset_ordering
+
+    def get_validators(self):
+        # a max(updated_at) over a search would cost as much as the page, the list tag moves with every product change
+        return tuple(get_versions(NAV_TAG, PRODUCT_LIST_TAG).values()), None
 
     def get_queryset(self):
         queryset = super().get_queryset()
-        search = self.request.GET.get('search')
+        filters = self.get_filters()
+        search = filters.get('search')
         if search:
-            queryset = queryset.filter(Q(name__icontains=search))
-        category_id = self.request.GET.get('category_id')
+            queryset = get_search_backend().search(queryset, search).order_by('search_rank', 'id')
+        category_id = filters.get('category_id')
         if category_id:
             queryset = queryset.filter(category__id=category_id)
         return queryset
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        category_id = self.request.GET.get('category_id')
+        filters = self.get_filters()
+        context['search'] = filters.get('search', '')
+        context['filter_query'] = urlencode(filters)
+        attach_renditions(context['product_list'], 'image')
+        category_id = filters.get('category_id')
         if category_id:
             context['category'] = get_object_or_404(Category, id=category_id)
         return context
 
 
-class ProductDetailView(FormMixin, DetailView, CategoriesMixin):
+class ProductDetailView(ConditionalGetMixin, FormMixin, DetailView):
     model = Product
     template_name = 'jewellery/product_detail.html'
     form_class = ProductReviewForm
+    reviews_per_page = 10
 
     def get_success_url(self):
-        return reverse('product', kwargs={'pk': self.get_object().id})
+        return reverse('product', kwargs={'pk': self.object.id})
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        reviews = self.object.reviews.select_related('customer__profile')
+        paginator = KeysetPaginator(reviews, ('-created_at', '-id'), self.reviews_per_page)
+        cursor = self.request.GET.get('reviews')
+        # evaluated only when the cached review block has to be rendered again
+        context['review_page'] = SimpleLazyObject(lambda: paginator.page(cursor))
+        context['reviews_cursor'] = cursor or ''
+        context['reviews_version'] = self.get_reviews_version()
+        context['reviews_cache_timeout'] = REVIEWS_CACHE_TIMEOUT
+        return context
+
+    def get_validators(self):
+        pk = self.kwargs['pk']
+        row = Product.objects.filter(pk=pk) \
+            .annotate(reviews_at=Max('reviews__created_at'), review_count=Count('reviews')) \
+            .values_list('updated_at', 'reviews_at', 'review_count').first()
+        if row is None:
+            return None, None
+        # the tags cover the navigation, jewellery type and renditions shown alongside
+        versions = get_versions(NAV_TAG, product_page_tag(pk), reviews_cache_tag(pk))
+        return (*row, *versions.values()), max(value for value in row[:2] if value)
+
+    def get_reviews_version(self):
+        return get_version(reviews_cache_tag(self.object.pk))
 
     def post(self, *args, **kwargs):
+        if not self.request.user.is_authenticated:
+            return redirect_to_login(self.request.get_full_path())
         self.object = self.get_object()
         form = self.get_form()
-        if form.is_valid():
-            return self.form_valid(form)
-        else:
+        if not form.is_valid():
+            return self.form_invalid(form)
+        # keyed on the signed-in user, so a posted form cannot spend someone else's allowance
+        if not review_throttle.allow(self.request.user.pk):
             messages.error(self.request, _("You're posting too much!"))
             return self.form_invalid(form)
+        return self.form_valid(form)
 
     def get_initial(self):
-        return {
-            'product': self.get_object(), 
-            'customer': self.request.user
-        }
+        return {'product': self.object}
 
     def form_valid(self, form):
-        form.instance.product = self.get_object()
+        form.instance.product = self.object
         form.instance.customer = self.request.user
         form.save()
         messages.success(self.request, _("Your review has been posted."))
         return super().form_valid(form)
 
 
-class OrderListView(LoginRequiredMixin, ListView, CategoriesMixin):
+class OrderListView(LoginRequiredMixin, ConditionalGetMixin, ListView):
     model = Order
     template_name = 'jewellery/order_list.html'
 
     def get_queryset(self):
         queryset = super().get_queryset()
         if hasattr(self.request.user, 'customer'):
-            queryset = queryset.filter(customer=self.request.user.customer).order_by('date')
+            queryset = queryset.filter(customer=self.request.user.customer).with_overdue().order_by('date')
         else:
             queryset = None
         return queryset
 
+    def get_validators(self):
+        user = self.request.user
+        latest = Order.objects.filter(customer__user_id=user.pk).aggregate(updated_at=Max('updated_at'), count=Count('id'))
+        photo = user.profile.photo.name if hasattr(user, 'profile') else None
+        # the overdue flags change at midnight without any write
+        parts = (latest['updated_at'], latest['count'], photo, date.today(), get_version(NAV_TAG))
+        return parts, latest['updated_at']
+
     # def get_context_data(self, **kwargs):
     #     context = super().get_context_data(**kwargs)
     #     status = self.request.GET.get('status')
@@ -98,10 +157,24 @@ class OrderListView(LoginRequiredMixin, ListView, CategoriesMixin):
     #     return context
 
 
-class OrderDetailView(LoginRequiredMixin, DetailView, CategoriesMixin):
+class OrderDetailView(LoginRequiredMixin, ConditionalGetMixin, DetailView):
     model = Order
     template_name = 'jewellery/order_detail.html'
 
+    def get_queryset(self):
+        lines = OrderLine.objects.select_related('product__jewellery_type').prefetch_related('metal_type', 'pearl').order_by('id')
+        return super().get_queryset().prefetch_related(Prefetch('order_lines', queryset=lines))
+
+    def get_validators(self):
+        row = self.get_queryset().prefetch_related(None).filter(pk=self.kwargs['pk']).annotate(
+            lines_at=Max('order_lines__updated_at'),
+            products_at=Max('order_lines__product__updated_at'),
+            line_count=Count('order_lines'),
+        ).values_list('updated_at', 'lines_at', 'products_at', 'line_count').first()
+        if row is None:
+            return None, None
+        return (*row, get_version(NAV_TAG)), max(value for value in row[:3] if value)
+
     def get_success_url(self):
         return reverse('order', kwargs={'pk': self.get_object().id})
 
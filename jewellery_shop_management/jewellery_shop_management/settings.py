@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 from . import local_settings
 from django.utils.translation import gettext_lazy as _
@@ -45,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'jewellery.middleware.StaticFilesMiddleware',
+    'jewellery.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -68,6 +71,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'jewellery.context_processors.categories',
             ],
         },
     },
@@ -75,17 +79,117 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'jewellery_shop_management.wsgi.application'
 
+# Route the catalogue and order pages to jewellery.async_views; opt-in, set DJANGO_ASYNC_VIEWS=1 for ASGI deployments
+ASYNC_VIEWS = os.environ.get('DJANGO_ASYNC_VIEWS', '') == '1'
+
 
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# The profile is picked with DJANGO_DB_PROFILE: "sqlite" (default) or "postgresql".
+
+DATABASE_PROFILE = os.environ.get('DJANGO_DB_PROFILE', 'sqlite')
+
+if DATABASE_PROFILE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DJANGO_DB_NAME', 'jewellery'),
+            'USER': os.environ.get('DJANGO_DB_USER', ''),
+            'PASSWORD': os.environ.get('DJANGO_DB_PASSWORD', ''),
+            'HOST': os.environ.get('DJANGO_DB_HOST', ''),
+            'PORT': os.environ.get('DJANGO_DB_PORT', ''),
+            # persistent connections, checked before reuse so a restarted server does not fail a request
+            'CONN_MAX_AGE': int(os.environ.get('DJANGO_DB_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            # set behind PgBouncer in transaction pooling mode, which cannot keep server-side cursors open
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DJANGO_DB_PGBOUNCER', '') == '1',
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            # django.db.backends.sqlite3 plus the transaction_mode option
+            'ENGINE': 'jewellery.sqlite3',
+            'NAME': os.environ.get('DJANGO_DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': int(os.environ.get('DJANGO_DB_CONN_MAX_AGE', 600)),
+            'OPTIONS': {
+                'timeout': 20,
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
+    }
+
+# Applied to every new SQLite connection by jewellery.signals.configure_sqlite_connection.
+# WAL lets readers carry on while a writer commits; mmap_size is in bytes, a negative cache_size in KiB.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 20000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,
+    'temp_store': 'memory',
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+# The page, navigation and throttle caches must be shared by every worker, or a write only
+# invalidates the worker that made it and the limits multiply by the number of workers.
+# Set DJANGO_REDIS_URL (pip install redis) or DJANGO_MEMCACHED_LOCATION (pip install pymemcache)
+# in production; without either the cache is per process, fine for runserver and one-worker
+# setups, and "manage.py check --deploy" warns about it.
+
+REDIS_URL = os.environ.get('DJANGO_REDIS_URL')
+MEMCACHED_LOCATION = os.environ.get('DJANGO_MEMCACHED_LOCATION')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'jewellery',
+        }
+    }
+elif MEMCACHED_LOCATION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': MEMCACHED_LOCATION.split(','),
+            'KEY_PREFIX': 'jewellery',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'jewellery',
+            'OPTIONS': {
+                # whole pages are cached per language and query string
+                'MAX_ENTRIES': 5000,
+            },
+        }
     }
+
+PAGE_CACHE_TIMEOUT = 60 * 60
+
+# shared like the pages when Redis or memcached is configured, so the rates hold across workers and restarts
+THROTTLE_CACHE = 'default'
+
+THROTTLE_RATES = {
+    'review': '1/d',
+    'register': '5/h',
+    'login_ip': '20/m',
+    'login_username': '5/m',
 }
 
+# Per-process snapshots merged by /metrics/; the directory must be shared by all workers of a host
+METRICS_DIR = None
+METRICS_SLOW_REQUEST_MS = 1000
+# Scrapers send "Authorization: Bearer <token>"; without a token only localhost and staff may read /metrics/
+METRICS_TOKEN = None
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -128,8 +232,16 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR.joinpath('static/')
+# hashed names plus gzip (and brotli, when installed) variants, served by jewellery.middleware.StaticFilesMiddleware
+STATICFILES_STORAGE = 'jewellery.staticfiles.CompressedManifestStaticFilesStorage'
+STATIC_MAX_AGE = 60
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR.joinpath('media/')
+MEDIA_MAX_AGE = 60 * 60 * 24
+# 'X-Sendfile' (Apache, lighttpd) or 'X-Accel-Redirect' (nginx) hands file bodies to the front proxy
+MEDIA_SENDFILE_HEADER = os.environ.get('DJANGO_MEDIA_SENDFILE_HEADER') or None
+# nginx: location /protected-media/ { internal; alias <MEDIA_ROOT>/; }
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
@@ -1,9 +1,10 @@
 from django.db import models
 from django.contrib.auth import get_user_model
-from PIL import Image
+from jewellery.models import ImageJob
+from jewellery.tracking import TrackedFieldsMixin
 from django.utils.translation import gettext_lazy as _
 
-class Profile(models.Model):
+class Profile(TrackedFieldsMixin, models.Model):
     user = models.OneToOneField(
         get_user_model(), 
         verbose_name=_("user"), 
@@ -12,14 +13,13 @@ class Profile(models.Model):
     )
     photo = models.ImageField(_("photo"), upload_to='user_profile/photos', null=True, blank=True)
 
+    tracked_fields = ('photo',)
+
     def __str__(self) -> str:
         return f"{self.user} profile"
 
     def save(self, *args, **kwargs):
+        photo_changed = self.has_changed('photo')
         super().save(*args, **kwargs)
-        if self.photo:
-            photo = Image.open(self.photo.path)
-            if photo.width > 500 or photo.height > 500:
-                output_size = (500, 500)
-                photo.thumbnail(output_size)
-                photo.save(self.photo.path)
\ No newline at end of file
+        if self.photo and photo_changed:
+            ImageJob.enqueue(self, 'photo')
@@ -11,5 +11,10 @@ def create_profile(sender, instance, created, **kwargs):
 
 
 @receiver(post_save, sender=get_user_model())
-def save_profile(sender, instance, **kwargs):
-    instance.profile.save()
\ No newline at end of file
+def save_profile(sender, instance, created, update_fields=None, **kwargs):
+    # a profile that was never loaded cannot hold unsaved changes, and a login only stamps last_login
+    if created or not sender.profile.is_cached(instance) or update_fields == frozenset({'last_login'}):
+        return
+    changed = instance.profile.changed_fields()
+    if changed:
+        instance.profile.save(update_fields=changed)
\ No newline at end of file
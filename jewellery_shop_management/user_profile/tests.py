@@ -1,3 +1,71 @@
+import time
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from jewellery.throttling import Throttle
 
-# Create your tests here.
+
+class ThrottlingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        # the whole test inside one throttle window
+        clock = mock.patch.object(Throttle, 'timer', mock.Mock(return_value=time.time()))
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def test_login_is_throttled_per_username_without_sql(self):
+        get_user_model().objects.create_user('milda', 'milda@example.com', 'correct horse')
+        for attempt in range(5):
+            response = self.client.post(reverse('login'), {'username': 'milda', 'password': 'wrong'})
+            self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.post(reverse('login'), {'username': 'Milda', 'password': 'correct horse'})
+        self.assertEqual(response.status_code, 429)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_registration_is_throttled_per_address(self):
+        for number in range(5):
+            self.client.post(reverse('register'), {
+                'username': f"user{number}", 'email': f"user{number}@example.com",
+                'password': 'secret-pass', 'password2': 'secret-pass',
+            })
+        response = self.client.post(reverse('register'), {
+            'username': 'user5', 'email': 'user5@example.com', 'password': 'secret-pass', 'password2': 'secret-pass',
+        })
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(get_user_model().objects.count(), 5)
+
+
+class ProfileSaveTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user('milda', 'milda@example.com', 'correct horse')
+
+    def profile_queries(self, action):
+        with CaptureQueriesContext(connection) as context:
+            action()
+        return [query['sql'] for query in context.captured_queries if 'user_profile_profile' in query['sql'] or 'jewellery_imagejob' in query['sql']]
+
+    def test_login_leaves_the_profile_alone(self):
+        login = lambda: self.client.post(reverse('login'), {'username': 'milda', 'password': 'correct horse'})
+        self.assertEqual(self.profile_queries(login), [])
+        self.assertIn('_auth_user_id', self.client.session)
+
+    def test_user_save_writes_only_a_changed_profile(self):
+        user = get_user_model().objects.get()
+        user.profile
+        user.first_name = 'Milda'
+        self.assertEqual(self.profile_queries(user.save), [])
+        user.profile.photo = 'user_profile/photos/milda.jpg'
+        queries = self.profile_queries(user.save)
+        self.assertTrue(any(sql.startswith('UPDATE "user_profile_profile"') for sql in queries))
+        self.assertTrue(any('jewellery_imagejob' in sql for sql in queries))
+        # an explicit save still writes, but the unchanged photo is not queued again
+        self.assertFalse(any('jewellery_imagejob' in sql for sql in self.profile_queries(user.profile.save)))
+        self.assertEqual(get_user_model().objects.get().profile.photo.name, 'user_profile/photos/milda.jpg')
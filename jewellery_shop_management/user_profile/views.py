@@ -4,15 +4,37 @@ from django.views.decorators.csrf import csrf_protect
 from django.contrib import messages
 from django.core.validators import validate_email
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import LoginView
 from . forms import UserUpdateForm, ProfileUpdateForm
 from django.utils.translation import gettext_lazy as _
-from jewellery.models import Category
+from jewellery.throttling import Throttle, client_ip
 
 User = get_user_model()
 
+register_throttle = Throttle('register')
+login_ip_throttle = Throttle('login_ip')
+login_username_throttle = Throttle('login_username')
+
+
+class ThrottledLoginView(LoginView):
+
+    def post(self, request, *args, **kwargs):
+        username = request.POST.get('username', '').strip().lower()
+        allowed = login_ip_throttle.allow(client_ip(request))
+        if username:
+            allowed = login_username_throttle.allow(username) and allowed
+        if not allowed:
+            messages.error(request, _('Too many login attempts. Please try again later.'))
+            return self.render_to_response(self.get_context_data(form=self.get_form_class()(request)), status=429)
+        return super().post(request, *args, **kwargs)
+
+
 @csrf_protect
 def register(request):
     if request.method == "POST":
+        if not register_throttle.allow(client_ip(request)):
+            messages.error(request, _('Too many registrations. Please try again later.'))
+            return render(request, 'user_profile/register.html', status=429)
         username = request.POST.get('username')
         email = request.POST.get('email')
         password = request.POST.get('password')
@@ -37,11 +59,11 @@ def register(request):
             new_user = User.objects.create_user(username=username, email=email, password=password)
             messages.success(request, _('Your registration was successful. You can log in now.'))
             return redirect('login')
-    return render(request, 'user_profile/register.html', {"categories": Category.objects.all()})
+    return render(request, 'user_profile/register.html')
 
 @login_required
 def profile(request):
-    return render(request, 'user_profile/profile.html', {"categories": Category.objects.all()})
+    return render(request, 'user_profile/profile.html')
 
 
 @login_required
@@ -61,6 +83,5 @@ def update_profile(request):
     return render(request, 'user_profile/update_profile.html', {
         'user_form': user_form,
         'profile_form': profile_form,
-        "categories": Category.objects.all(),
     })
 